@@ -1,13 +1,16 @@
 # app.py
 from fastapi import FastAPI, File, UploadFile, Form, Request
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import uuid, os, shutil, tempfile
 
 # Helpers (implementaremos en helpers/*.py)
 from helpers.gcs import upload_to_gcs  # debe devolver URL pública firmada
 from helpers.sheets import add_row_to_sheets, mark_order_paid_in_sheets
 from helpers.mercadopago import create_mercadopago_preference, verify_mp_payment
-from helpers.queue import enqueue_generate_and_deliver
+from helpers.queue import enqueue_generate_and_deliver, start_background_workers
+from helpers.metrics import metrics_payload
+from helpers.audio_meta import probe_duration
+from helpers import progress, speculative, tracing
 
 app = FastAPI()
 
@@ -15,10 +18,30 @@ app = FastAPI()
 from fastapi import Request
 from fastapi.responses import HTMLResponse
 
+@app.on_event("startup")
+async def startup():
+    # Sin Redis y con LOCAL_QUEUE_IN_WEB=1: el pool de la cola local corre dentro del web y retoma jobs
+    # pendientes (si no, los consume `python worker.py`)
+    start_background_workers()
+
 @app.get("/", response_class=HTMLResponse)
 async def index():
     return "<h2>RedaXion — servicio activo</h2>"
 
+@app.get("/metrics")
+async def metrics():
+    # Prometheus scrape (las métricas de los workers RQ llegan vía Pushgateway)
+    body, content_type = metrics_payload()
+    return Response(content=body, media_type=content_type)
+
+@app.get("/orders/{order_id}/status")
+async def order_status(order_id: str):
+    # Lee solo el registro de progreso (Redis / memoria): no gasta cuota de Google Sheets
+    rec = progress.get(order_id)
+    if rec is None:
+        return JSONResponse({"order_id": order_id, "state": "unknown"}, status_code=404)
+    return JSONResponse(rec)
+
 # Maneja la redirección que hace Mercado Pago (GET)
 @app.get("/mp-webhook", response_class=HTMLResponse)
 async def mp_webhook_get(request: Request):
@@ -43,9 +66,20 @@ async def create_order(
     email: str = Form(...),
     columnas: str = Form(...),
     color: str = Form(...),
-    audio: UploadFile = File(...)
+    audio: UploadFile = File(...),
+    prioridad: str = Form("standard"),
 ):
     order_id = str(uuid.uuid4())[:10]
+    prioridad = "express" if prioridad == "express" else "standard"
+    if prioridad == "express" and not os.getenv("EXPRESS_PRICE_CLP"):
+        # sin precio express configurado no se vende express al precio standard: la orden va como standard
+        print(f"[ORDER] EXPRESS_PRICE_CLP no configurado: orden {order_id} pasa de express a standard")
+        prioridad = "standard"
+    with tracing.span("create_order", order_id=order_id, prioridad=prioridad):
+        return await _create_order(order_id, name, email, columnas, color, audio, prioridad)
+
+async def _create_order(order_id: str, name: str, email: str, columnas: str, color: str, audio: UploadFile,
+                        prioridad: str):
     tmp_dir = tempfile.mkdtemp()
     filename = f"{order_id}_{audio.filename}"
     tmp_path = os.path.join(tmp_dir, filename)
@@ -54,6 +88,9 @@ async def create_order(
     with open(tmp_path, "wb") as f:
         f.write(await audio.read())
 
+    # Duración desde la cabecera del archivo: la usa el scheduler SJF de la cola standard
+    duracion = probe_duration(tmp_path)
+
     # Subir a GCS (helper) -> debe devolver URL pública (signed url)
     public_url = upload_to_gcs(tmp_path, filename)
 
@@ -66,14 +103,24 @@ async def create_order(
         "audio_url": public_url,
         "columnas": columnas,
         "color": color,
+        "prioridad": prioridad,
+        "duracion_seg": duracion if duracion is not None else "",
         "estado": "Pendiente"
     }
     add_row_to_sheets(row)
+    progress.set_stage(order_id, "payment", state="pending_payment", duration=duracion)
+
+    # Opt-in: transcribir mientras el cliente paga (se descarta si no paga dentro de la ventana)
+    speculative.start(order_id, public_url)
 
     # Crear preferencia Mercado Pago y devolver init_point
     amount = int(os.getenv("DEFAULT_PRICE_CLP", "4000"))  # configurable en env
+    if prioridad == "express":
+        amount = int(os.environ["EXPRESS_PRICE_CLP"])
     callback_url = os.getenv("MP_WEBHOOK_URL", "")  # debe apuntar a /mp-webhook pública
-    pref = create_mercadopago_preference(order_id, amount, callback_url)
+    # prioridad y duración vuelven en payment.metadata y deciden la cola en el webhook
+    pref = create_mercadopago_preference(order_id, amount, callback_url,
+                                         metadata={"prioridad": prioridad, "duracion_seg": duracion})
 
     # limpiar tmp
     try:
@@ -81,7 +128,7 @@ async def create_order(
     except Exception:
         pass
 
-    return JSONResponse({"order_id": order_id, "init_point": pref.get("init_point")})
+    return JSONResponse({"order_id": order_id, "init_point": pref.get("init_point"), "prioridad": prioridad})
 
 @app.post("/mp-webhook")
 async def mp_webhook(req: Request):
@@ -109,8 +156,13 @@ async def mp_webhook(req: Request):
     status = payment.get("status")
     external_ref = payment.get("external_reference")  # debe ser order_id
     if status == "approved" and external_ref:
-        mark_order_paid_in_sheets(external_ref, payment_id)
-        enqueue_generate_and_deliver(external_ref)
+        # el span del webhook es el padre del trace que continúa en el worker (trace_context en el job)
+        with tracing.span("mp_webhook.approved", order_id=external_ref, payment_id=payment_id):
+            mark_order_paid_in_sheets(external_ref, payment_id)
+            speculative.confirm(external_ref)
+            metadata = payment.get("metadata") or {}
+            prioridad = metadata.get("prioridad") or "standard"
+            enqueue_generate_and_deliver(external_ref, priority=prioridad, duration=metadata.get("duracion_seg"))
         return JSONResponse({"ok": True, "processed": True})
 
     return JSONResponse({"ok": True, "processed": False, "status": status})
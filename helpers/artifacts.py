@@ -0,0 +1,76 @@
+# helpers/artifacts.py
+"""
+Entregables de una orden (txt, DOCX, PDF) como buffers en memoria.
+
+Los renderers escriben a un BytesIO (formatter_docx / formatter_pdf aceptan una ruta o un archivo
+binario abierto) y el Artifact resultante se comparte tal cual entre consumidores:
+- correo, subida a Drive y checkpoints usan los bytes directamente (sin leer del disco);
+- los que solo saben trabajar con rutas (conversión DOCX -> PDF con LibreOffice) llaman a path(), que
+  escribe el archivo una única vez en el directorio de la orden y devuelve siempre la misma ruta.
+"""
+import io
+import os
+import logging
+import tempfile
+import threading
+from typing import Callable, Optional
+
+logger = logging.getLogger("artifacts")
+logger.setLevel(logging.INFO)
+
+
+class Artifact:
+    def __init__(self, filename: str, data: bytes, spool_dir: Optional[str] = None):
+        self.filename = filename
+        self.data = data
+        self.spool_dir = spool_dir
+        self._path: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return len(self.data)
+
+    def view(self) -> memoryview:
+        return memoryview(self.data)
+
+    def open(self) -> io.BytesIO:
+        """
+        Lectura tipo archivo (para clientes que esperan un file object).
+        """
+        return io.BytesIO(self.data)
+
+    def path(self) -> str:
+        """
+        Ruta en disco, escrita la primera vez que alguien la pide.
+        """
+        with self._lock:
+            if self._path is None or not os.path.exists(self._path):
+                path = os.path.join(self.spool_dir or tempfile.gettempdir(), self.filename)
+                with open(path, "wb") as fh:
+                    fh.write(self.data)
+                self._path = path
+                logger.info("Artifact %s materializado en disco (%s KB)", self.filename, self.size // 1024)
+            return self._path
+
+    def __repr__(self) -> str:
+        return f"{self.filename} ({self.size // 1024} KB en memoria)"
+
+
+def render(filename: str, render_fn: Callable[[io.BytesIO], object], spool_dir: Optional[str] = None) -> Artifact:
+    """
+    render_fn(buffer) escribe el documento en el buffer; devuelve el Artifact con esos bytes.
+    """
+    buf = io.BytesIO()
+    render_fn(buf)
+    return Artifact(filename, buf.getvalue(), spool_dir)
+
+
+def from_path(path: str, filename: Optional[str] = None, spool_dir: Optional[str] = None) -> Artifact:
+    """
+    Para salidas que solo existen como archivo (conversión con LibreOffice): una lectura y queda en memoria.
+    """
+    with open(path, "rb") as fh:
+        art = Artifact(filename or os.path.basename(path), fh.read(), spool_dir)
+    art._path = path
+    return art
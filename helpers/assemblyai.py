@@ -5,6 +5,9 @@ import logging
 import requests
 from requests.adapters import HTTPAdapter, Retry
 
+from helpers import deadline
+from helpers.metrics import external_call
+
 logger = logging.getLogger("assemblyai")
 logger.setLevel(logging.INFO)
 
@@ -20,13 +23,16 @@ session.mount("https://", HTTPAdapter(max_retries=retries))
 def _upload_file_local(path):
     logger.info("Uploading local file to AssemblyAI: %s", path)
     upload_url = f"{BASE}/upload"
-    with open(path, "rb") as f:
-        resp = session.post(upload_url, headers=HEADERS, data=f, timeout=120)
-    resp.raise_for_status()
+    with open(path, "rb") as f, external_call("assemblyai", "upload"):
+        resp = session.post(upload_url, headers=HEADERS, data=f, timeout=deadline.timeout(120, "assemblyai.upload"))
+        resp.raise_for_status()
     return resp.json().get("upload_url")
 
 
-def transcribir_audio(audio_source, order_id=None, poll_interval=5, timeout=600):
+def crear_transcripcion(audio_source) -> str:
+    """
+    Sube el audio si es local, crea el transcript y devuelve su id sin esperar el resultado.
+    """
     if not ASSEMBLYAI_API_KEY:
         raise RuntimeError("ASSEMBLYAI_API_KEY not configured")
 
@@ -36,14 +42,28 @@ def transcribir_audio(audio_source, order_id=None, poll_interval=5, timeout=600)
         audio_url = audio_source
 
     payload = {"audio_url": audio_url}
-    resp = session.post(f"{BASE}/transcript", headers={**HEADERS, "content-type": "application/json"}, json=payload, timeout=30)
-    resp.raise_for_status()
-    tid = resp.json()["id"]
+    with external_call("assemblyai", "create_transcript"):
+        resp = session.post(f"{BASE}/transcript", headers={**HEADERS, "content-type": "application/json"}, json=payload,
+                            timeout=deadline.timeout(30, "assemblyai.create_transcript"))
+        resp.raise_for_status()
+    return resp.json()["id"]
+
+
+def esperar_transcripcion(tid, order_id=None, poll_interval=5, timeout=600):
+    """
+    Espera (polling) un transcript ya creado; sirve para retomar uno lanzado por otro proceso
+    (p. ej. la transcripción especulativa de helpers/speculative.py).
+    """
+    if not ASSEMBLYAI_API_KEY:
+        raise RuntimeError("ASSEMBLYAI_API_KEY not configured")
+    # el polling no puede pasarse del plazo de la orden (DeadlineExceeded si se agota)
+    timeout = deadline.timeout(timeout, "transcription")
 
     start = time.time()
     while True:
-        r = session.get(f"{BASE}/transcript/{tid}", headers=HEADERS, timeout=30)
-        r.raise_for_status()
+        with external_call("assemblyai", "poll_transcript"):
+            r = session.get(f"{BASE}/transcript/{tid}", headers=HEADERS, timeout=deadline.timeout(30, "transcription"))
+            r.raise_for_status()
         j = r.json()
         status = j.get("status")
         if status == "completed":
@@ -58,9 +78,32 @@ def transcribir_audio(audio_source, order_id=None, poll_interval=5, timeout=600)
             return {"transcript_id": tid, "text": text, "raw": j}
         if status in ("queued", "processing"):
             if time.time() - start > timeout:
+                deadline.check("transcription")
                 raise TimeoutError(f"Transcription timed out after {timeout}s (status={status})")
-            time.sleep(poll_interval)
+            time.sleep(min(poll_interval, max(0.0, timeout - (time.time() - start))))
             continue
         if status == "error":
             raise RuntimeError(f"AssemblyAI error: {j.get('error')}")
         time.sleep(poll_interval)
+
+
+def cancelar_transcripcion(tid):
+    """
+    Borra el transcript en AssemblyAI (cancela el trabajo y descarta el texto). No levanta excepción.
+    """
+    if not ASSEMBLYAI_API_KEY:
+        return False
+    try:
+        with external_call("assemblyai", "delete_transcript"):
+            r = session.delete(f"{BASE}/transcript/{tid}", headers=HEADERS, timeout=30)
+            r.raise_for_status()
+        logger.info("Transcript %s cancelado/borrado en AssemblyAI", tid)
+        return True
+    except Exception:
+        logger.exception("No se pudo cancelar el transcript %s", tid)
+        return False
+
+
+def transcribir_audio(audio_source, order_id=None, poll_interval=5, timeout=600):
+    tid = crear_transcripcion(audio_source)
+    return esperar_transcripcion(tid, order_id=order_id, poll_interval=poll_interval, timeout=timeout)
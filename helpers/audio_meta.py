@@ -0,0 +1,225 @@
+# helpers/audio_meta.py
+"""
+Duración de un audio leyendo solo las cabeceras del contenedor (sin decodificar el archivo).
+
+Se usa en create_order para estimar el tamaño del trabajo (scheduler shortest-job-first
+de helpers/queue.py). Formatos soportados:
+- MP3: cabecera Xing/Info o VBRI (VBR); si no hay, bitrate constante × tamaño.
+- WAV: byte_rate del chunk fmt y tamaño del chunk data.
+- MP4/M4A: timescale y duration del box mvhd (aunque moov esté al final).
+- FLAC: STREAMINFO.
+- OGG (Vorbis/Opus): granule position de la última página.
+Cualquier otro formato (o un archivo corrupto) devuelve None y el scheduler usa la duración por defecto.
+"""
+import os
+import struct
+import logging
+from typing import Optional
+
+logger = logging.getLogger("audio_meta")
+logger.setLevel(logging.INFO)
+
+_TAIL_BYTES = 64 * 1024
+
+# MPEG: bitrates (kbps) de Layer III por versión; sample rates por versión
+_MP3_BITRATES = {
+    "1": (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "2": (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+_MP3_SAMPLE_RATES = {"1": (44100, 48000, 32000), "2": (22050, 24000, 16000), "2.5": (11025, 12000, 8000)}
+
+
+def probe_duration(path: str) -> Optional[float]:
+    """
+    Devuelve la duración en segundos, o None si el formato no se reconoce.
+    """
+    try:
+        size = os.path.getsize(path)
+        with open(path, "rb") as fh:
+            head = fh.read(12)
+            if head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+                duration = _wav_duration(fh, size)
+            elif head[4:8] == b"ftyp":
+                duration = _mp4_duration(fh, size)
+            elif head[:4] == b"fLaC":
+                duration = _flac_duration(fh)
+            elif head[:4] == b"OggS":
+                duration = _ogg_duration(fh, size)
+            else:
+                duration = _mp3_duration(fh, size)
+    except Exception:
+        logger.exception("No se pudo leer la duración de %s", path)
+        return None
+    if duration is None or duration <= 0:
+        logger.warning("Duración desconocida para %s", path)
+        return None
+    return round(duration, 1)
+
+
+# -----------------------
+# WAV
+# -----------------------
+def _wav_duration(fh, size: int) -> Optional[float]:
+    fh.seek(12)
+    byte_rate = None
+    while True:
+        header = fh.read(8)
+        if len(header) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack("<4sI", header)
+        if chunk_id == b"fmt ":
+            fmt = fh.read(chunk_size)
+            byte_rate = struct.unpack("<I", fmt[8:12])[0]
+            fh.seek(chunk_size % 2, os.SEEK_CUR)
+        elif chunk_id == b"data":
+            if not byte_rate:
+                return None
+            # grabadores en streaming dejan el tamaño en 0 / 0xFFFFFFFF
+            data_size = min(chunk_size, size - fh.tell()) if chunk_size else size - fh.tell()
+            return data_size / byte_rate
+        else:
+            fh.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+# -----------------------
+# MP4 / M4A
+# -----------------------
+def _iter_boxes(fh, start: int, end: int):
+    pos = start
+    while pos + 8 <= end:
+        fh.seek(pos)
+        box_size, box_type = struct.unpack(">I4s", fh.read(8))
+        header = 8
+        if box_size == 1:
+            box_size = struct.unpack(">Q", fh.read(8))[0]
+            header = 16
+        elif box_size == 0:
+            box_size = end - pos
+        if box_size < header:
+            return
+        yield box_type, pos + header, pos + box_size
+        pos += box_size
+
+
+def _mp4_duration(fh, size: int) -> Optional[float]:
+    for box_type, body, end in _iter_boxes(fh, 0, size):
+        if box_type != b"moov":
+            continue
+        for child, child_body, _ in _iter_boxes(fh, body, end):
+            if child != b"mvhd":
+                continue
+            fh.seek(child_body)
+            version = fh.read(4)[0]
+            if version == 1:
+                _, _, timescale, duration = struct.unpack(">QQIQ", fh.read(28))
+            else:
+                _, _, timescale, duration = struct.unpack(">IIII", fh.read(16))
+            return duration / timescale if timescale else None
+    return None
+
+
+# -----------------------
+# FLAC
+# -----------------------
+def _flac_duration(fh) -> Optional[float]:
+    fh.seek(4)
+    block_header = fh.read(4)
+    if len(block_header) < 4 or block_header[0] & 0x7F != 0:  # el primer bloque debe ser STREAMINFO
+        return None
+    info = fh.read(34)
+    packed = int.from_bytes(info[10:18], "big")
+    sample_rate = packed >> 44
+    total_samples = packed & ((1 << 36) - 1)
+    return total_samples / sample_rate if sample_rate and total_samples else None
+
+
+# -----------------------
+# OGG (Vorbis / Opus)
+# -----------------------
+def _ogg_duration(fh, size: int) -> Optional[float]:
+    fh.seek(0)
+    first_page = fh.read(512)
+    pre_skip = 0
+    if b"OpusHead" in first_page:
+        at = first_page.index(b"OpusHead")
+        pre_skip = struct.unpack("<H", first_page[at + 10:at + 12])[0]
+        sample_rate = 48000  # Opus siempre expresa el granule en 48 kHz
+    elif b"\x01vorbis" in first_page:
+        at = first_page.index(b"\x01vorbis")
+        sample_rate = struct.unpack("<I", first_page[at + 12:at + 16])[0]
+    else:
+        return None
+
+    fh.seek(max(0, size - _TAIL_BYTES))
+    tail = fh.read()
+    last = tail.rfind(b"OggS")
+    if last < 0 or last + 14 > len(tail):
+        return None
+    granule = struct.unpack("<q", tail[last + 6:last + 14])[0]
+    return (granule - pre_skip) / sample_rate if sample_rate and granule > 0 else None
+
+
+# -----------------------
+# MP3
+# -----------------------
+def _mp3_frame_header(data: bytes, at: int):
+    b1, b2, b3 = data[at + 1], data[at + 2], data[at + 3]
+    version = {3: "1", 2: "2", 0: "2.5"}.get((b1 >> 3) & 3)
+    layer = (b1 >> 1) & 3
+    bitrate_idx, rate_idx = b2 >> 4, (b2 >> 2) & 3
+    if version is None or layer != 1 or bitrate_idx in (0, 15) or rate_idx == 3:
+        return None  # solo Layer III con bitrate y sample rate válidos
+    return {
+        "version": version,
+        "bitrate": _MP3_BITRATES["1" if version == "1" else "2"][bitrate_idx] * 1000,
+        "sample_rate": _MP3_SAMPLE_RATES[version][rate_idx],
+        "mono": (b3 >> 6) == 3,
+        "samples": 1152 if version == "1" else 576,
+    }
+
+
+def _mp3_duration(fh, size: int) -> Optional[float]:
+    fh.seek(0)
+    audio_start = 0
+    id3 = fh.read(10)
+    if id3[:3] == b"ID3":
+        tag_size = (id3[6] << 21) | (id3[7] << 14) | (id3[8] << 7) | id3[9]
+        audio_start = 10 + tag_size + (10 if id3[5] & 0x10 else 0)
+
+    fh.seek(audio_start)
+    data = fh.read(_TAIL_BYTES)
+    frame, at = None, 0
+    while at + 4 <= len(data):
+        at = data.find(b"\xff", at)
+        if at < 0 or at + 4 > len(data):
+            return None
+        if data[at + 1] & 0xE0 == 0xE0:
+            frame = _mp3_frame_header(data, at)
+            if frame:
+                break
+        at += 1
+    if not frame:
+        return None
+
+    # VBR: número total de frames en la cabecera Xing/Info o VBRI del primer frame
+    if frame["version"] == "1":
+        side_info = 17 if frame["mono"] else 32
+    else:
+        side_info = 9 if frame["mono"] else 17
+    xing = at + 4 + side_info
+    if data[xing:xing + 4] in (b"Xing", b"Info"):
+        flags = struct.unpack(">I", data[xing + 4:xing + 8])[0]
+        if flags & 1:
+            frames = struct.unpack(">I", data[xing + 8:xing + 12])[0]
+            return frames * frame["samples"] / frame["sample_rate"]
+    vbri = at + 4 + 32
+    if data[vbri:vbri + 4] == b"VBRI":
+        frames = struct.unpack(">I", data[vbri + 14:vbri + 18])[0]
+        return frames * frame["samples"] / frame["sample_rate"]
+
+    # CBR: bytes de audio / bitrate (descontando el tag ID3v1 final si existe)
+    audio_bytes = size - audio_start - at
+    fh.seek(max(0, size - 128))
+    if fh.read(3) == b"TAG":
+        audio_bytes -= 128
+    return audio_bytes * 8 / frame["bitrate"]
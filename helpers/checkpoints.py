@@ -0,0 +1,206 @@
+# helpers/checkpoints.py
+"""
+Manifest durable por orden para que los reintentos retomen el trabajo en vez de reiniciarlo.
+
+Cada orden tiene un conjunto de entradas (clave -> bytes):
+- text:<nombre>      texto (transcripción, bloques procesados por el LLM)
+- artifact:<nombre>  documento renderizado (DOCX / PDF) en memoria
+- step:<nombre>      marca de etapa terminada (subidas a Drive, Sheets, correo) con info JSON
+
+Backends (en orden de preferencia):
+- Redis (REDIS_URL): un hash `checkpoint:{order_id}` con TTL.
+- GCS (GCS_BUCKET + GCS_CREDENTIALS_JSON): blobs bajo `checkpoints/{order_id}/`.
+- Sin ninguno: modo bypass (no se guarda nada, el flujo se comporta como antes).
+"""
+import os
+import json
+import time
+import logging
+from typing import Optional, List
+
+from helpers.redis_conn import REDIS_URL, get_redis
+
+logger = logging.getLogger("checkpoints")
+logger.setLevel(logging.INFO)
+
+GCS_BUCKET = os.getenv("GCS_BUCKET")
+CHECKPOINT_TTL = int(os.getenv("CHECKPOINT_TTL_SECONDS", str(7 * 24 * 3600)))
+GCS_PREFIX = "checkpoints"
+
+_redis = None
+_bucket = None
+_backend = None
+
+
+def _init_backend():
+    """
+    Elige el backend una sola vez (lazy) para no abrir conexiones en import-time.
+    """
+    global _redis, _bucket, _backend
+    if _backend is not None:
+        return _backend
+
+    if REDIS_URL:
+        _redis = get_redis()
+        if _redis is not None:
+            _backend = "redis"
+            return _backend
+        logger.warning("No se pudo inicializar Redis para checkpoints; probando GCS.")
+
+    if GCS_BUCKET and os.getenv("GCS_CREDENTIALS_JSON"):
+        try:
+            from helpers.gcs import _get_client
+            _bucket = _get_client().bucket(GCS_BUCKET)
+            _backend = "gcs"
+            return _backend
+        except Exception:
+            logger.exception("No se pudo inicializar GCS para checkpoints.")
+
+    logger.warning("Checkpoints en modo bypass (sin REDIS_URL ni GCS_BUCKET): los reintentos reinician la orden.")
+    _backend = "bypass"
+    return _backend
+
+
+def backend() -> str:
+    """
+    "redis" | "gcs" | "bypass". Con bypass los checkpoints no se comparten entre workers.
+    """
+    return _init_backend()
+
+
+def _redis_key(order_id: str) -> str:
+    return f"checkpoint:{order_id}"
+
+
+def _blob_name(order_id: str, key: str) -> str:
+    return f"{GCS_PREFIX}/{order_id}/{key}"
+
+
+def _put(order_id: str, key: str, data: bytes, ttl: Optional[int] = None) -> bool:
+    backend = _init_backend()
+    try:
+        if backend == "redis":
+            pipe = _redis.pipeline()
+            pipe.hset(_redis_key(order_id), key, data)
+            pipe.expire(_redis_key(order_id), ttl or CHECKPOINT_TTL)
+            pipe.execute()
+            return True
+        if backend == "gcs":
+            _bucket.blob(_blob_name(order_id, key)).upload_from_string(data)
+            return True
+    except Exception:
+        logger.exception("No se pudo guardar checkpoint %s de la orden %s (no crítico)", key, order_id)
+    return False
+
+
+def _get(order_id: str, key: str) -> Optional[bytes]:
+    backend = _init_backend()
+    try:
+        if backend == "redis":
+            return _redis.hget(_redis_key(order_id), key)
+        if backend == "gcs":
+            blob = _bucket.blob(_blob_name(order_id, key))
+            if not blob.exists():
+                return None
+            return blob.download_as_bytes()
+    except Exception:
+        logger.exception("No se pudo leer checkpoint %s de la orden %s (se recalcula)", key, order_id)
+    return None
+
+
+def manifest(order_id: str) -> List[str]:
+    """
+    Lista las claves guardadas para la orden (útil para debugging / soporte).
+    """
+    backend = _init_backend()
+    try:
+        if backend == "redis":
+            return sorted(k.decode() if isinstance(k, bytes) else k for k in _redis.hkeys(_redis_key(order_id)))
+        if backend == "gcs":
+            prefix = _blob_name(order_id, "")
+            return sorted(b.name[len(prefix):] for b in _bucket.list_blobs(prefix=prefix))
+    except Exception:
+        logger.exception("No se pudo listar el manifest de la orden %s", order_id)
+    return []
+
+
+def touch(order_id: str, ttl: Optional[int] = None):
+    """
+    Renueva el TTL de todos los checkpoints de la orden (solo Redis; en GCS no vencen).
+    """
+    if _init_backend() != "redis":
+        return
+    try:
+        _redis.expire(_redis_key(order_id), ttl or CHECKPOINT_TTL)
+    except Exception:
+        logger.exception("No se pudo renovar el TTL de los checkpoints de la orden %s", order_id)
+
+
+def clear(order_id: str, prefixes: Optional[tuple] = None):
+    """
+    Elimina los checkpoints de la orden. Con prefixes solo las entradas que empiezan así
+    (p. ej. ("text:", "artifact:") deja las marcas step:* de lo ya entregado).
+    """
+    backend = _init_backend()
+    try:
+        if backend == "redis":
+            if prefixes is None:
+                _redis.delete(_redis_key(order_id))
+                return
+            keys = [k for k in _redis.hkeys(_redis_key(order_id))
+                    if (k.decode() if isinstance(k, bytes) else k).startswith(prefixes)]
+            if keys:
+                _redis.hdel(_redis_key(order_id), *keys)
+        elif backend == "gcs":
+            prefix = _blob_name(order_id, "")
+            for blob in _bucket.list_blobs(prefix=prefix):
+                if prefixes is None or blob.name[len(prefix):].startswith(prefixes):
+                    blob.delete()
+    except Exception:
+        logger.exception("No se pudieron borrar los checkpoints de la orden %s", order_id)
+
+
+# -----------------------
+# API pública
+# -----------------------
+def save_text(order_id: str, name: str, text: str, ttl: Optional[int] = None) -> bool:
+    """
+    ttl: vencimiento propio en Redis (p. ej. resultados especulativos de una orden aún no pagada).
+    """
+    if text is None:
+        return False
+    return _put(order_id, f"text:{name}", text.encode("utf-8"), ttl=ttl)
+
+
+def load_text(order_id: str, name: str) -> Optional[str]:
+    data = _get(order_id, f"text:{name}")
+    if data is None:
+        return None
+    return data.decode("utf-8") if isinstance(data, bytes) else data
+
+
+def save_artifact_data(order_id: str, name: str, data: bytes) -> bool:
+    """
+    Guarda un documento renderizado (DOCX/PDF) que ya está en memoria (helpers/artifacts.py).
+    """
+    if not data:
+        return False
+    return _put(order_id, f"artifact:{name}", bytes(data))
+
+
+def load_artifact_data(order_id: str, name: str) -> Optional[bytes]:
+    data = _get(order_id, f"artifact:{name}")
+    if data is not None:
+        logger.info("Artifact %s restaurado desde checkpoint", name)
+    return data
+
+
+def mark_done(order_id: str, step: str, info: Optional[dict] = None) -> bool:
+    payload = {"done_at": time.time()}
+    if info:
+        payload.update(info)
+    return _put(order_id, f"step:{step}", json.dumps(payload).encode("utf-8"))
+
+
+def is_done(order_id: str, step: str) -> bool:
+    return _get(order_id, f"step:{step}") is not None
@@ -0,0 +1,261 @@
+# helpers/circuit.py
+"""
+Circuit breakers por proveedor externo (openai, assemblyai, sheets, drive, smtp, gcs, ...).
+
+Estados:
+- closed:    las llamadas pasan; CIRCUIT_FAILURE_THRESHOLD fallas seguidas lo abren.
+- open:      las llamadas fallan al instante con CircuitOpen durante CIRCUIT_RESET_SECONDS.
+- half_open: vencido ese plazo, una sola llamada de prueba pasa; si funciona se cierra,
+             si falla vuelve a open.
+
+El estado vive en Redis (hash `circuit:{provider}`) para que todos los workers lo compartan;
+sin Redis, en memoria del proceso. Cada transición es atómica (scripts Lua en Redis, un lock en
+memoria): las fallas concurrentes se cuentan todas (HINCRBY), un solo worker abre el circuito y
+solo el dueño de la prueba de half_open (token en `circuit:{provider}:probe`) la cierra o la reabre;
+los resultados de llamadas que empezaron antes de abrirse el circuito no cambian el estado.
+helpers.metrics.external_call lo aplica a cada llamada externa, así que los helpers no lo invocan
+directamente.
+generate_and_deliver atrapa CircuitOpen y difiere la orden (helpers.queue.defer_generate_and_deliver)
+en vez de dejar al worker bloqueado en reintentos que no pueden funcionar.
+"""
+import os
+import time
+import logging
+import uuid
+import threading
+from typing import Optional
+
+from helpers.redis_conn import get_redis
+
+logger = logging.getLogger("circuit")
+logger.setLevel(logging.INFO)
+
+FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+RESET_SECONDS = int(os.getenv("CIRCUIT_RESET_SECONDS", "60"))
+
+
+class CircuitOpen(RuntimeError):
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(f"Circuito de '{provider}' abierto; reintentar en {retry_after:.0f}s")
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+_memory = {}
+_memory_lock = threading.Lock()
+
+# KEYS: hash, probe. ARGV: now, reset_seconds, token. Devuelve "closed" | "wait" | "probe" | "busy".
+_CLAIM_PROBE = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'closed' then return 'closed' end
+local opened_at = tonumber(redis.call('HGET', KEYS[1], 'opened_at') or '0')
+if tonumber(ARGV[1]) < opened_at + tonumber(ARGV[2]) then return 'wait' end
+if redis.call('SET', KEYS[2], ARGV[3], 'NX', 'EX', ARGV[2]) then
+    redis.call('HSET', KEYS[1], 'state', 'half_open')
+    return 'probe'
+end
+return 'busy'
+"""
+
+# KEYS: hash, probe. ARGV: now, threshold, token ("" si la llamada no era la prueba).
+# Devuelve [estado, fallas, 1 si esta llamada abrió el circuito].
+_RECORD_FAILURE = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'half_open' then
+    if ARGV[3] == '' or redis.call('GET', KEYS[2]) ~= ARGV[3] then return {state, 0, 0} end
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', ARGV[1])
+    redis.call('DEL', KEYS[2])
+    return {'open', tonumber(redis.call('HGET', KEYS[1], 'failures') or '0'), 1}
+end
+if state == 'open' then return {state, 0, 0} end
+local failures = redis.call('HINCRBY', KEYS[1], 'failures', 1)
+if failures >= tonumber(ARGV[2]) then
+    redis.call('HSET', KEYS[1], 'state', 'open', 'opened_at', ARGV[1])
+    return {'open', failures, 1}
+end
+return {state, failures, 0}
+"""
+
+# KEYS: hash, probe. ARGV: token. Devuelve 1 si esta llamada cerró el circuito.
+_RECORD_SUCCESS = """
+local state = redis.call('HGET', KEYS[1], 'state') or 'closed'
+if state == 'half_open' then
+    if ARGV[1] == '' or redis.call('GET', KEYS[2]) ~= ARGV[1] then return 0 end
+    redis.call('HSET', KEYS[1], 'state', 'closed', 'failures', 0)
+    redis.call('DEL', KEYS[2])
+    return 1
+end
+if state == 'closed' and (redis.call('HGET', KEYS[1], 'failures') or '0') ~= '0' then
+    redis.call('HSET', KEYS[1], 'failures', 0)
+end
+return 0
+"""
+
+# KEYS: probe. ARGV: token. Suelta la prueba sin resultado (la llamada falló por algo ajeno al proveedor).
+_RELEASE_PROBE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+_scripts = {}
+
+
+def _key(provider: str) -> str:
+    return f"circuit:{provider}"
+
+
+def _run(conn, source: str, keys, args):
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = conn.register_script(source)
+    return script(keys=keys, args=args, client=conn)
+
+
+def _load(provider: str) -> dict:
+    conn = get_redis(decode_responses=True)
+    if conn is not None:
+        raw = conn.hgetall(_key(provider))
+    else:
+        with _memory_lock:
+            raw = dict(_memory.get(provider, {}))
+    return {
+        "state": raw.get("state", "closed"),
+        "failures": int(raw.get("failures", 0)),
+        "opened_at": float(raw.get("opened_at", 0)),
+    }
+
+
+def _memory_record(provider: str) -> dict:
+    # llamar con _memory_lock tomado
+    return _memory.setdefault(provider, {"state": "closed", "failures": 0, "opened_at": 0.0,
+                                         "probe": None, "probe_until": 0.0})
+
+
+def _claim_probe(provider: str, now: float, token: str) -> str:
+    conn = get_redis(decode_responses=True)
+    if conn is not None:
+        return _run(conn, _CLAIM_PROBE, [_key(provider), f"{_key(provider)}:probe"], [now, RESET_SECONDS, token])
+    with _memory_lock:
+        rec = _memory_record(provider)
+        if rec["state"] == "closed":
+            return "closed"
+        if now < rec["opened_at"] + RESET_SECONDS:
+            return "wait"
+        if rec["probe"] and rec["probe_until"] > now:
+            return "busy"
+        rec.update(state="half_open", probe=token, probe_until=now + RESET_SECONDS)
+        return "probe"
+
+
+def _memory_owns_probe(rec: dict, token: Optional[str]) -> bool:
+    return bool(token) and rec["probe"] == token and rec["probe_until"] > time.time()
+
+
+def state(provider: str) -> str:
+    try:
+        return _load(provider)["state"]
+    except Exception:
+        logger.exception("No se pudo leer el circuito de %s", provider)
+        return "closed"
+
+
+def is_open(provider: str) -> bool:
+    return state(provider) == "open"
+
+
+def before_call(provider: str) -> Optional[str]:
+    """
+    Levanta CircuitOpen si el proveedor está abierto (o en half_open con la prueba en curso).
+    Devuelve el token de la llamada de prueba si esta llamada lo es (None en el caso normal); se pasa
+    a record_success / record_failure. Si no se puede leer el estado, deja pasar la llamada.
+    """
+    try:
+        rec = _load(provider)
+        if rec["state"] == "closed":
+            return None
+        now = time.time()
+        token = uuid.uuid4().hex
+        claimed = _claim_probe(provider, now, token)
+    except Exception:
+        logger.exception("No se pudo leer el circuito de %s; se permite la llamada", provider)
+        return None
+    if claimed == "closed":
+        return None
+    if claimed == "probe":
+        logger.info("Circuito de %s en half_open: llamada de prueba", provider)
+        return token
+    if claimed == "wait":
+        retry_at = rec["opened_at"] + RESET_SECONDS
+        raise CircuitOpen(provider, max(0.0, retry_at - now))
+    raise CircuitOpen(provider, RESET_SECONDS)
+
+
+def _counts_as_failure(error: BaseException) -> bool:
+    from helpers.deadline import DeadlineExceeded
+    if isinstance(error, (CircuitOpen, DeadlineExceeded)):
+        return False
+    # 4xx (salvo 429) es un problema de la request, no del proveedor
+    status = getattr(getattr(error, "response", None), "status_code", None) or getattr(error, "status_code", None)
+    if isinstance(status, int) and 400 <= status < 500 and status != 429:
+        return False
+    return True
+
+
+def record_success(provider: str, probe: Optional[str] = None):
+    try:
+        conn = get_redis(decode_responses=True)
+        if conn is not None:
+            closed = _run(conn, _RECORD_SUCCESS, [_key(provider), f"{_key(provider)}:probe"], [probe or ""])
+        else:
+            with _memory_lock:
+                rec = _memory_record(provider)
+                closed = rec["state"] == "half_open" and _memory_owns_probe(rec, probe)
+                if closed:
+                    rec.update(state="closed", failures=0, probe=None, probe_until=0.0)
+                elif rec["state"] == "closed":
+                    rec["failures"] = 0
+        if closed:
+            logger.info("Circuito de %s cerrado (proveedor recuperado)", provider)
+    except Exception:
+        logger.exception("No se pudo actualizar el circuito de %s", provider)
+
+
+def _release_probe(provider: str, probe: str):
+    conn = get_redis(decode_responses=True)
+    if conn is not None:
+        _run(conn, _RELEASE_PROBE, [f"{_key(provider)}:probe"], [probe])
+        return
+    with _memory_lock:
+        rec = _memory_record(provider)
+        if rec["probe"] == probe:
+            rec.update(probe=None, probe_until=0.0)
+
+
+def record_failure(provider: str, error: BaseException, probe: Optional[str] = None):
+    try:
+        if not _counts_as_failure(error):
+            # la prueba no dijo nada del proveedor: que la haga la próxima llamada
+            if probe:
+                _release_probe(provider, probe)
+            return
+        now = time.time()
+        conn = get_redis(decode_responses=True)
+        if conn is not None:
+            _, failures, opened = _run(conn, _RECORD_FAILURE, [_key(provider), f"{_key(provider)}:probe"],
+                                       [now, FAILURE_THRESHOLD, probe or ""])
+        else:
+            with _memory_lock:
+                rec = _memory_record(provider)
+                failures, opened = rec["failures"], 0
+                if rec["state"] == "half_open" and _memory_owns_probe(rec, probe):
+                    rec.update(state="open", opened_at=now, probe=None, probe_until=0.0)
+                    opened = 1
+                elif rec["state"] == "closed":
+                    failures = rec["failures"] = rec["failures"] + 1
+                    if failures >= FAILURE_THRESHOLD:
+                        rec.update(state="open", opened_at=now)
+                        opened = 1
+        if opened:
+            logger.warning("Circuito de %s ABIERTO tras %s fallas: %s", provider, failures, error)
+    except Exception:
+        logger.exception("No se pudo actualizar el circuito de %s", provider)
@@ -0,0 +1,338 @@
+# helpers/convertidor_pdf.py
+"""
+Conversión DOCX -> PDF con un pool de slots de conversión.
+
+- Backends (PDF_BACKEND):
+  - unoserver: un proceso LibreOffice residente por slot (unoserver) y `unoconvert` por documento;
+    el arranque en frío de LibreOffice se paga una vez por slot, no por documento. Es el único
+    backend con conversores persistentes (calientes): instalar unoserver en producción.
+  - soffice:   fallback sin unoserver. NO es persistente: cada documento lanza un `soffice --convert-to pdf`
+    nuevo (arranque de LibreOffice incluido, varios segundos); del slot solo se reutiliza el perfil de
+    usuario ya inicializado (y dos conversiones simultáneas no se pisan el perfil).
+  - fake:      escribe un PDF mínimo, para tests y entornos sin LibreOffice.
+  - auto (por defecto): unoserver si está instalado, si no soffice, si no ninguno (sin PDF).
+- Pool de PDF_POOL_SIZE slots por proceso: los pedidos esperan un slot libre en una cola y cada
+  conversión tiene timeout (PDF_TIMEOUT_SECONDS, acotado por el plazo de la orden). Un slot que
+  falla o se cuelga se detiene y se reinicia en su próximo uso.
+- El TCP y el quiz de una orden se convierten en paralelo (etapas pdf_tcp / pdf_quiz del DAG),
+  por eso el pool trae 2 slots por defecto.
+"""
+import os
+import abc
+import time
+import queue
+import shutil
+import socket
+import atexit
+import logging
+import tempfile
+import threading
+import subprocess
+from typing import Callable, Optional
+
+from helpers import deadline
+
+logger = logging.getLogger("convertidor_pdf")
+logger.setLevel(logging.INFO)
+
+PDF_BACKEND = os.getenv("PDF_BACKEND", "auto")
+PDF_POOL_SIZE = int(os.getenv("PDF_POOL_SIZE", "2"))
+PDF_TIMEOUT = int(os.getenv("PDF_TIMEOUT_SECONDS", "180"))
+PDF_START_TIMEOUT = int(os.getenv("PDF_START_TIMEOUT_SECONDS", "60"))
+
+
+class PdfBackend(abc.ABC):
+    """
+    Un slot del pool. start()/stop() manejan el proceso residente (si lo hay); convert() es síncrono.
+    close() es el stop() definitivo (apagado del pool): además borra el perfil del slot.
+    """
+    name = "base"
+    profile: Optional[str] = None
+
+    def __init__(self, slot: int):
+        self.slot = slot
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+    def close(self):
+        self.stop()
+        if self.profile:
+            shutil.rmtree(self.profile, ignore_errors=True)
+            self.profile = None
+
+    def alive(self) -> bool:
+        return True
+
+    @abc.abstractmethod
+    def convert(self, docx_path: str, pdf_path: str, timeout: float):
+        ...
+
+
+class FakeBackend(PdfBackend):
+    name = "fake"
+    delay = float(os.getenv("PDF_FAKE_DELAY", "0"))
+
+    def convert(self, docx_path: str, pdf_path: str, timeout: float):
+        if self.delay:
+            if self.delay > timeout:
+                time.sleep(timeout)
+                raise TimeoutError(f"Conversión fake excedió {timeout:.0f}s")
+            time.sleep(self.delay)
+        text = os.path.basename(docx_path).replace("(", "").replace(")", "")
+        content = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1", "replace")
+        objs = [
+            b"<< /Type /Catalog /Pages 2 0 R >>",
+            b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R "
+            b"/Resources << /Font << /F1 5 0 R >> >> >>",
+            b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+        ]
+        out, offsets = [b"%PDF-1.4\n"], []
+        for i, obj in enumerate(objs, start=1):
+            offsets.append(sum(len(x) for x in out))
+            out.append(b"%d 0 obj\n" % i + obj + b"\nendobj\n")
+        xref = sum(len(x) for x in out)
+        out.append(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objs) + 1))
+        out.extend(b"%010d 00000 n \n" % off for off in offsets)
+        out.append(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objs) + 1, xref))
+        with open(pdf_path, "wb") as fh:
+            fh.write(b"".join(out))
+
+
+def _soffice_binary() -> Optional[str]:
+    return shutil.which("soffice") or shutil.which("libreoffice")
+
+
+def _run(cmd, timeout: float):
+    try:
+        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        raise TimeoutError(f"Conversión PDF excedió {timeout:.0f}s: {os.path.basename(cmd[0])}")
+    if proc.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(cmd[0])} salió con {proc.returncode}: "
+                           f"{proc.stderr.decode('utf-8', 'replace')[-500:]}")
+
+
+class SofficeBackend(PdfBackend):
+    """
+    Un proceso soffice por conversión (ver docstring del módulo); el slot solo conserva el perfil.
+    """
+    name = "soffice"
+
+    def __init__(self, slot: int):
+        super().__init__(slot)
+        self.profile = tempfile.mkdtemp(prefix=f"redaxion_lo_{slot}_")
+        self._warm = False
+
+    def _cmd(self, *args):
+        return [_soffice_binary(), f"-env:UserInstallation=file://{self.profile}", "--headless", "--invisible",
+                "--nologo", "--norestore", *args]
+
+    def start(self):
+        # la primera ejecución crea el perfil (lo más lento del arranque en frío)
+        if not self._warm:
+            _run(self._cmd("--terminate_after_init"), PDF_START_TIMEOUT)
+            self._warm = True
+
+    def convert(self, docx_path: str, pdf_path: str, timeout: float):
+        outdir = tempfile.mkdtemp(prefix="redaxion_pdf_")
+        try:
+            _run(self._cmd("--convert-to", "pdf", "--outdir", outdir, docx_path), timeout)
+            produced = os.path.join(outdir, os.path.splitext(os.path.basename(docx_path))[0] + ".pdf")
+            if not os.path.exists(produced):
+                raise RuntimeError(f"soffice no produjo {produced}")
+            shutil.move(produced, pdf_path)
+        finally:
+            shutil.rmtree(outdir, ignore_errors=True)
+
+    def stop(self):
+        self._warm = False
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class UnoserverBackend(PdfBackend):
+    name = "unoserver"
+
+    def __init__(self, slot: int):
+        super().__init__(slot)
+        self.profile = tempfile.mkdtemp(prefix=f"redaxion_uno_{slot}_")
+        self.proc = None
+        self.port = None
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def start(self):
+        self.stop()
+        self.port, uno_port = _free_port(), _free_port()
+        self.proc = subprocess.Popen(
+            ["unoserver", "--interface", "127.0.0.1", "--port", str(self.port), "--uno-port", str(uno_port),
+             "--user-installation", f"file://{self.profile}"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        limit = time.time() + PDF_START_TIMEOUT
+        while time.time() < limit:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"unoserver (slot {self.slot}) terminó al arrancar")
+            try:
+                with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                    logger.info("unoserver slot %s listo en el puerto %s", self.slot, self.port)
+                    return
+            except OSError:
+                time.sleep(0.5)
+        self.stop()
+        raise TimeoutError(f"unoserver (slot {self.slot}) no respondió en {PDF_START_TIMEOUT}s")
+
+    def convert(self, docx_path: str, pdf_path: str, timeout: float):
+        _run(["unoconvert", "--host", "127.0.0.1", "--port", str(self.port), "--convert-to", "pdf",
+              docx_path, pdf_path], timeout)
+
+    def stop(self):
+        if self.proc is None:
+            return
+        try:
+            self.proc.terminate()
+            self.proc.wait(timeout=10)
+        except Exception:
+            self.proc.kill()
+        self.proc = None
+
+
+BACKENDS = {"unoserver": UnoserverBackend, "soffice": SofficeBackend, "fake": FakeBackend}
+
+
+class ConverterPool:
+    """
+    size slots; convert() espera un slot libre (cola FIFO de queue.Queue) dentro del mismo timeout del job.
+    """
+
+    def __init__(self, factory: Callable[[int], PdfBackend], size: int = PDF_POOL_SIZE):
+        self._slots = queue.Queue()
+        self._all = []
+        for i in range(max(1, size)):
+            backend = factory(i)
+            self._all.append(backend)
+            self._slots.put(backend)
+        self._needs_start = set(range(len(self._all)))
+        self._lock = threading.Lock()
+
+    def convert(self, docx_path: str, pdf_path: str, timeout: float = PDF_TIMEOUT) -> str:
+        started = time.time()
+        try:
+            backend = self._slots.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError(f"Sin conversor PDF libre en {timeout:.0f}s")
+        try:
+            with self._lock:
+                needs_start = backend.slot in self._needs_start or not backend.alive()
+                self._needs_start.discard(backend.slot)
+            if needs_start:
+                backend.start()
+            remaining = timeout - (time.time() - started)
+            if remaining <= 0:
+                raise TimeoutError(f"Sin tiempo para convertir {os.path.basename(docx_path)}")
+            backend.convert(docx_path, pdf_path, remaining)
+            return pdf_path
+        except Exception:
+            # proceso colgado/caído: se detiene y se reinicia en el próximo uso del slot
+            backend.stop()
+            with self._lock:
+                self._needs_start.add(backend.slot)
+            raise
+        finally:
+            self._slots.put(backend)
+
+    def shutdown(self):
+        for backend in self._all:
+            try:
+                backend.close()
+            except Exception:
+                logger.exception("No se pudo detener el conversor %s", backend.slot)
+
+
+def _backend_name() -> Optional[str]:
+    if PDF_BACKEND != "auto":
+        return PDF_BACKEND if PDF_BACKEND in BACKENDS else None
+    if shutil.which("unoserver") and shutil.which("unoconvert"):
+        return "unoserver"
+    if _soffice_binary():
+        return "soffice"
+    return None
+
+
+_pool: Optional[ConverterPool] = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+
+def set_backend(name: Optional[str], size: int = PDF_POOL_SIZE):
+    """
+    Cambia el backend (tests: set_backend("fake")). None vuelve a PDF_BACKEND.
+    """
+    global PDF_BACKEND, _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+        _pool = None
+        PDF_BACKEND = name or os.getenv("PDF_BACKEND", "auto")
+        if name:
+            _build_pool(size)
+
+
+def _build_pool(size: int = PDF_POOL_SIZE) -> Optional[ConverterPool]:
+    global _pool, _pool_pid
+    name = _backend_name()
+    if name is None:
+        return None
+    _pool = ConverterPool(BACKENDS[name], size)
+    _pool_pid = os.getpid()
+    logger.info("Pool de conversión PDF: backend %s, %s slots", name, size)
+    if name == "soffice":
+        logger.warning("Sin unoserver: cada conversión PDF arranca un LibreOffice nuevo (no hay conversor caliente)")
+    return _pool
+
+
+def get_pool() -> Optional[ConverterPool]:
+    # por proceso: un hijo del worker no hereda los procesos LibreOffice del padre
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            return _build_pool()
+        return _pool
+
+
+def available() -> bool:
+    return _backend_name() is not None
+
+
+def convertir_a_pdf(docx_path: str, pdf_path: Optional[str] = None, timeout: Optional[float] = None) -> str:
+    """
+    Convierte docx_path y devuelve la ruta del PDF (por defecto al lado del DOCX).
+    """
+    pool = get_pool()
+    if pool is None:
+        raise RuntimeError("No hay backend de conversión PDF disponible (PDF_BACKEND)")
+    pdf_path = pdf_path or os.path.splitext(docx_path)[0] + ".pdf"
+    return pool.convert(docx_path, pdf_path, timeout=deadline.timeout(timeout or PDF_TIMEOUT, "pdf"))
+
+
+@atexit.register
+def shutdown():
+    """
+    Detiene los conversores de este proceso y borra sus perfiles. atexit no corre en los hijos de
+    worker.py (multiprocessing sale con os._exit): child_main la llama al terminar.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+            _pool = None
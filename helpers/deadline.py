@@ -0,0 +1,101 @@
+# helpers/deadline.py
+"""
+Plazo (deadline) de una orden completa, compartido por todas sus etapas y helpers.
+
+generate_and_deliver abre un scope con el presupuesto de la orden (ORDER_DEADLINE_SECONDS,
+por defecto el timeout del job RQ menos un margen para limpiar). El Deadline viaja en un
+contextvar, igual que el contexto de tracing, así que llega a los threads del DAG y del quiz
+(contextvars.copy_context) sin agregar un parámetro a cada helper.
+
+Los helpers no usan timeouts fijos sino:
+- timeout(default): el menor entre su timeout habitual y lo que le queda a la orden.
+- max_time(): tope total para los reintentos (backoff) = tiempo restante.
+- check(stage): falla de inmediato con DeadlineExceeded si ya no queda tiempo.
+Fuera de un scope (tests, scripts) todo devuelve los valores por defecto.
+"""
+import os
+import time
+import contextvars
+from contextlib import contextmanager
+from typing import Optional
+
+ORDER_DEADLINE_SECONDS = float(os.getenv("ORDER_DEADLINE_SECONDS", str(3600 - 60)))
+MIN_CALL_SECONDS = 1.0  # por debajo de esto no vale la pena empezar una llamada
+
+
+class DeadlineExceeded(TimeoutError):
+    def __init__(self, stage: str, budget: float):
+        super().__init__(f"Plazo de la orden agotado antes/durante '{stage}' (presupuesto {budget:.0f}s)")
+        self.stage = stage
+        self.budget = budget
+
+
+class Deadline:
+    def __init__(self, budget_seconds: float):
+        self.budget = float(budget_seconds)
+        self.expires_at = time.monotonic() + self.budget
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: str):
+        if self.remaining() < MIN_CALL_SECONDS:
+            raise DeadlineExceeded(stage, self.budget)
+
+    def timeout(self, default: Optional[float], stage: str = "call", minimum: float = MIN_CALL_SECONDS) -> float:
+        remaining = self.remaining()
+        if remaining < minimum:
+            raise DeadlineExceeded(stage, self.budget)
+        return remaining if default is None else min(float(default), remaining)
+
+
+_current = contextvars.ContextVar("order_deadline", default=None)
+
+
+@contextmanager
+def scope(budget_seconds: float = ORDER_DEADLINE_SECONDS):
+    """
+    with deadline.scope(): ...  -> todo lo que corre dentro (y sus threads con copy_context) comparte el plazo.
+    Un scope anidado nunca extiende el plazo del exterior.
+    """
+    outer = _current.get()
+    if outer is not None:
+        budget_seconds = min(budget_seconds, outer.remaining())
+    token = _current.set(Deadline(budget_seconds))
+    try:
+        yield _current.get()
+    finally:
+        _current.reset(token)
+
+
+def current() -> Optional[Deadline]:
+    return _current.get()
+
+
+def remaining() -> Optional[float]:
+    dl = _current.get()
+    return dl.remaining() if dl else None
+
+
+def check(stage: str):
+    dl = _current.get()
+    if dl is not None:
+        dl.check(stage)
+
+
+def timeout(default: Optional[float], stage: str = "call") -> Optional[float]:
+    """
+    Timeout para una llamada: min(default, tiempo restante). Levanta DeadlineExceeded si no queda tiempo.
+    """
+    dl = _current.get()
+    return dl.timeout(default, stage) if dl else default
+
+
+def max_time() -> Optional[float]:
+    """
+    Para backoff.on_exception(max_time=deadline.max_time): los reintentos no pasan del plazo.
+    """
+    return remaining()
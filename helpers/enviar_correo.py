@@ -1,10 +1,16 @@
 # helpers/enviar_correo.py
 import os
+import html
 import logging
 import smtplib
+import hashlib
 import mimetypes
+from datetime import datetime, timedelta, timezone
 from email.message import EmailMessage
 
+from helpers import deadline
+from helpers.metrics import external_call, track_external
+
 logger = logging.getLogger("mail")
 logger.setLevel(logging.INFO)
 
@@ -15,7 +21,87 @@ SMTP_USER = os.getenv("SMTP_USER")
 SMTP_PASS = os.getenv("SMTP_PASS")
 SMTP_FROM = os.getenv("SMTP_FROM", "admin@redaxiontcp.com")
 
+# Entrega por enlace: los adjuntos de más de EMAIL_LINK_THRESHOLD_BYTES (y los más grandes, si el total
+# supera EMAIL_MAX_ATTACH_BYTES) se suben a GCS y el correo lleva un enlace firmado que vence en
+# EMAIL_LINK_TTL_HOURS. Requiere GCS_BUCKET; EMAIL_LINK_THRESHOLD_BYTES=0 lo desactiva.
+EMAIL_LINK_THRESHOLD_BYTES = int(os.getenv("EMAIL_LINK_THRESHOLD_BYTES", str(8 * 1024 * 1024)))
+EMAIL_MAX_ATTACH_BYTES = int(os.getenv("EMAIL_MAX_ATTACH_BYTES", str(18 * 1024 * 1024)))  # ~24 MB en base64
+EMAIL_LINK_TTL_HOURS = int(os.getenv("EMAIL_LINK_TTL_HOURS", "168"))
+EMAIL_LINK_PREFIX = os.getenv("EMAIL_LINK_PREFIX", "entregas")
+
+
+def _attachment(item):
+    """
+    (nombre, bytes) de un adjunto: una ruta (se lee del disco) o una tupla (nombre, bytes) ya en memoria.
+    """
+    if isinstance(item, (tuple, list)):
+        filename, data = item
+        return filename, data
+    with open(item, "rb") as fp:
+        return os.path.basename(item), fp.read()
+
+
+def _attachment_name(item) -> str:
+    return item[0] if isinstance(item, (tuple, list)) else os.path.basename(item)
+
+
+def _attachment_size(item) -> int:
+    # sin leer el archivo: las rutas se miden con stat
+    return len(item[1]) if isinstance(item, (tuple, list)) else os.path.getsize(item)
+
+
+def _links_enabled() -> bool:
+    return EMAIL_LINK_THRESHOLD_BYTES > 0 and bool(os.getenv("GCS_BUCKET"))
+
+
+def _split_for_links(attachments):
+    """
+    (adjuntos, por_enlace): los que superan el umbral, y después los más grandes hasta que el total entre.
+    """
+    sized = [(item, _attachment_size(item)) for item in attachments]
+    links = [item for item, size in sized if size > EMAIL_LINK_THRESHOLD_BYTES]
+    rest = sorted(((item, size) for item, size in sized if size <= EMAIL_LINK_THRESHOLD_BYTES), key=lambda x: -x[1])
+    total = sum(size for _, size in rest)
+    while rest and total > EMAIL_MAX_ATTACH_BYTES:
+        item, size = rest.pop(0)
+        links.append(item)
+        total -= size
+    keep = [item for item in attachments if any(item is r for r, _ in rest)]
+    return keep, links
+
+
+def _upload_links(items, link_prefix: str):
+    """
+    Sube cada adjunto a GCS y devuelve [(nombre, tamaño, url)]. Los que fallan se devuelven aparte
+    para adjuntarlos igual (mejor un correo pesado que un entregable perdido).
+    """
+    from helpers.gcs import upload_for_download
+    expiration = timedelta(hours=EMAIL_LINK_TTL_HOURS)
+    links, failed = [], []
+    for item in items:
+        filename = _attachment_name(item)
+        source = item[1] if isinstance(item, (tuple, list)) else item
+        content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        try:
+            url = upload_for_download(source, f"{link_prefix}/{filename}", filename, expiration, content_type)
+            links.append((filename, _attachment_size(item), url))
+        except Exception:
+            logger.exception("No se pudo subir %s para entrega por enlace; se adjunta", filename)
+            failed.append(item)
+    return links, failed
+
+
+def _links_html(links) -> str:
+    expires = (datetime.now(timezone.utc) + timedelta(hours=EMAIL_LINK_TTL_HOURS)).strftime("%d/%m/%Y")
+    items = "".join(
+        f'<li><a href="{html.escape(url)}">{html.escape(name)}</a> ({size / (1024 * 1024):.1f} MB)</li>'
+        for name, size, url in links
+    )
+    return (f"<p>Algunos archivos son demasiado grandes para adjuntarlos. Descárgalos aquí "
+            f"(los enlaces vencen el {expires}):</p><ul>{items}</ul>")
+
 
+@track_external("smtp", "send")
 def _send_via_smtp(to_emails, subject, html_body, attachments=None, from_email=SMTP_FROM):
     attachments = attachments or []
     msg = EmailMessage()
@@ -25,25 +111,25 @@ def _send_via_smtp(to_emails, subject, html_body, attachments=None, from_email=S
     msg.set_content("Correo en HTML. Usa cliente que soporte HTML.")
     msg.add_alternative(html_body, subtype="html")
 
-    for path in attachments:
+    for item in attachments:
         try:
-            ctype, encoding = mimetypes.guess_type(path)
+            filename, data = _attachment(item)
+            ctype, encoding = mimetypes.guess_type(filename)
             if ctype is None:
                 ctype = "application/octet-stream"
             maintype, subtype = ctype.split("/", 1)
-            with open(path, "rb") as fp:
-                data = fp.read()
-            msg.add_attachment(data, maintype=maintype, subtype=subtype, filename=os.path.basename(path))
+            msg.add_attachment(bytes(data), maintype=maintype, subtype=subtype, filename=filename)
         except Exception:
-            logger.exception("Failed to attach file %s", path)
+            logger.exception("Failed to attach file %s", item if isinstance(item, str) else item[0])
 
+    timeout = deadline.timeout(30, "smtp")
     try:
         if SMTP_PORT == 465:
-            with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=30) as s:
+            with smtplib.SMTP_SSL(SMTP_HOST, SMTP_PORT, timeout=timeout) as s:
                 s.login(SMTP_USER, SMTP_PASS)
                 s.send_message(msg)
         else:
-            with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=30) as s:
+            with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=timeout) as s:
                 s.ehlo()
                 s.starttls()
                 s.login(SMTP_USER, SMTP_PASS)
@@ -55,9 +141,23 @@ def _send_via_smtp(to_emails, subject, html_body, attachments=None, from_email=S
         raise
 
 
-def enviar_correo_con_adjuntos(to_emails, subject, html_body, attachments=None, from_email=None):
+def enviar_correo_con_adjuntos(to_emails, subject, html_body, attachments=None, from_email=None,
+                               link_folder=None):
+    """
+    attachments: rutas o tuplas (nombre, bytes) para documentos que ya están en memoria.
+    link_folder: subcarpeta (bajo EMAIL_LINK_PREFIX) para los adjuntos que se entregan por enlace, p. ej. la orden.
+    """
     if from_email is None:
         from_email = SMTP_FROM
+    if attachments and _links_enabled():
+        attachments, to_link = _split_for_links(attachments)
+        if to_link:
+            folder = link_folder or hashlib.sha1(repr((to_emails, subject)).encode("utf-8")).hexdigest()[:16]
+            links, failed = _upload_links(to_link, f"{EMAIL_LINK_PREFIX}/{folder}")
+            attachments = attachments + failed
+            if links:
+                html_body = f"{html_body}\n\n{_links_html(links)}"
+                logger.info("%s archivos entregados por enlace: %s", len(links), ", ".join(n for n, _, _ in links))
     # Prefer SendGrid if key present (optional)
     if SENDGRID_API_KEY:
         try:
@@ -66,17 +166,19 @@ def enviar_correo_con_adjuntos(to_emails, subject, html_body, attachments=None,
             import base64
             message = Mail(from_email=from_email, to_emails=to_emails, subject=subject, html_content=html_body)
             if attachments:
-                for path in attachments:
-                    with open(path, "rb") as f:
-                        data = base64.b64encode(f.read()).decode()
+                for item in attachments:
+                    filename, raw = _attachment(item)
+                    data = base64.b64encode(raw).decode()
                     att = Attachment()
                     att.file_content = FileContent(data)
-                    att.file_type = FileType(mimetypes.guess_type(path)[0] or "application/octet-stream")
-                    att.file_name = FileName(os.path.basename(path))
+                    att.file_type = FileType(mimetypes.guess_type(filename)[0] or "application/octet-stream")
+                    att.file_name = FileName(filename)
                     att.disposition = Disposition("attachment")
                     message.add_attachment(att)
             sg = SendGridAPIClient(SENDGRID_API_KEY)
-            sg.send(message)
+            sg.client.timeout = deadline.timeout(30, "sendgrid")
+            with external_call("sendgrid", "send"):
+                sg.send(message)
             logger.info("Email sent via SendGrid to %s", to_emails)
             return True
         except Exception:
@@ -1,27 +1,64 @@
 # helpers/formatter_docx.py
+import io
 import os
 import re
+import copy
+import glob
 import logging
-from typing import Optional, Dict, List
+import zipfile
+import threading
+from typing import Optional, Dict, List, Tuple
+from xml.sax.saxutils import escape, quoteattr
 from docx import Document
-from docx.shared import Inches, Pt, RGBColor
+from docx.image.image import Image as DocxImage
+from docx.shared import Emu, Inches, Pt, RGBColor
 from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
+from lxml import etree
 
 logger = logging.getLogger("formatter_docx")
 logger.setLevel(logging.INFO)
 
+# Plantillas por variante: "Plantilla {Color} Columna {Simple|Doble}.docx" en DOCX_TEMPLATES_DIR;
+# banner/logo opcionales en DOCX_TEMPLATE_IMAGES_DIR (banner_{color}.png o banner.png, logo.png)
+TEMPLATES_DIR = os.getenv("DOCX_TEMPLATES_DIR", os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_IMAGES_DIR = os.getenv("DOCX_TEMPLATE_IMAGES_DIR", os.path.join(TEMPLATES_DIR, "images"))
+DEFAULT_COLOR = "verde"
+DEFAULT_COLUMNAS = "simple"
+BAR_COLORS = {"verde": (3, 94, 99), "azul": (31, 78, 121)}
+
+# Backend de escritura: "python-docx" (árbol de objetos completo en memoria), "stream" (document.xml
+# escrito por partes directo al zip) o "auto" (stream desde DOCX_STREAM_MIN_WORDS palabras)
+DOCX_BACKEND = os.getenv("DOCX_BACKEND", "auto")
+DOCX_STREAM_MIN_WORDS = int(os.getenv("DOCX_STREAM_MIN_WORDS", "20000"))
+
+# Compilados una vez: se aplican a cada párrafo del TCP
+_BOLD_SPLIT_RE = re.compile(r"(\*\*.+?\*\*)")
+_BOLD_RE = re.compile(r"^\*\*(.+)\*\*$")
+
+
+def _style_table(doc: Document) -> Dict[str, object]:
+    """
+    nombre -> estilo de la plantilla, armado una sola vez por documento.
+    Pasar el objeto estilo a add_paragraph evita además que python-docx lo busque por nombre
+    recorriendo todos los estilos en cada párrafo.
+    """
+    return {s.name: s for s in doc.styles}
+
 
 def _safe_run_boldify(paragraph, text: str):
     """
     Parsea **bold** dentro de text y añade runs al párrafo con bold donde toca.
     (Solo maneja pares de '**' sin anidamiento avanzado).
     """
-    parts = re.split(r"(\*\*.+?\*\*)", text)
+    if "**" not in text:
+        paragraph.add_run(text)
+        return
+    parts = _BOLD_SPLIT_RE.split(text)
     for part in parts:
         if not part:
             continue
-        m = re.match(r"^\*\*(.+)\*\*$", part)
+        m = _BOLD_RE.match(part)
         if m:
             run = paragraph.add_run(m.group(1))
             run.bold = True
@@ -42,7 +79,7 @@ def insert_header_images(doc: Document, banner_path: Optional[str], logo_path: O
             p.clear()
 
         # Create a table in header: 1 row x 2 cols -> left banner, right logo
-        tbl = header.add_table(rows=1, cols=2)
+        tbl = header.add_table(rows=1, cols=2, width=Inches(7.5))
         tbl.autofit = False
         left_cell = tbl.cell(0, 0)
         right_cell = tbl.cell(0, 1)
@@ -75,6 +112,141 @@ def insert_header_images(doc: Document, banner_path: Optional[str], logo_path: O
         logger.exception("insert_header_images error: %s", e)
 
 
+def _normalize_section_measures(doc: Document):
+    """
+    Algunas plantillas (exportadas desde Google Docs) traen márgenes en twips con decimales
+    ("737.0078..."), que python-docx no sabe leer al calcular el ancho de una tabla.
+    """
+    for sect_pr in doc.element.body.iter(qn('w:sectPr')):
+        for tag in ('w:pgMar', 'w:pgSz'):
+            el = sect_pr.find(qn(tag))
+            if el is None:
+                continue
+            for attr, value in list(el.attrib.items()):
+                if '.' in value:
+                    try:
+                        el.set(attr, str(int(round(float(value)))))
+                    except ValueError:
+                        pass
+
+
+def _set_columns(doc: Document, num: int):
+    for section in doc.sections:
+        sect_pr = section._sectPr
+        cols = sect_pr.find(qn('w:cols'))
+        if cols is None:
+            cols = OxmlElement('w:cols')
+            sect_pr.append(cols)
+        cols.set(qn('w:num'), str(num))
+        cols.set(qn('w:space'), "425")
+
+
+# Plantillas ya parseadas y preparadas (márgenes, header, columnas); cada orden recibe una copia
+_template_cache: Dict[Tuple, Document] = {}
+_template_lock = threading.Lock()
+
+
+def _prepare_template(template_path: str, banner_path: Optional[str], logo_path: Optional[str],
+                      columns: Optional[int]) -> Document:
+    doc = Document(template_path)
+    _normalize_section_measures(doc)
+    if banner_path or logo_path:
+        try:
+            insert_header_images(doc, banner_path, logo_path)
+        except Exception:
+            logger.exception("Failed to insert header images - continuing")
+    if columns:
+        _set_columns(doc, columns)
+    return doc
+
+
+def load_template(template_path: str, banner_path: Optional[str] = None, logo_path: Optional[str] = None,
+                  columns: Optional[int] = None) -> Document:
+    """
+    Copia de la plantilla preparada. El unzip + parseo + imágenes del header se hacen una vez por
+    variante (y por mtime del archivo, así una plantilla editada se recarga); copiar el árbol ya
+    parseado cuesta ~1 ms contra ~20 ms de Document(path).
+    """
+    if not os.path.exists(template_path):
+        raise FileNotFoundError(f"Template not found: {template_path}")
+    key = (os.path.abspath(template_path), os.path.getmtime(template_path), banner_path, logo_path, columns)
+    with _template_lock:
+        cached = _template_cache.get(key)
+        if cached is None:
+            cached = _template_cache[key] = _prepare_template(template_path, banner_path, logo_path, columns)
+            logger.info("Plantilla preparada y cacheada: %s", os.path.basename(template_path))
+        return copy.deepcopy(cached)
+
+
+def template_path_for(color: str = DEFAULT_COLOR, columnas: str = DEFAULT_COLUMNAS) -> str:
+    """
+    Plantilla para el color/columnas de la orden; si esa variante no existe, la del color por defecto.
+    """
+    color = (color or DEFAULT_COLOR).strip().lower()
+    columnas = (columnas or DEFAULT_COLUMNAS).strip().lower()
+    for c, cols in ((color, columnas), (DEFAULT_COLOR, columnas), (color, DEFAULT_COLUMNAS),
+                    (DEFAULT_COLOR, DEFAULT_COLUMNAS)):
+        path = os.path.join(TEMPLATES_DIR, f"Plantilla {c.capitalize()} Columna {cols.capitalize()}.docx")
+        if os.path.exists(path):
+            if (c, cols) != (color, columnas):
+                logger.warning("Sin plantilla para %s/%s; usando %s", color, columnas, os.path.basename(path))
+            return path
+    raise FileNotFoundError(f"No hay plantillas DOCX en {TEMPLATES_DIR}")
+
+
+def _header_assets(color: str) -> Tuple[Optional[str], Optional[str]]:
+    def first(*names):
+        for name in names:
+            path = os.path.join(TEMPLATE_IMAGES_DIR, name)
+            if os.path.exists(path):
+                return path
+        return None
+    return first(f"banner_{color}.png", "banner.png"), first(f"logo_{color}.png", "logo.png")
+
+
+def _variant(color: str, columnas: str):
+    color = (color or DEFAULT_COLOR).strip().lower()
+    columnas = (columnas or DEFAULT_COLUMNAS).strip().lower()
+    banner, logo = _header_assets(color)
+    return template_path_for(color, columnas), banner, logo, 2 if columnas == "doble" else None
+
+
+def warm_templates() -> int:
+    """
+    Prepara todas las variantes color/columnas presentes en TEMPLATES_DIR (worker.preload, antes del fork).
+    """
+    colors = set()
+    for path in glob.glob(os.path.join(TEMPLATES_DIR, "Plantilla * Columna *.docx")):
+        m = re.match(r"Plantilla (\w+) Columna \w+\.docx$", os.path.basename(path))
+        if m:
+            colors.add(m.group(1).lower())
+    count = 0
+    for color in sorted(colors):
+        # "doble" sin archivo propio se arma desde la simple con dos columnas: también se precarga
+        for columnas in ("simple", "doble"):
+            try:
+                variant = _variant(color, columnas)
+                load_template(*variant)
+                if DOCX_BACKEND != "python-docx":
+                    _stream_template(*variant)
+                count += 1
+            except Exception:
+                logger.exception("No se pudo precargar la plantilla %s/%s", color, columnas)
+    return count
+
+
+def _ensure_footer(doc: Document):
+    try:
+        section = doc.sections[0]
+        footer = section.footer
+        if not footer.paragraphs or not any(p.text.strip() for p in footer.paragraphs):
+            p = footer.paragraphs[0] if footer.paragraphs else footer.add_paragraph()
+            p.text = "RedaXion"
+            p.alignment = 1  # center
+    except Exception:
+        logger.exception("Failed ensure footer")
+
+
 def add_colored_heading(doc: Document, text: str, color_rgb=(3, 94, 99)):
     """
     Crea una tabla 1x1 con shading (barra de color) y texto blanco en su interior.
@@ -99,9 +271,10 @@ def add_colored_heading(doc: Document, text: str, color_rgb=(3, 94, 99)):
     tcPr.append(sh)
 
 
-def _add_paragraph_with_style(doc: Document, text: str, style_name: Optional[str] = None):
+def _add_paragraph_with_style(doc: Document, text: str, style_name: Optional[str] = None,
+                              styles: Optional[Dict[str, object]] = None):
     if style_name:
-        p = doc.add_paragraph(style=style_name)
+        p = doc.add_paragraph(style=(styles or {}).get(style_name, style_name))
         _safe_run_boldify(p, text)
     else:
         p = doc.add_paragraph()
@@ -109,97 +282,408 @@ def _add_paragraph_with_style(doc: Document, text: str, style_name: Optional[str
     return p
 
 
-def _render_markdown_to_docx(doc: Document, markdown_text: str, use_colored_bar: bool = True, bar_color=(3, 94, 99)):
+def _markdown_blocks(markdown_text: str):
     """
-    Simple markdown -> docx renderer (supports ##, ###, - list, paragraphs and **bold**).
-    Not a full markdown engine, but sufficient for our generated TCPs.
+    Tokens del Markdown de los TCP, compartidos por los dos backends:
+    ("h2" | "h3" | "li" | "p", texto). Los items "- " siguientes a otro item se toman aunque tengan sangría.
     """
     lines = markdown_text.splitlines()
     i = 0
-    list_buffer: List[str] = []
-
-    def flush_list():
-        nonlocal list_buffer
-        if not list_buffer:
-            return
-        for li in list_buffer:
-            p = doc.add_paragraph(style='List Bullet')
-            _safe_run_boldify(p, li.strip()[2:].strip())
-        list_buffer = []
-
     while i < len(lines):
         line = lines[i].rstrip()
         i += 1
         if not line:
-            flush_list()
             continue
-
-        # Heading level 2 (##)
         if line.startswith("## "):
-            flush_list()
-            heading_text = line[3:].strip()
+            yield "h2", line[3:].strip()
+        elif line.startswith("### "):
+            yield "h3", line[4:].strip()
+        elif line.startswith("- "):
+            yield "li", line.strip()[2:].strip()
+            while i < len(lines) and lines[i].lstrip().startswith("- "):
+                yield "li", lines[i].strip()[2:].strip()
+                i += 1
+        else:
+            yield "p", line
+
+
+def _render_markdown_to_docx(doc: Document, markdown_text: str, use_colored_bar: bool = True, bar_color=(3, 94, 99)):
+    """
+    Simple markdown -> docx renderer (supports ##, ###, - list, paragraphs and **bold**).
+    Not a full markdown engine, but sufficient for our generated TCPs.
+    """
+    styles = _style_table(doc)
+    list_style = styles.get('List Bullet')
+    # estilos de encabezado resueltos una vez (antes: un recorrido de doc.styles por cada ## / ###)
+    section_style = styles.get('Reda_Section')
+    title_style = 'Reda_Title' if 'Reda_Title' in styles else 'Heading 1'
+    subtitle_style = 'Reda_Subtitle' if 'Reda_Subtitle' in styles else 'Heading 2'
+
+    for kind, text in _markdown_blocks(markdown_text):
+        if kind == "h2":
             # Decide whether to render as colored bar or normal heading
             if use_colored_bar:
                 # if style 'Reda_Section' exists in template, prefer simple heading with that style
-                if any(s.name == 'Reda_Section' for s in doc.styles):
-                    p = doc.add_paragraph(style='Reda_Section')
-                    _safe_run_boldify(p, heading_text)
+                if section_style is not None:
+                    p = doc.add_paragraph(style=section_style)
+                    _safe_run_boldify(p, text)
                 else:
-                    add_colored_heading(doc, heading_text, color_rgb=bar_color)
+                    add_colored_heading(doc, text, color_rgb=bar_color)
             else:
                 # Use Reda_Title or Heading 1
-                style_name = 'Reda_Title' if any(s.name == 'Reda_Title' for s in doc.styles) else 'Heading 1'
-                _add_paragraph_with_style(doc, heading_text, style_name)
-            continue
+                _add_paragraph_with_style(doc, text, title_style, styles)
+        elif kind == "h3":
+            _add_paragraph_with_style(doc, text, subtitle_style, styles)
+        elif kind == "li":
+            if list_style is not None:
+                p = doc.add_paragraph(style=list_style)
+                _safe_run_boldify(p, text)
+            else:
+                # plantilla sin estilo de viñetas
+                p = doc.add_paragraph()
+                _safe_run_boldify(p, "• " + text)
+        else:
+            p = doc.add_paragraph()
+            _safe_run_boldify(p, text)
 
-        # Heading level 3 (###)
-        if line.startswith("### "):
-            flush_list()
-            heading_text = line[4:].strip()
-            style_name = 'Reda_Subtitle' if any(s.name == 'Reda_Subtitle' for s in doc.styles) else 'Heading 2'
-            _add_paragraph_with_style(doc, heading_text, style_name)
-            continue
 
-        # Unordered list
-        if line.startswith("- "):
-            list_buffer.append(line)
-            # keep collecting subsequent list items
-            while i < len(lines) and lines[i].lstrip().startswith("- "):
-                list_buffer.append(lines[i].rstrip())
-                i += 1
-            flush_list()
+# -----------------------
+# Backend stream: document.xml se escribe por fragmentos directo al zip de salida
+# -----------------------
+_STREAM_SENTINEL = "REDA_STREAM"
+_XML_INVALID_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_NS_DRAWING = (
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"'
+)
+_REL_IMAGE = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/image"
+
+
+class _StreamTemplate:
+    """
+    Plantilla preparada para el backend stream: el paquete (estilos, header con banner/logo, footer,
+    fuentes) como zip en memoria y document.xml partido en head/tail alrededor del contenido.
+    """
+
+    def __init__(self, doc: Document):
+        marker = "<!--REDA_CONTENT-->"
+        for para in doc.paragraphs:
+            if marker in para.text:
+                para.text = ""
+                break
+        else:
+            logger.warning("Marker %s not found in template. Appending content at the end.", marker)
+        _ensure_footer(doc)
+
+        styles = _style_table(doc)
+        self.style_ids = {name: st.style_id for name, st in styles.items()}
+        section = doc.sections[-1]
+        self.block_width = Emu(section.page_width - section.left_margin - section.right_margin).twips
+
+        body = doc.element.body
+        sect_pr = body.find(qn('w:sectPr'))
+        sentinel = etree.Comment(_STREAM_SENTINEL)
+        if sect_pr is not None:
+            sect_pr.addprevious(sentinel)
+        else:
+            body.append(sentinel)
+        buf = io.BytesIO()
+        doc.save(buf)
+        self.package = buf.getvalue()
+        with zipfile.ZipFile(io.BytesIO(self.package)) as zf:
+            document_xml = zf.read("word/document.xml")
+            self.rels_xml = zf.read("word/_rels/document.xml.rels").decode("utf-8")
+            self.content_types_xml = zf.read("[Content_Types].xml").decode("utf-8")
+        self.head, self.tail = document_xml.split(f"<!--{_STREAM_SENTINEL}-->".encode(), 1)
+
+
+_stream_cache: Dict[Tuple, _StreamTemplate] = {}
+
+
+def _stream_template(template_path: str, banner_path: Optional[str], logo_path: Optional[str],
+                     columns: Optional[int]) -> _StreamTemplate:
+    key = (os.path.abspath(template_path), os.path.getmtime(template_path), banner_path, logo_path, columns)
+    with _template_lock:
+        tpl = _stream_cache.get(key)
+    if tpl is None:
+        tpl = _StreamTemplate(load_template(template_path, banner_path, logo_path, columns))
+        with _template_lock:
+            _stream_cache[key] = tpl
+    return tpl
+
+
+def _xml_text(text: str) -> str:
+    return escape(_XML_INVALID_RE.sub("", text))
+
+
+def _run_xml(text: str, bold: bool = False, color: Optional[str] = None) -> str:
+    rpr = ""
+    if bold or color:
+        rpr = "<w:rPr>" + ("<w:b/>" if bold else "") + (f'<w:color w:val="{color}"/>' if color else "") + "</w:rPr>"
+    body = '</w:t><w:tab/><w:t xml:space="preserve">'.join(_xml_text(t) for t in text.split("\t"))
+    return f'<w:r>{rpr}<w:t xml:space="preserve">{body}</w:t></w:r>'
+
+
+def _boldify_xml(text: str) -> str:
+    if "**" not in text:
+        return _run_xml(text)
+    out = []
+    for part in _BOLD_SPLIT_RE.split(text):
+        if not part:
             continue
+        m = _BOLD_RE.match(part)
+        out.append(_run_xml(m.group(1), bold=True) if m else _run_xml(part))
+    return "".join(out)
 
-        # Regular paragraph
-        flush_list()
-        p = doc.add_paragraph()
-        _safe_run_boldify(p, line)
 
-    flush_list()
+def _paragraph_xml(runs: str, style_id: Optional[str] = None) -> str:
+    ppr = f"<w:pPr><w:pStyle w:val={quoteattr(style_id)}/></w:pPr>" if style_id else ""
+    return f"<w:p>{ppr}{runs}</w:p>"
+
+
+_PAGE_BREAK_XML = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+
+class _XmlRenderer:
+    """
+    Mismo resultado que _render_markdown_to_docx, pero como fragmentos XML (str) sin árbol de objetos.
+    images: acumula (rId, nombre en media/, bytes, content_type) de las imágenes referenciadas.
+    """
+
+    def __init__(self, tpl: _StreamTemplate, use_colored_bar: bool = True, bar_color=(3, 94, 99)):
+        ids = tpl.style_ids
+        self.tpl = tpl
+        self.use_colored_bar = use_colored_bar
+        self.bar_fill = "%02x%02x%02x" % bar_color
+        self.section_id = ids.get('Reda_Section')
+        self.title_id = ids.get('Reda_Title') or ids.get('Heading 1')
+        self.subtitle_id = ids.get('Reda_Subtitle') or ids.get('Heading 2')
+        self.list_id = ids.get('List Bullet')
+        self.images = []
+
+    def colored_heading(self, text: str) -> str:
+        w = self.tpl.block_width
+        return (
+            '<w:tbl><w:tblPr><w:tblW w:type="auto" w:w="0"/><w:jc w:val="left"/>'
+            '<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" w:lastRow="0" w:noHBand="0" '
+            'w:noVBand="1" w:val="04A0"/></w:tblPr>'
+            f'<w:tblGrid><w:gridCol w:w="{w}"/></w:tblGrid><w:tr><w:tc><w:tcPr><w:tcW w:type="dxa" w:w="{w}"/>'
+            f'<w:shd w:fill="{self.bar_fill}"/></w:tcPr>'
+            f'<w:p>{_run_xml(text.strip(), bold=True, color="FFFFFF")}</w:p></w:tc></w:tr></w:tbl>'
+        )
+
+    def markdown(self, markdown_text: str):
+        for kind, text in _markdown_blocks(markdown_text):
+            if kind == "h2":
+                if not self.use_colored_bar:
+                    yield _paragraph_xml(_boldify_xml(text), self.title_id)
+                elif self.section_id:
+                    yield _paragraph_xml(_boldify_xml(text), self.section_id)
+                else:
+                    yield self.colored_heading(text)
+            elif kind == "h3":
+                yield _paragraph_xml(_boldify_xml(text), self.subtitle_id)
+            elif kind == "li":
+                if self.list_id:
+                    yield _paragraph_xml(_boldify_xml(text), self.list_id)
+                else:
+                    yield _paragraph_xml(_boldify_xml("• " + text))
+            else:
+                yield _paragraph_xml(_boldify_xml(text))
+
+    def image(self, path: str, width=Inches(4.5)) -> str:
+        img = DocxImage.from_file(path)
+        n = len(self.images) + 1
+        rid = f"rIdReda{n}"
+        self.images.append((rid, f"reda_image{n}.{img.ext}", img.blob, img.content_type))
+        cx = int(width)
+        cy = int(round(cx * img.px_height / img.px_width)) if img.px_width else cx
+        doc_pr = 9000 + n
+        return (
+            f'<w:p><w:r><w:drawing {_NS_DRAWING}><wp:inline distT="0" distB="0" distL="0" distR="0">'
+            f'<wp:extent cx="{cx}" cy="{cy}"/><wp:docPr id="{doc_pr}" name="Picture {doc_pr}"/>'
+            '<wp:cNvGraphicFramePr><a:graphicFrameLocks noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+            '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+            f'<pic:pic><pic:nvPicPr><pic:cNvPr id="0" name={quoteattr(os.path.basename(path))}/><pic:cNvPicPr/>'
+            f'</pic:nvPicPr><pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch>'
+            f'</pic:blipFill><pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+            '<a:prstGeom prst="rect"/></pic:spPr></pic:pic></a:graphicData></a:graphic></wp:inline>'
+            '</w:drawing></w:r></w:p>'
+        )
+
+
+def _target_name(output) -> str:
+    # output_path puede ser una ruta o un archivo binario en memoria (helpers/artifacts.py)
+    return output if isinstance(output, str) else "memoria"
+
+
+def _write_docx_stream(tpl: _StreamTemplate, output_path, fragments, renderer: _XmlRenderer,
+                       flush_bytes: int = 1 << 16):
+    """
+    Copia las partes de la plantilla y escribe word/document.xml a medida que llegan los fragmentos.
+    Las imágenes (media, rels, content types) se agregan al final, cuando ya se conocen todas.
+    """
+    special = ("word/document.xml", "word/_rels/document.xml.rels", "[Content_Types].xml")
+    with zipfile.ZipFile(io.BytesIO(tpl.package)) as src, \
+            zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as dst:
+        for item in src.infolist():
+            if item.filename not in special:
+                dst.writestr(item, src.read(item.filename))
+        with dst.open("word/document.xml", "w") as fh:
+            fh.write(tpl.head)
+            pending, size = [], 0
+            for frag in fragments:
+                pending.append(frag)
+                size += len(frag)
+                if size >= flush_bytes:
+                    fh.write("".join(pending).encode("utf-8"))
+                    pending, size = [], 0
+            fh.write("".join(pending).encode("utf-8"))
+            fh.write(tpl.tail)
+
+        rels, content_types = tpl.rels_xml, tpl.content_types_xml
+        for rid, name, blob, content_type in renderer.images:
+            dst.writestr(f"word/media/{name}", blob)
+            rels = rels.replace("</Relationships>",
+                                f'<Relationship Id="{rid}" Type="{_REL_IMAGE}" Target="media/{name}"/></Relationships>')
+            ext = name.rsplit(".", 1)[-1]
+            if f'Extension="{ext}"' not in content_types:
+                content_types = content_types.replace(
+                    "</Types>", f'<Default Extension="{ext}" ContentType="{content_type}"/></Types>')
+        dst.writestr("word/_rels/document.xml.rels", rels)
+        dst.writestr("[Content_Types].xml", content_types)
+
+
+def _replace_marker_stream(template_path: str, output_path: str, content_markdown: str,
+                           banner_path: Optional[str], logo_path: Optional[str], quiz_text: Optional[str],
+                           images_map: Optional[Dict[int, List[str]]], use_colored_bar: bool,
+                           columns: Optional[int], bar_color):
+    tpl = _stream_template(template_path, banner_path, logo_path, columns)
+    renderer = _XmlRenderer(tpl, use_colored_bar=use_colored_bar, bar_color=bar_color)
+
+    def fragments():
+        yield from renderer.markdown(content_markdown)
+        yield from _extra_fragments(renderer, images_map, quiz_text)
+
+    _write_docx_stream(tpl, output_path, fragments(), renderer)
+    logger.info("Saved formatted docx to %s (stream)", _target_name(output_path))
+
+
+def _extra_fragments(renderer: _XmlRenderer, images_map: Optional[Dict[int, List[str]]], quiz_text: Optional[str]):
+    """
+    Lo que va después del contenido: imágenes por página y RedaQuiz, cada uno en página nueva.
+    """
+    if images_map:
+        yield _PAGE_BREAK_XML
+        for page_idx, imgs in images_map.items():
+            yield _paragraph_xml(_run_xml(f"Images for page {page_idx}:"))
+            for img in imgs:
+                if not os.path.exists(img):
+                    logger.warning("Image path not found in images_map: %s", img)
+                    continue
+                try:
+                    yield renderer.image(img)
+                except Exception:
+                    logger.exception("Failed inserting image %s", img)
+    if quiz_text:
+        yield _PAGE_BREAK_XML
+        yield _paragraph_xml(_boldify_xml("RedaQuiz"), renderer.section_id or renderer.tpl.style_ids.get('Heading 1'))
+        for line in quiz_text.splitlines():
+            yield _paragraph_xml(_run_xml(line) if line else "")
+
+
+class IncrementalTcp:
+    """
+    TCP armado bloque a bloque mientras el LLM procesa los siguientes: add_block() renderiza cada
+    bloque a fragmentos XML apenas llega y save() solo cose los fragmentos con la plantilla.
+    El resultado es el mismo que guardar_como_docx(merge_processed_blocks(bloques)).
+    """
+
+    def __init__(self, color: str = DEFAULT_COLOR, columnas: str = DEFAULT_COLUMNAS, use_colored_bar: bool = True):
+        template_path, banner, logo, columns = _variant(color, columnas)
+        self._tpl = _stream_template(template_path, banner, logo, columns)
+        self._renderer = _XmlRenderer(self._tpl, use_colored_bar=use_colored_bar,
+                                      bar_color=BAR_COLORS.get((color or "").strip().lower(),
+                                                               BAR_COLORS[DEFAULT_COLOR]))
+        self._fragments: Dict[int, str] = {}
+        self._lock = threading.Lock()
+
+    def add_block(self, index: int, markdown: str):
+        frag = "".join(self._renderer.markdown(markdown))
+        with self._lock:
+            self._fragments[index] = frag
+
+    def complete(self, total_blocks: int) -> bool:
+        with self._lock:
+            return all(i in self._fragments for i in range(1, total_blocks + 1))
+
+    def save(self, output_path, images_map: Optional[Dict[int, object]] = None) -> str:
+        with self._lock:
+            ordered = [self._fragments[i] for i in sorted(self._fragments)]
+
+        def fragments():
+            yield from ordered
+            yield from _extra_fragments(self._renderer, _local_images(images_map), None)
+
+        self._renderer.images = []
+        _write_docx_stream(self._tpl, output_path, fragments(), self._renderer)
+        logger.info("Saved formatted docx to %s (incremental, %s blocks)", _target_name(output_path), len(ordered))
+        return output_path
+
+
+def incremental_tcp(color: str = DEFAULT_COLOR, columnas: str = DEFAULT_COLUMNAS,
+                    words: Optional[int] = None) -> Optional[IncrementalTcp]:
+    """
+    IncrementalTcp para la orden (siempre escribe con el backend stream), o None si la plantilla falla o
+    el backend que toca es python-docx: DOCX_BACKEND=python-docx, o "auto" con menos de DOCX_STREAM_MIN_WORDS
+    palabras estimadas (words, p. ej. las de la transcripción; sin estimación se usa stream).
+    Con None el llamador usa guardar_como_docx con el TCP completo.
+    """
+    if words is not None and _backend_for_words(words, None) != "stream":
+        return None
+    if DOCX_BACKEND.lower() == "python-docx":
+        return None
+    try:
+        return IncrementalTcp(color, columnas)
+    except Exception:
+        logger.exception("No se pudo preparar el render incremental; se usará el render completo")
+        return None
+
+
+def _backend_for_words(words: int, backend: Optional[str]) -> str:
+    backend = (backend or DOCX_BACKEND).lower()
+    if backend == "auto":
+        return "stream" if words >= DOCX_STREAM_MIN_WORDS else "python-docx"
+    return backend
+
+
+def _pick_backend(content_markdown: str, backend: Optional[str]) -> str:
+    return _backend_for_words(len(content_markdown.split()), backend)
 
 
 def replace_marker_in_docx(template_path: str, output_path: str, content_markdown: str,
                           banner_path: Optional[str] = None, logo_path: Optional[str] = None,
                           quiz_text: Optional[str] = None, images_map: Optional[Dict[int, List[str]]] = None,
-                          use_colored_bar: bool = True):
+                          use_colored_bar: bool = True, columns: Optional[int] = None,
+                          bar_color=(3, 94, 99), backend: Optional[str] = None):
     """
     - template_path: plantilla .docx con un marcador <!--REDA_CONTENT--> dentro del body (puede estar en un paragraph).
-    - output_path: ruta donde guardar el docx final.
+    - output_path: ruta (o archivo binario abierto) donde guardar el docx final.
     - content_markdown: contenido (Markdown) a insertar.
     - banner_path / logo_path: rutas opcionales a imágenes (se buscan usualmente en templates/images/).
     - quiz_text: si lo pasas, se inserta en una nueva página al final con título "RedaQuiz".
     - images_map: dict page_number -> list of image paths (best-effort: will append images at the start of each section).
+    - columns: 2 para la variante a dos columnas.
+    - backend: "python-docx" | "stream" | "auto" (por defecto DOCX_BACKEND).
+    La plantilla (con banner/logo ya en el header) sale del cache de load_template.
     """
-    if not os.path.exists(template_path):
-        raise FileNotFoundError(f"Template not found: {template_path}")
+    if _pick_backend(content_markdown, backend) == "stream":
+        return _replace_marker_stream(template_path, output_path, content_markdown, banner_path, logo_path,
+                                      quiz_text, images_map, use_colored_bar, columns, bar_color)
 
-    doc = Document(template_path)
-
-    # Insert header images (best-effort)
-    try:
-        insert_header_images(doc, banner_path, logo_path)
-    except Exception:
-        logger.exception("Failed to insert header images - continuing")
+    doc = load_template(template_path, banner_path, logo_path, columns)
 
     # Find marker paragraph(s)
     marker = "<!--REDA_CONTENT-->"
@@ -227,7 +711,7 @@ def replace_marker_in_docx(template_path: str, output_path: str, content_markdow
     # Approach: create a new document, copy header/footer/sections from template, then append content.
     # Simpler: keep same doc object and append content at the marker location (we cleared it above).
     # Append content now:
-    _render_markdown_to_docx(doc, content_markdown, use_colored_bar=use_colored_bar)
+    _render_markdown_to_docx(doc, content_markdown, use_colored_bar=use_colored_bar, bar_color=bar_color)
 
     # Insert images_map if provided: best-effort append images in doc (grouped by page/section)
     if images_map:
@@ -251,8 +735,9 @@ def replace_marker_in_docx(template_path: str, output_path: str, content_markdow
     if quiz_text:
         try:
             doc.add_page_break()
-            style_name = 'Reda_Section' if any(s.name == 'Reda_Section' for s in doc.styles) else 'Heading 1'
-            _add_paragraph_with_style(doc, "RedaQuiz", style_name)
+            styles = _style_table(doc)
+            style_name = 'Reda_Section' if 'Reda_Section' in styles else 'Heading 1'
+            _add_paragraph_with_style(doc, "RedaQuiz", style_name, styles)
             # quiz as plain preformatted text paragraphs (preserve lines)
             for line in quiz_text.splitlines():
                 doc.add_paragraph(line)
@@ -260,25 +745,51 @@ def replace_marker_in_docx(template_path: str, output_path: str, content_markdow
             logger.exception("Failed inserting RedaQuiz")
 
     # Footer: ensure simple footer with RedaXion if none
-    try:
-        section = doc.sections[0]
-        footer = section.footer
-        if not footer.paragraphs or not any(p.text.strip() for p in footer.paragraphs):
-            p = footer.paragraphs[0] if footer.paragraphs else footer.add_paragraph()
-            p.text = "RedaXion"
-            p.alignment = 1  # center
-    except Exception:
-        logger.exception("Failed ensure footer")
+    _ensure_footer(doc)
 
     # Save document
     try:
         doc.save(output_path)
-        logger.info("Saved formatted docx to %s", output_path)
+        logger.info("Saved formatted docx to %s", _target_name(output_path))
     except Exception:
-        logger.exception("Failed saving document to %s", output_path)
+        logger.exception("Failed saving document to %s", _target_name(output_path))
         raise
 
 
+def _local_images(images_map: Optional[Dict[int, object]]) -> Dict[int, List[str]]:
+    """
+    page -> ruta o lista de rutas  =>  page -> rutas locales existentes (las URLs sin descargar se omiten).
+    """
+    imgs = {}
+    for page, paths in (images_map or {}).items():
+        local = [x for x in (paths if isinstance(paths, list) else [paths]) if x and os.path.exists(x)]
+        if local:
+            imgs[page] = local
+    return imgs
+
+
+def guardar_como_docx(texto: str, output_path, color: str = DEFAULT_COLOR, columnas: str = DEFAULT_COLUMNAS,
+                      images_map: Optional[Dict[int, object]] = None) -> str:
+    """
+    TCP final: plantilla según color/columnas de la orden + contenido Markdown.
+    output_path: ruta o archivo binario abierto (BytesIO) donde escribir el DOCX.
+    images_map: page -> ruta o lista de rutas locales (las que no existen se omiten).
+    """
+    template_path, banner, logo, columns = _variant(color, columnas)
+    imgs = _local_images(images_map)
+    replace_marker_in_docx(
+        template_path=template_path,
+        output_path=output_path,
+        content_markdown=texto,
+        banner_path=banner,
+        logo_path=logo,
+        images_map=imgs or None,
+        columns=columns,
+        bar_color=BAR_COLORS.get((color or "").strip().lower(), BAR_COLORS[DEFAULT_COLOR]),
+    )
+    return output_path
+
+
 # Small CLI-style helper for manual testing (local)
 if __name__ == "__main__":
     import argparse
@@ -0,0 +1,396 @@
+# helpers/formatter_pdf.py
+"""
+Render directo Markdown -> PDF, sin pasar por DOCX ni por un conversor externo.
+
+Consume el mismo subconjunto que formatter_docx (##, ###, "- " y **negrita**, vía _markdown_blocks) y
+sigue el tema de la orden: barras de sección del color (BAR_COLORS) y una o dos columnas.
+Escribe PDF 1.4 a mano con las fuentes base Helvetica / Helvetica-Bold (WinAnsiEncoding, sin
+embeber): cada página se comprime y se escribe al archivo apenas se completa, así la memoria no
+crece con el largo del TCP. Imágenes: JPEG directo; otros formatos requieren Pillow.
+Sin fuente embebida solo hay glifos para cp1252 (WinAnsi): unsupported_chars() dice si un texto
+tiene caracteres que saldrían como "?" (main.py lo convierte desde el DOCX en ese caso).
+"""
+import io
+import os
+import zlib
+import hashlib
+import logging
+from typing import Dict, List, Optional
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from helpers.formatter_docx import (
+    BAR_COLORS, DEFAULT_COLOR, DEFAULT_COLUMNAS, _BOLD_RE, _BOLD_SPLIT_RE, _local_images, _markdown_blocks,
+)
+
+logger = logging.getLogger("formatter_pdf")
+logger.setLevel(logging.INFO)
+
+PAGE_W, PAGE_H = 595.28, 841.89  # A4
+MARGIN_X, MARGIN_TOP, MARGIN_BOTTOM = 50, 64, 60
+GUTTER = 18
+BODY_SIZE, BODY_LEADING = 10.5, 14.5
+H2_SIZE, H3_SIZE = 13, 12
+IMAGE_MAX_W = 324  # 4.5", igual que en el DOCX
+PDF_ZLIB_LEVEL = int(os.getenv("PDF_ZLIB_LEVEL", "9"))
+
+# Anchos AFM (1/1000 em) de Helvetica y Helvetica-Bold para ASCII 32..126
+_ASCII_W = (
+    "278 278 355 556 556 889 667 191 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 556 556 "
+    "278 278 584 584 584 556 1015 667 667 722 722 667 611 778 722 278 500 667 556 833 722 778 667 778 722 667 "
+    "611 722 667 944 667 667 611 278 278 278 469 556 333 556 556 500 556 556 278 556 556 222 222 500 222 833 "
+    "556 556 556 556 333 500 278 556 500 722 500 500 500 334 260 334 584"
+)
+_ASCII_W_BOLD = (
+    "278 333 474 556 556 889 722 238 333 333 389 584 278 333 278 278 556 556 556 556 556 556 556 556 556 556 "
+    "333 333 584 584 584 611 975 722 722 722 722 667 611 778 722 278 556 722 611 833 722 778 667 778 722 667 "
+    "611 722 667 944 667 667 611 333 278 333 584 556 333 556 611 556 611 556 333 611 611 278 278 556 278 889 "
+    "611 611 611 611 389 556 333 611 556 778 556 556 500 389 280 389 584"
+)
+# Fuera de ASCII: la letra base (á -> a), salvo los casos donde el glifo tiene ancho propio
+_EXTRA_W = {"í": 278, "ì": 278, "ï": 278, "î": 278, "Í": 278, "¿": 611, "¡": 333, "•": 350, "–": 556,
+            "—": 1000, "…": 1000, "“": 333, "”": 333, "‘": 222, "’": 222, "«": 556, "»": 556, "°": 400}
+_EXTRA_W_BOLD = dict(_EXTRA_W, **{"“": 500, "”": 500, "‘": 278, "’": 278})
+_BASE = str.maketrans("áàäâÁÀÄÂéèëêÉÈËÊóòöôÓÒÖÔúùüûÚÙÜÛñÑçÇ", "aaaaAAAAeeeeEEEEooooOOOOuuuuUUUUnNcC")
+
+
+def _width_table(ascii_widths: str, extra: Dict[str, int]) -> Dict[str, int]:
+    table = {chr(32 + i): int(w) for i, w in enumerate(ascii_widths.split())}
+    table.update(extra)
+    return table
+
+
+_WIDTHS = {False: _width_table(_ASCII_W, _EXTRA_W), True: _width_table(_ASCII_W_BOLD, _EXTRA_W_BOLD)}
+
+
+def text_width(text: str, size: float, bold: bool = False) -> float:
+    table = _WIDTHS[bold]
+    total = 0
+    for ch in text:
+        w = table.get(ch)
+        if w is None:
+            w = table.get(ch.translate(_BASE), 556)
+        total += w
+    return total * size / 1000.0
+
+
+def unsupported_chars(text: str) -> List[str]:
+    """
+    Caracteres del texto fuera de WinAnsi (griego, símbolos matemáticos, emoji...): el render nativo
+    los reemplaza por "?".
+    """
+    try:
+        text.encode("cp1252")
+        return []
+    except UnicodeEncodeError:
+        pass
+    missing = set()
+    for ch in set(text):
+        try:
+            ch.encode("cp1252")
+        except UnicodeEncodeError:
+            missing.add(ch)
+    return sorted(missing)
+
+
+def _pdf_string(text: str) -> bytes:
+    raw = text.encode("cp1252", "replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _rgb(color) -> str:
+    return "%.3f %.3f %.3f" % tuple(c / 255.0 for c in color)
+
+
+class _PdfFile:
+    """
+    Escritor incremental: objetos directo al archivo, xref al cerrar.
+    Ids fijos: 1 catálogo, 2 árbol de páginas, 3/4 fuentes.
+    """
+
+    def __init__(self, path):
+        # ruta o archivo binario ya abierto (BytesIO); este último no se cierra al terminar
+        self.own = isinstance(path, str)
+        self.fh = open(path, "wb") if self.own else path
+        self.offsets: Dict[int, int] = {}
+        self.next_id = 5
+        self.kids: List[int] = []
+        self.images: Dict[str, int] = {}  # sha1 del JPEG -> objeto (la misma imagen se embebe una vez)
+        self.fh.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def new_id(self) -> int:
+        self.next_id += 1
+        return self.next_id - 1
+
+    def write_obj(self, obj_id: int, body: bytes):
+        self.offsets[obj_id] = self.fh.tell()
+        self.fh.write(b"%d 0 obj\n" % obj_id + body + b"\nendobj\n")
+
+    def write_stream(self, obj_id: int, data: bytes, extra: bytes = b""):
+        self.write_obj(obj_id, b"<< /Length %d %s>>\nstream\n" % (len(data), extra) + data + b"\nendstream")
+
+    def add_page(self, content: bytes, xobjects: Dict[str, int]):
+        content_id, page_id = self.new_id(), self.new_id()
+        self.write_stream(content_id, zlib.compress(content, PDF_ZLIB_LEVEL), b"/Filter /FlateDecode ")
+        xobj = b"".join(b"/%s %d 0 R " % (name.encode(), oid) for name, oid in xobjects.items())
+        self.write_obj(page_id, (
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %.2f %.2f] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> /XObject << %s>> >> >>"
+            % (PAGE_W, PAGE_H, content_id, xobj)))
+        self.kids.append(page_id)
+
+    def add_jpeg(self, data: bytes, width: int, height: int, components: int) -> int:
+        digest = hashlib.sha1(data).hexdigest()
+        if digest in self.images:
+            return self.images[digest]
+        obj_id = self.images[digest] = self.new_id()
+        space = {1: b"/DeviceGray", 3: b"/DeviceRGB"}[components]
+        self.write_stream(obj_id, data, b"/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s "
+                                        b"/BitsPerComponent 8 /Filter /DCTDecode " % (width, height, space))
+        return obj_id
+
+    def close(self):
+        for font_id, name in ((3, b"Helvetica"), (4, b"Helvetica-Bold")):
+            self.write_obj(font_id, b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % name)
+        kids = b" ".join(b"%d 0 R" % k for k in self.kids)
+        self.write_obj(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.kids)))
+        self.write_obj(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        xref = self.fh.tell()
+        size = self.next_id
+        self.fh.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for obj_id in range(1, size):
+            self.fh.write(b"%010d 00000 n \n" % self.offsets.get(obj_id, 0))
+        self.fh.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (size, xref))
+        if self.own:
+            self.fh.close()
+
+
+def _jpeg_info(data: bytes):
+    """
+    (ancho, alto, componentes) leyendo el marcador SOF; None si no es un JPEG utilizable.
+    """
+    if not data.startswith(b"\xff\xd8"):
+        return None
+    i = 2
+    while i + 9 < len(data):
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker in (0xC0, 0xC1, 0xC2):
+            height = int.from_bytes(data[i + 5:i + 7], "big")
+            width = int.from_bytes(data[i + 7:i + 9], "big")
+            return width, height, data[i + 9]
+        i += 2 + int.from_bytes(data[i + 2:i + 4], "big")
+    return None
+
+
+def _load_jpeg(path: str):
+    with open(path, "rb") as fh:
+        data = fh.read()
+    info = _jpeg_info(data)
+    if info and info[2] in (1, 3):
+        return data, info
+    if Image is None:
+        logger.warning("Imagen %s omitida en el PDF (no es JPEG RGB y no hay Pillow)", path)
+        return None
+    with Image.open(io.BytesIO(data)) as img:
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            bg = Image.new("RGB", img.size, (255, 255, 255))
+            bg.paste(img, mask=img.split()[-1])
+            img = bg
+        out = io.BytesIO()
+        img.convert("RGB").save(out, "JPEG", quality=85)
+    data = out.getvalue()
+    return data, _jpeg_info(data)
+
+
+class _Layout:
+    """
+    Cursor de página/columna. Cada página terminada se escribe al archivo y se descarta.
+    """
+
+    def __init__(self, pdf: _PdfFile, columns: int, bar_color):
+        self.pdf = pdf
+        self.columns = columns
+        self.bar_color = bar_color
+        self.col_w = (PAGE_W - 2 * MARGIN_X - (columns - 1) * GUTTER) / columns
+        self.page_no = 0
+        self.ops: List[str] = []
+        self.xobjects: Dict[str, int] = {}
+        self.col = 0
+        self.y = 0.0
+        self._new_page()
+
+    @property
+    def x(self) -> float:
+        return MARGIN_X + self.col * (self.col_w + GUTTER)
+
+    def _new_page(self):
+        self.page_no += 1
+        self.ops, self.xobjects = [], {}
+        self.col = 0
+        self.y = PAGE_H - MARGIN_TOP
+        # franja del color del tema arriba, pie "RedaXion" y número de página
+        self.ops.append(f"{_rgb(self.bar_color)} rg 0 {PAGE_H - 18:.2f} {PAGE_W:.2f} 18 re f")
+        footer = "RedaXion"
+        self.ops.append(f"0.45 0.45 0.45 rg BT /F1 9 Tf {(PAGE_W - text_width(footer, 9)) / 2:.2f} 30 Td "
+                        f"{_pdf_string(footer).decode('latin-1')} Tj ET")
+        num = str(self.page_no)
+        self.ops.append(f"BT /F1 9 Tf {PAGE_W - MARGIN_X - text_width(num, 9):.2f} 30 Td "
+                        f"{_pdf_string(num).decode('latin-1')} Tj ET")
+
+    def flush_page(self):
+        self.pdf.add_page("\n".join(self.ops).encode("latin-1"), self.xobjects)
+        self.ops = []
+
+    def next_column(self):
+        if self.col + 1 < self.columns:
+            self.col += 1
+            self.y = PAGE_H - MARGIN_TOP
+        else:
+            self.flush_page()
+            self._new_page()
+
+    def page_break(self):
+        if self.col == 0 and self.y == PAGE_H - MARGIN_TOP:
+            return
+        self.flush_page()
+        self._new_page()
+
+    def ensure(self, height: float):
+        if self.y - height < MARGIN_BOTTOM and self.y < PAGE_H - MARGIN_TOP:
+            self.next_column()
+
+    @staticmethod
+    def _runs(text: str, bold_markup: bool = True):
+        if not bold_markup or "**" not in text:
+            return [(text, False)]
+        runs = []
+        for part in _BOLD_SPLIT_RE.split(text):
+            if not part:
+                continue
+            m = _BOLD_RE.match(part)
+            runs.append((m.group(1), True) if m else (part, False))
+        return runs
+
+    def _wrap(self, runs, size: float, width: float, force_bold: bool = False):
+        """
+        Líneas como listas de (palabra, bold); respeta los cambios de fuente dentro de la línea.
+        """
+        lines, line, line_w = [], [], 0.0
+        for text, bold in runs:
+            bold = bold or force_bold
+            for word in text.split():
+                w = text_width(word, size, bold)
+                space = text_width(" ", size, bold) if line else 0.0
+                if line and line_w + space + w > width:
+                    lines.append(line)
+                    line, line_w, space = [], 0.0, 0.0
+                line.append((word, bold))
+                line_w += space + w
+        if line:
+            lines.append(line)
+        return lines
+
+    def _draw_line(self, line, x: float, y: float, size: float, color: str = "0 0 0"):
+        parts = [f"{color} rg BT"]
+        cursor = x
+        for i, (word, bold) in enumerate(line):
+            if i:
+                cursor += text_width(" ", size, bold)
+            parts.append(f"/{'F2' if bold else 'F1'} {size} Tf 1 0 0 1 {cursor:.2f} {y:.2f} Tm "
+                         f"{_pdf_string(word).decode('latin-1')} Tj")
+            cursor += text_width(word, size, bold)
+        parts.append("ET")
+        self.ops.append(" ".join(parts))
+
+    def text_block(self, text: str, size: float = BODY_SIZE, leading: float = BODY_LEADING, indent: float = 0,
+                   bullet: bool = False, bold: bool = False, color: str = "0 0 0", space_after: float = 6,
+                   bold_markup: bool = True):
+        lines = self._wrap(self._runs(text, bold_markup), size, self.col_w - indent, force_bold=bold)
+        for i, line in enumerate(lines):
+            self.ensure(leading)
+            self.y -= leading
+            if bullet and i == 0:
+                self._draw_line([("•", False)], self.x + indent - 10, self.y, size, color)
+            self._draw_line(line, self.x + indent, self.y, size, color)
+        self.y -= space_after
+
+    def section_bar(self, text: str):
+        lines = self._wrap([(text, True)], H2_SIZE, self.col_w - 16)
+        leading, pad = H2_SIZE * 1.3, 6
+        height = len(lines) * leading + 2 * pad
+        self.ensure(height + BODY_LEADING * 4)  # no dejar la barra sola al pie de la columna
+        self.y -= 4
+        self.ops.append(f"{_rgb(self.bar_color)} rg {self.x:.2f} {self.y - height:.2f} {self.col_w:.2f} {height:.2f} re f")
+        y = self.y - pad
+        for line in lines:
+            y -= leading
+            self._draw_line(line, self.x + 8, y + 3, H2_SIZE, "1 1 1")
+        self.y -= height + 8
+
+    def image(self, path: str):
+        loaded = _load_jpeg(path)
+        if not loaded or not loaded[1]:
+            return
+        data, (w, h, comps) = loaded
+        width = min(self.col_w, IMAGE_MAX_W)
+        height = width * h / w
+        max_h = PAGE_H - MARGIN_TOP - MARGIN_BOTTOM
+        if height > max_h:
+            width, height = width * max_h / height, max_h
+        self.ensure(height + 6)
+        obj_id = self.pdf.add_jpeg(data, w, h, comps)
+        name = f"Im{obj_id}"
+        self.xobjects[name] = obj_id
+        self.y -= height
+        self.ops.append(f"q {width:.2f} 0 0 {height:.2f} {self.x:.2f} {self.y:.2f} cm /{name} Do Q")
+        self.y -= 6
+
+
+def guardar_como_pdf(texto: str, output_path, color: str = DEFAULT_COLOR, columnas: str = DEFAULT_COLUMNAS,
+                     images_map: Optional[Dict[int, object]] = None) -> str:
+    """
+    PDF del TCP (o del quiz en Markdown) con el tema de la orden. output_path e images_map como en
+    guardar_como_docx (ruta o BytesIO).
+    """
+    color = (color or DEFAULT_COLOR).strip().lower()
+    columns = 2 if (columnas or DEFAULT_COLUMNAS).strip().lower() == "doble" else 1
+    bar_color = BAR_COLORS.get(color, BAR_COLORS[DEFAULT_COLOR])
+    theme = _rgb(bar_color)
+
+    pdf = _PdfFile(output_path)
+    try:
+        layout = _Layout(pdf, columns, bar_color)
+        for kind, text in _markdown_blocks(texto):
+            if kind == "h2":
+                layout.section_bar(text)
+            elif kind == "h3":
+                layout.ensure(H3_SIZE * 1.4 + BODY_LEADING * 2)
+                layout.y -= 4
+                layout.text_block(text, size=H3_SIZE, leading=H3_SIZE * 1.35, bold=True, color=theme, space_after=4)
+            elif kind == "li":
+                layout.text_block(text, indent=14, bullet=True, space_after=2)
+            else:
+                layout.text_block(text)
+
+        imgs = _local_images(images_map)
+        if imgs:
+            layout.page_break()
+            for page_idx, paths in imgs.items():
+                layout.text_block(f"Images for page {page_idx}:")
+                for path in paths:
+                    try:
+                        layout.image(path)
+                    except Exception:
+                        logger.exception("Failed inserting image %s", path)
+        layout.flush_page()
+    finally:
+        pdf.close()
+    logger.info("Saved PDF to %s (%s pages)", output_path if pdf.own else "memoria", len(pdf.kids))
+    return output_path
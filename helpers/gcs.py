@@ -1,10 +1,15 @@
 # helpers/gcs.py
 import os
 import json
+import unicodedata
+from urllib.parse import quote
 from google.cloud import storage
 from google.oauth2 import service_account
 from datetime import timedelta
 
+from helpers import deadline
+from helpers.metrics import track_external
+
 def _get_client():
     creds_json = os.getenv("GCS_CREDENTIALS_JSON")
     if not creds_json:
@@ -13,6 +18,7 @@ def _get_client():
     creds = service_account.Credentials.from_service_account_info(info)
     return storage.Client(credentials=creds, project=info.get("project_id"))
 
+@track_external("gcs", "upload")
 def upload_to_gcs(local_path: str, filename: str) -> str:
     """
     Sube local_path al bucket y retorna una URL firmada (v4) válida 7 días.
@@ -24,8 +30,40 @@ def upload_to_gcs(local_path: str, filename: str) -> str:
     client = _get_client()
     bucket = client.bucket(bucket_name)
     blob = bucket.blob(filename)
-    blob.upload_from_filename(local_path, content_type="audio/mpeg")
+    blob.upload_from_filename(local_path, content_type="audio/mpeg", timeout=deadline.timeout(60, "gcs.upload"))
 
     # Generar URL firmada (7 días)
     url = blob.generate_signed_url(version="v4", expiration=timedelta(days=7), method="GET")
     return url
+
+def _content_disposition(filename: str) -> str:
+    """
+    attachment con filename ASCII (para clientes viejos) y filename* UTF-8 (RFC 5987): "RedaXion - Nº12.pdf"
+    llega con su nombre real y las comillas o ; del nombre no rompen el header.
+    """
+    ascii_name = unicodedata.normalize("NFKD", filename).encode("ascii", "ignore").decode("ascii")
+    ascii_name = "".join(c if c.isprintable() and c not in '"\\' else "_" for c in ascii_name)
+    stem, dot, ext = ascii_name.rpartition(".")
+    if not (stem if dot else ext).strip():
+        ascii_name = f"download.{ext}" if dot else "download"
+    return f'attachment; filename="{ascii_name}"; filename*=UTF-8\'\'{quote(filename, safe="")}'
+
+@track_external("gcs", "upload")
+def upload_for_download(source, blob_name: str, filename: str, expiration: timedelta,
+                        content_type: str = "application/octet-stream") -> str:
+    """
+    Sube un entregable (ruta local o bytes) y retorna una URL firmada (v4) de descarga que vence en `expiration`.
+    La URL fuerza la descarga con el nombre `filename`.
+    """
+    bucket_name = os.getenv("GCS_BUCKET")
+    if not bucket_name:
+        raise RuntimeError("GCS_BUCKET no configurado")
+
+    blob = _get_client().bucket(bucket_name).blob(blob_name)
+    timeout = deadline.timeout(120, "gcs.upload")
+    if isinstance(source, str):
+        blob.upload_from_filename(source, content_type=content_type, timeout=timeout)
+    else:
+        blob.upload_from_string(bytes(source), content_type=content_type, timeout=timeout)
+    return blob.generate_signed_url(version="v4", expiration=expiration, method="GET",
+                                    response_disposition=_content_disposition(filename))
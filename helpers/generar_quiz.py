@@ -1,7 +1,8 @@
 # helpers/generar_quiz.py
 import os
+import re
 import logging
-from typing import Optional
+from typing import Optional, List, Dict
 
 logger = logging.getLogger("generar_quiz")
 logger.setLevel(logging.INFO)
@@ -16,6 +17,9 @@ else:
     OPENAI_MODEL = _raw_model
 
 # intentamos importar el wrapper centralizado (helpers/openai_client.py)
+from helpers.circuit import CircuitOpen
+from helpers.deadline import DeadlineExceeded
+
 try:
     from helpers.openai_client import chat_completion
 except Exception as e:
@@ -89,6 +93,8 @@ def generar_quiz_from_text(content: str,
 
         return text
 
+    except (DeadlineExceeded, CircuitOpen):
+        raise
     except Exception as e:
         logger.exception("Error generando quiz: %s", e)
         # En caso de fallo, devolver un mensaje claro en vez de None
@@ -103,3 +109,67 @@ def generar_quiz_from_text(content: str,
             except Exception:
                 logger.exception("No se pudo guardar artifact de error")
         return fallback
+
+
+# Patrones del formato pedido en QUIZ_PROMPT_TEMPLATE ("1) Pregunta", "A) ...", solucionario "1) B - ...")
+_SOLUCIONARIO_RE = re.compile(r"^\s*[#*_\s]*solucionario", re.IGNORECASE)
+_QUESTION_RE = re.compile(r"^\s*\**(\d{1,2})\s*[\).:-]\s*\**\s*(.+?)\s*$")
+_OPTION_RE = re.compile(r"^\s*\**([A-Ea-e])\s*[\).:-]\s*\**\s*(.+?)\s*$")
+_ANSWER_RE = re.compile(
+    r"^\s*\**(\d{1,2})\s*[\).:-]?\s*\**\s*(?:respuesta(?:\s+correcta)?\s*[:=-]?\s*)?\(?([A-Ea-e])\)?(?![A-Za-z])[\s\).:\-\u2013\u2014*]*(.*)$",
+    re.IGNORECASE,
+)
+
+
+def parse_quiz_text(text: str) -> List[Dict]:
+    """
+    Convierte la salida de generar_quiz_from_text en la lista estructurada que usa main
+    (questions_by_page): [{"question", "options", "answer", "justification"}, ...].
+    Tolerante a variaciones menores (1. / 1), negritas markdown, "Respuesta: B").
+    Devuelve [] si el texto es un fallback de error o no se reconoce ninguna pregunta.
+    """
+    if not text or text.startswith("ERROR:"):
+        return []
+
+    lines = text.splitlines()
+    split_at = next((i for i, l in enumerate(lines) if _SOLUCIONARIO_RE.match(l)), None)
+    question_lines = lines if split_at is None else lines[:split_at]
+    answer_lines = [] if split_at is None else lines[split_at + 1:]
+
+    questions: Dict[int, Dict] = {}
+    current = None
+    for line in question_lines:
+        if not line.strip():
+            continue
+        m_opt = _OPTION_RE.match(line)
+        if m_opt and current is not None:
+            current["options"].append(f"{m_opt.group(1).upper()}) {m_opt.group(2).strip('* ')}")
+            continue
+        m_q = _QUESTION_RE.match(line)
+        if m_q:
+            num = int(m_q.group(1))
+            if num in questions:
+                # sin encabezado "Solucionario": la numeración se repite en las respuestas
+                answer_lines.append(line)
+                current = None
+                continue
+            current = {"question": m_q.group(2).strip("* "), "options": [], "answer": "", "justification": ""}
+            questions[num] = current
+            continue
+        if current is not None and not current["options"]:
+            # pregunta multilínea
+            current["question"] += " " + line.strip()
+        elif current is None and questions:
+            answer_lines.append(line)
+
+    last = None
+    for line in answer_lines:
+        m_a = _ANSWER_RE.match(line)
+        if m_a and int(m_a.group(1)) in questions:
+            last = questions[int(m_a.group(1))]
+            last["answer"] = m_a.group(2).upper()
+            last["justification"] = m_a.group(3).strip("* ")
+        elif last is not None and line.strip() and not last["justification"]:
+            last["justification"] = line.strip()
+
+    return [questions[k] for k in sorted(questions) if questions[k]["options"]]
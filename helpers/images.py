@@ -0,0 +1,268 @@
+# helpers/images.py
+"""
+Imágenes del TCP: búsqueda (fuente enchufable), descarga concurrente, reducción a resolución
+de impresión y cache en disco por hash de contenido.
+
+- Fuente: IMAGE_SOURCE = "" (sin imágenes, por defecto) | "placeholder" | "paquete.modulo:funcion".
+  Una fuente es fn(title, subtitle) -> URL o ruta local (o None). set_source() la reemplaza en código.
+- prepare_images(images_map) descarga/lee todas las imágenes en paralelo (IMAGE_MAX_WORKERS) antes
+  del render y devuelve page -> [rutas locales optimizadas]. Una imagen que falla se omite.
+- Optimización (requiere Pillow): se reduce a IMAGE_MAX_PX de ancho (4.5" a 200 dpi en el DOCX) y se
+  recomprime a JPEG (PNG si tiene transparencia). Sin Pillow se guarda el original.
+- Cache: IMAGE_CACHE_DIR/{sha256 del original}.{jpg|png}; el mismo diagrama, venga de la URL que venga,
+  se optimiza una sola vez. urls/{sha1 de la URL} apunta al hash para no volver a descargar.
+  Acotada a IMAGE_CACHE_MAX_BYTES con LRU por mtime (cada uso la renueva); no se borra nada usado en
+  la última IMAGE_CACHE_MIN_AGE (las órdenes en curso siguen encontrando sus imágenes).
+"""
+import os
+import io
+import time
+import hashlib
+import logging
+import importlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from helpers import deadline
+from helpers.metrics import external_call
+
+logger = logging.getLogger("images")
+logger.setLevel(logging.INFO)
+
+IMAGE_SOURCE = os.getenv("IMAGE_SOURCE", "")
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "/tmp/redaxion_images")
+IMAGE_MAX_WORKERS = int(os.getenv("IMAGE_MAX_WORKERS", "8"))
+IMAGE_FETCH_TIMEOUT = int(os.getenv("IMAGE_FETCH_TIMEOUT", "20"))
+IMAGE_MAX_DOWNLOAD_BYTES = int(os.getenv("IMAGE_MAX_DOWNLOAD_BYTES", str(20 * 1024 * 1024)))
+IMAGE_MAX_PX = int(os.getenv("IMAGE_MAX_PX", "900"))
+IMAGE_JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", "80"))
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))  # 0 = sin límite
+IMAGE_CACHE_MIN_AGE = int(os.getenv("IMAGE_CACHE_MIN_AGE", "3600"))
+
+if Image is None:
+    logger.warning("Pillow no instalado: las imágenes se insertan sin reducir.")
+
+
+def _placeholder_source(title: str, subtitle: str = "") -> str:
+    query = f"{title} {subtitle}".strip()
+    return f"https://via.placeholder.com/1200x800.png?text={query.replace(' ', '+')}"
+
+
+_SOURCES = {"placeholder": _placeholder_source}
+_source: Optional[Callable] = None
+
+
+def set_source(fn: Optional[Callable]):
+    global _source
+    _source = fn
+
+
+def _resolve_source() -> Optional[Callable]:
+    if _source is not None:
+        return _source
+    if IMAGE_SOURCE in _SOURCES:
+        return _SOURCES[IMAGE_SOURCE]
+    if ":" in IMAGE_SOURCE:
+        module, func = IMAGE_SOURCE.split(":", 1)
+        return getattr(importlib.import_module(module), func)
+    return None
+
+
+def search(title: str, subtitle: str = "") -> Optional[str]:
+    """
+    URL o ruta de la imagen para un tema según la fuente configurada; None si no hay fuente o falla.
+    """
+    try:
+        source = _resolve_source()
+        return source(title, subtitle) if source else None
+    except Exception:
+        logger.exception("Fuente de imágenes falló para %r", title)
+        return None
+
+
+def _touch(path: str):
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def _cache_path(content_hash: str) -> Optional[str]:
+    for ext in ("jpg", "png", "gif"):
+        path = os.path.join(IMAGE_CACHE_DIR, f"{content_hash}.{ext}")
+        if os.path.exists(path):
+            _touch(path)
+            return path
+    return None
+
+
+_prune_lock = threading.Lock()
+
+
+def _prune_cache():
+    """
+    Borra las entradas menos usadas (mtime más antiguo) hasta quedar bajo el 90% de IMAGE_CACHE_MAX_BYTES.
+    """
+    if IMAGE_CACHE_MAX_BYTES <= 0 or not _prune_lock.acquire(blocking=False):
+        return
+    try:
+        entries, total = [], 0
+        for folder in (IMAGE_CACHE_DIR, os.path.join(IMAGE_CACHE_DIR, "urls")):
+            try:
+                it = os.scandir(folder)
+            except FileNotFoundError:
+                continue
+            with it:
+                for entry in it:
+                    if entry.is_file() and not entry.name.endswith(".tmp"):
+                        st = entry.stat()
+                        entries.append((st.st_mtime, st.st_size, entry.path))
+                        total += st.st_size
+        if total <= IMAGE_CACHE_MAX_BYTES:
+            return
+        target, cutoff, removed = IMAGE_CACHE_MAX_BYTES * 0.9, time.time() - IMAGE_CACHE_MIN_AGE, 0
+        for mtime, size, path in sorted(entries):
+            if total <= target or mtime > cutoff:
+                break
+            try:
+                os.remove(path)
+                total -= size
+                removed += 1
+            except OSError:
+                pass
+        logger.info("Cache de imágenes: %s archivos eliminados, quedan %s MB", removed, total // (1024 * 1024))
+    finally:
+        _prune_lock.release()
+
+
+def _url_index_path(url: str) -> str:
+    return os.path.join(IMAGE_CACHE_DIR, "urls", hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+
+def _atomic_write(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(data)
+    os.replace(tmp, path)
+
+
+def _sniff_ext(raw: bytes) -> str:
+    if raw.startswith(b"\x89PNG"):
+        return "png"
+    if raw[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    return "jpg"
+
+
+def _optimize(raw: bytes):
+    """
+    (bytes, ext) reducidos a IMAGE_MAX_PX de ancho; el original si no hay Pillow o no se gana nada.
+    """
+    if Image is None:
+        return raw, _sniff_ext(raw)
+    with Image.open(io.BytesIO(raw)) as img:
+        img.load()
+        resized = img.width > IMAGE_MAX_PX
+        if resized:
+            img = img.resize((IMAGE_MAX_PX, max(1, round(img.height * IMAGE_MAX_PX / img.width))), Image.LANCZOS)
+        out = io.BytesIO()
+        has_alpha = img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info)
+        if has_alpha:
+            img.save(out, "PNG", optimize=True)
+            ext = "png"
+        else:
+            img.convert("RGB").save(out, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+            ext = "jpg"
+    data = out.getvalue()
+    if not resized and len(data) >= len(raw):
+        return raw, _sniff_ext(raw)
+    return data, ext
+
+
+def _store(raw: bytes) -> str:
+    content_hash = hashlib.sha256(raw).hexdigest()
+    path = _cache_path(content_hash)
+    if path:
+        return path
+    data, ext = _optimize(raw)
+    path = os.path.join(IMAGE_CACHE_DIR, f"{content_hash}.{ext}")
+    _atomic_write(path, data)
+    logger.info("Imagen optimizada %s KB -> %s KB (%s)", len(raw) // 1024, len(data) // 1024, os.path.basename(path))
+    try:
+        _prune_cache()
+    except Exception:
+        logger.exception("No se pudo podar la cache de imágenes (no crítico)")
+    return path
+
+
+def _download(url: str) -> bytes:
+    with external_call("images", "fetch"):
+        # with: la conexión se libera también cuando cortamos una descarga demasiado grande
+        with requests.get(url, stream=True, timeout=deadline.timeout(IMAGE_FETCH_TIMEOUT, "image_fetch")) as resp:
+            resp.raise_for_status()
+            chunks, size = [], 0
+            for chunk in resp.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > IMAGE_MAX_DOWNLOAD_BYTES:
+                    raise ValueError(f"Imagen supera {IMAGE_MAX_DOWNLOAD_BYTES} bytes: {url}")
+                chunks.append(chunk)
+            return b"".join(chunks)
+
+
+def get_image(ref: str) -> Optional[str]:
+    """
+    Ruta local optimizada para una URL o ruta; None si no se pudo obtener (las imágenes son best-effort).
+    """
+    try:
+        if os.path.exists(ref):
+            with open(ref, "rb") as fh:
+                return _store(fh.read())
+        if not ref.startswith(("http://", "https://")):
+            logger.warning("Referencia de imagen no válida: %s", ref)
+            return None
+        index = _url_index_path(ref)
+        if os.path.exists(index):
+            with open(index, "r", encoding="utf-8") as fh:
+                cached = _cache_path(fh.read().strip())
+            if cached:
+                return cached
+        raw = _download(ref)
+        path = _store(raw)
+        _atomic_write(index, hashlib.sha256(raw).hexdigest().encode("utf-8"))
+        return path
+    except Exception as e:
+        logger.warning("No se pudo obtener la imagen %s: %s", ref, e)
+        return None
+
+
+def prepare_images(images_map: Dict[int, object]) -> Dict[int, List[str]]:
+    """
+    page -> URL/ruta (o lista) => page -> [rutas locales optimizadas], todo en paralelo y antes del render.
+    """
+    items = []
+    for page, refs in (images_map or {}).items():
+        for ref in (refs if isinstance(refs, list) else [refs]):
+            if ref:
+                items.append((page, ref))
+    if not items:
+        return {}
+    unique = list(dict.fromkeys(ref for _, ref in items))  # la misma URL en varias páginas se baja una vez
+    with ThreadPoolExecutor(max_workers=max(1, min(IMAGE_MAX_WORKERS, len(unique))),
+                            thread_name_prefix="images") as pool:
+        futures = {ref: pool.submit(contextvars.copy_context().run, get_image, ref) for ref in unique}
+        result: Dict[int, List[str]] = {}
+        for page, ref in items:
+            path = futures[ref].result()
+            if path:
+                result.setdefault(page, []).append(path)
+    return result
@@ -0,0 +1,293 @@
+# helpers/local_queue.py
+"""
+Cola local durable (SQLite) para despliegues sin Redis.
+
+Reemplaza el "un thread por orden" de helpers.queue:
+- Los jobs se guardan en SQLite antes de responder el webhook: un reinicio no los pierde.
+- Un pool fijo de LOCAL_QUEUE_WORKERS threads los consume: concurrencia y memoria acotadas.
+- Cada job tomado queda con un lease (visibility timeout) que el worker renueva mientras corre;
+  si el proceso muere, el lease vence y otro worker lo retoma.
+- Un job que levanta excepción se reintenta con backoff hasta max_attempts; luego queda 'failed'
+  (misma política que el Retry de las colas RQ: helpers.queue.MAX_ATTEMPTS / retry_delay).
+- Misma semántica de prioridad que las colas RQ: express antes que standard antes que retry,
+  y dentro de standard shortest-job-first con aging (helpers.queue.sjf_score).
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import importlib
+import threading
+import traceback
+from contextlib import closing
+from typing import Optional
+
+from helpers.queue import MAX_ATTEMPTS, SJF_AGING, SJF_DEFAULT_DURATION, retry_delay
+
+logger = logging.getLogger("local_queue")
+logger.setLevel(logging.INFO)
+
+LOCAL_QUEUE_PATH = os.getenv("LOCAL_QUEUE_PATH", "redaxion_jobs.sqlite3")
+LOCAL_QUEUE_WORKERS = int(os.getenv("LOCAL_QUEUE_WORKERS", "2"))
+VISIBILITY_TIMEOUT = int(os.getenv("LOCAL_QUEUE_VISIBILITY_TIMEOUT", "300"))
+POLL_INTERVAL = 2
+PRIORITIES = {"express": 0, "standard": 1, "retry": 2}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id            INTEGER PRIMARY KEY AUTOINCREMENT,
+    func          TEXT NOT NULL,
+    args          TEXT NOT NULL,
+    kwargs        TEXT NOT NULL,
+    status        TEXT NOT NULL DEFAULT 'queued',
+    priority      INTEGER NOT NULL DEFAULT 1,
+    duration      REAL,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    max_attempts  INTEGER NOT NULL,
+    available_at  REAL NOT NULL,
+    lease_owner   TEXT,
+    lease_expires REAL,
+    enqueued_at   REAL NOT NULL,
+    finished_at   REAL,
+    last_error    TEXT
+);
+"""
+_INDEX = "CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (status, priority, available_at)"
+# columnas agregadas después de la primera versión (bases existentes)
+_MIGRATIONS = {"priority": "INTEGER NOT NULL DEFAULT 1", "duration": "REAL"}
+
+
+class LocalQueue:
+    def __init__(self, path: str = LOCAL_QUEUE_PATH):
+        self.path = path
+        with closing(self._connect()) as conn:
+            conn.executescript(_SCHEMA)
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for name, decl in _MIGRATIONS.items():
+                if name not in columns:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {decl}")
+                    conn.execute("DROP INDEX IF EXISTS jobs_ready")
+            conn.execute(_INDEX)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def enqueue(self, func: str, *args, priority: str = "standard", duration: Optional[float] = None,
+                delay: float = 0, max_attempts: int = MAX_ATTEMPTS, **kwargs) -> int:
+        return self.enqueue_many(func, [(args, kwargs)], priority=priority, durations=[duration], delay=delay,
+                                 max_attempts=max_attempts)[0]
+
+    def enqueue_many(self, func: str, calls, priority: str = "standard", durations=None, delay: float = 0,
+                     max_attempts: int = MAX_ATTEMPTS):
+        """
+        calls: lista de (args, kwargs); durations: segundos de audio por llamada (opcional, para SJF).
+        delay: segundos antes de que los jobs sean visibles (órdenes diferidas).
+        Inserta todo en una transacción y devuelve los ids.
+        """
+        now = time.time()
+        available_at = now + max(0, delay)
+        prio = PRIORITIES.get(priority, PRIORITIES["standard"])
+        calls = list(calls)
+        durations = list(durations or []) + [None] * (len(calls) - len(durations or []))
+        ids = []
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for (args, kwargs), duration in zip(calls, durations):
+                cur = conn.execute(
+                    "INSERT INTO jobs (func, args, kwargs, priority, duration, max_attempts, available_at, enqueued_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (func, json.dumps(list(args)), json.dumps(kwargs), prio, duration, max_attempts, available_at, now),
+                )
+                ids.append(cur.lastrowid)
+            conn.execute("COMMIT")
+            return ids
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def lease(self, owner: str, visibility_timeout: int = VISIBILITY_TIMEOUT) -> Optional[dict]:
+        """
+        Toma el próximo job disponible (queued y visible, o leased con lease vencido).
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # standard: SJF con aging (mismo score que el sorted set de helpers.queue); resto FIFO
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE (status = 'queued' AND available_at <= ?) "
+                "OR (status = 'leased' AND lease_expires <= ?) ORDER BY priority, "
+                "CASE WHEN priority = 1 THEN COALESCE(duration, ?) + ? * available_at ELSE available_at END, id LIMIT 1",
+                (now, now, SJF_DEFAULT_DURATION, SJF_AGING),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            if row["status"] == "leased":
+                logger.warning("Lease vencido del job %s (owner=%s): se retoma", row["id"], row["lease_owner"])
+            conn.execute(
+                "UPDATE jobs SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1 WHERE id = ?",
+                (owner, now + visibility_timeout, row["id"]),
+            )
+            conn.execute("COMMIT")
+            job = dict(row)
+            job["attempts"] += 1
+            job["args"] = json.loads(job["args"])
+            job["kwargs"] = json.loads(job["kwargs"])
+            return job
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def extend_lease(self, job_id: int, owner: str, visibility_timeout: int = VISIBILITY_TIMEOUT) -> bool:
+        with closing(self._connect()) as conn:
+            cur = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = 'leased'",
+                (time.time() + visibility_timeout, job_id, owner),
+            )
+            return cur.rowcount == 1
+
+    def complete(self, job_id: int, owner: str):
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', finished_at = ?, lease_owner = NULL, lease_expires = NULL "
+                "WHERE id = ? AND lease_owner = ?",
+                (time.time(), job_id, owner),
+            )
+
+    def fail(self, job_id: int, owner: str, error: str):
+        """
+        Reintenta con backoff exponencial o marca 'failed' si se agotaron los intentos.
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            if row["attempts"] < row["max_attempts"]:
+                delay = retry_delay(row["attempts"])
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', available_at = ?, lease_owner = NULL, lease_expires = NULL, "
+                    "last_error = ? WHERE id = ? AND lease_owner = ?",
+                    (time.time() + delay, error, job_id, owner),
+                )
+                logger.warning("Job %s falló (intento %s/%s); reintento en %ss", job_id, row["attempts"], row["max_attempts"], delay)
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, lease_owner = NULL, lease_expires = NULL, "
+                    "last_error = ? WHERE id = ? AND lease_owner = ?",
+                    (time.time(), error, job_id, owner),
+                )
+                logger.error("Job %s falló definitivamente tras %s intentos", job_id, row["attempts"])
+
+    def stats(self) -> dict:
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+            return {r["status"]: r["n"] for r in rows}
+
+
+def _resolve(func_path: str):
+    module_name, _, attr = func_path.rpartition(".")
+    return getattr(importlib.import_module(module_name), attr)
+
+
+class LocalWorkerPool:
+    """
+    Pool fijo de threads que consume una LocalQueue.
+    """
+
+    def __init__(self, queue: LocalQueue, size: int = LOCAL_QUEUE_WORKERS):
+        self.queue = queue
+        self.size = max(1, size)
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.size):
+            th = threading.Thread(target=self._loop, args=(f"{os.getpid()}-{i}-{uuid.uuid4().hex[:6]}",),
+                                  name=f"local-queue-{i}", daemon=True)
+            th.start()
+            self._threads.append(th)
+        logger.info("LocalWorkerPool iniciado: %s workers sobre %s", self.size, self.queue.path)
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        for th in self._threads:
+            th.join(timeout=timeout)
+
+    def _loop(self, owner: str):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.lease(owner)
+            except Exception:
+                logger.exception("No se pudo leer la cola local")
+                job = None
+            if job is None:
+                self._stop.wait(POLL_INTERVAL)
+                continue
+            self._run(job, owner)
+
+    def _run(self, job: dict, owner: str):
+        # renovar el lease mientras el job corre (las órdenes tardan mucho más que el visibility timeout)
+        done = threading.Event()
+
+        def heartbeat():
+            while not done.wait(VISIBILITY_TIMEOUT / 3):
+                if not self.queue.extend_lease(job["id"], owner):
+                    logger.warning("Se perdió el lease del job %s", job["id"])
+                    return
+
+        hb = threading.Thread(target=heartbeat, daemon=True)
+        hb.start()
+        logger.info("Ejecutando job %s %s%s (intento %s)", job["id"], job["func"], tuple(job["args"]), job["attempts"])
+        try:
+            _resolve(job["func"])(*job["args"], **job["kwargs"])
+            self.queue.complete(job["id"], owner)
+        except Exception as e:
+            traceback.print_exc()
+            self.queue.fail(job["id"], owner, repr(e))
+        finally:
+            done.set()
+
+
+_queue = None
+_pool = None
+_lock = threading.Lock()
+
+
+def get_queue() -> LocalQueue:
+    global _queue
+    with _lock:
+        if _queue is None:
+            _queue = LocalQueue()
+        return _queue
+
+
+def start_pool(size: int = LOCAL_QUEUE_WORKERS) -> LocalWorkerPool:
+    """
+    Inicia (una vez por proceso) el pool que consume la cola local. Idempotente.
+    """
+    global _pool
+    queue = get_queue()
+    with _lock:
+        if _pool is None:
+            _pool = LocalWorkerPool(queue, size=size)
+            _pool.start()
+        return _pool
+
+
+def stop_pool(timeout: Optional[float] = None):
+    global _pool
+    with _lock:
+        pool, _pool = _pool, None
+    if pool:
+        pool.stop(timeout=timeout)
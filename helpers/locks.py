@@ -1,48 +1,189 @@
 # helpers/locks.py
 import os
+import uuid
 import logging
+import time
+import threading
+from contextlib import contextmanager
+from typing import Optional
 
 logger = logging.getLogger("locks")
 logger.setLevel(logging.INFO)
 
-REDIS_URL = os.getenv("REDIS_URL")
+from helpers.redis_conn import REDIS_URL, get_redis
 
-# r será None si no hay REDIS_URL o si la inicialización falla.
-r = None
-if REDIS_URL:
-    try:
-        import redis
-        r = redis.from_url(REDIS_URL, decode_responses=True, socket_timeout=5)
-    except Exception:
-        logger.exception("No se pudo inicializar Redis con REDIS_URL. Continuando sin locks (modo bypass).")
-        r = None
-else:
+# r será None si no hay REDIS_URL o si la inicialización falla (pool compartido con cola y checkpoints).
+r = get_redis(decode_responses=True)
+if not REDIS_URL:
     logger.warning("REDIS_URL no configurada: locks funcionarán en modo bypass (sin exclusión).")
+elif r is None:
+    logger.warning("No se pudo inicializar Redis con REDIS_URL. Continuando sin locks (modo bypass).")
+
+# Lease corto renovado por heartbeat: si el worker muere, el lock vence en LOCK_LEASE_SECONDS
+# en vez de quedar tomado durante todo un TTL fijo.
+LOCK_LEASE_SECONDS = int(os.getenv("LOCK_LEASE_SECONDS", "120"))
+
+# Solo el dueño (token) puede renovar o borrar el lock
+_RELEASE_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+_RENEW_LUA = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('expire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_release_script = r.register_script(_RELEASE_LUA) if r else None
+_renew_script = r.register_script(_RENEW_LUA) if r else None
+
+class LockError(RuntimeError):
+    """
+    Redis no respondió al tomar el lock: no se sabe si otro worker lo tiene. Distinto de "ocupado":
+    el job debe fallar (y reintentarse), no descartarse como duplicado.
+    """
+
+
+class LockLost(RuntimeError):
+    """
+    El lease venció o lo tomó otro worker mientras la orden seguía en curso.
+    """
+
 
-def acquire_lock(key: str, ttl: int = 600) -> bool:
+# Modo bypass: exclusión al menos dentro del proceso (pool de la cola local)
+_local_held = set()
+_local_guard = threading.Lock()
+
+def acquire_lock(key: str, ttl: int = 600, token: Optional[str] = None) -> bool:
     """
-    Intenta adquirir un lock. Devuelve True si se adquirió el lock (o si estamos en modo bypass).
+    Intenta adquirir un lock. Devuelve True si se adquirió el lock (o si estamos en modo bypass),
+    False si otro lo tiene. Levanta LockError si Redis falla.
     En modo bypass (sin Redis) devolvemos True para no bloquear el flujo de pruebas.
+    token: valor del lock para poder renovarlo/liberarlo solo si sigue siendo nuestro.
     """
     lock_key = f"lock:{key}"
     if not r:
         logger.debug("acquire_lock bypass for key=%s", key)
         return True
     try:
-        return bool(r.set(lock_key, "1", nx=True, ex=ttl))
+        return bool(r.set(lock_key, token or "1", nx=True, ex=ttl))
+    except Exception as e:
+        logger.exception("Error al intentar set en Redis para key=%s", key)
+        raise LockError(f"No se pudo tomar el lock {key}: {e}") from e
+
+def renew_lock(key: str, token: str, ttl: int = LOCK_LEASE_SECONDS) -> Optional[bool]:
+    """
+    Extiende el TTL solo si el lock sigue teniendo nuestro token. False = lease perdido;
+    None = Redis no respondió (el lease puede seguir siendo nuestro).
+    """
+    if not r:
+        return True
+    try:
+        return bool(_renew_script(keys=[f"lock:{key}"], args=[token, ttl]))
     except Exception:
-        logger.exception("Error al intentar set en Redis; devolviendo False")
-        return False
+        logger.exception("Error al renovar lock en Redis para key=%s", key)
+        return None
 
-def release_lock(key: str):
+def release_lock(key: str, token: Optional[str] = None):
     """
     Libera el lock. En modo bypass no hace nada.
+    Con token hace compare-and-delete: no borra un lock que ya venció y tomó otro worker.
     """
     lock_key = f"lock:{key}"
     if not r:
         logger.debug("release_lock bypass for key=%s", key)
         return
     try:
-        r.delete(lock_key)
+        if token is None:
+            r.delete(lock_key)
+        elif not _release_script(keys=[lock_key], args=[token]):
+            logger.warning("Lock %s ya no era nuestro al liberarlo (lease vencido)", key)
     except Exception:
         logger.exception("Error al liberar lock en Redis para key=%s", key)
+
+class LockLease:
+    """
+    Lock tomado con held_lock: token propio + heartbeat que renueva el lease.
+    lost se activa si una renovación encuentra el lock en manos de otro (o vencido), o si Redis no
+    respondió a ninguna renovación durante todo el lease. check() antes de cada efecto visible.
+    """
+
+    def __init__(self, key: str, token: str, lease: int):
+        self.key = key
+        self.token = token
+        self.lease = lease
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _heartbeat(self):
+        renewed_at = time.time()
+        while not self._stop.wait(self.lease / 3):
+            renewed = renew_lock(self.key, self.token, self.lease)
+            if renewed:
+                renewed_at = time.time()
+                continue
+            if renewed is None and time.time() - renewed_at < self.lease:
+                continue  # error transitorio de Redis: el lease aún no vence, se reintenta en el próximo latido
+            logger.error("Se perdió el lock %s (token %s): otro worker puede estar procesando", self.key, self.token)
+            self.lost.set()
+            return
+
+    def check(self, where: str = ""):
+        """
+        Levanta LockLost si el lease se perdió: la orden ya no es de este worker.
+        """
+        if self.lost.is_set():
+            raise LockLost(f"Lock {self.key} perdido{f' antes de {where}' if where else ''}")
+
+    def start(self):
+        if r:
+            self._thread = threading.Thread(target=self._heartbeat, name=f"lock-{self.key}", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+def _try_acquire(key: str, token: str, lease: int) -> bool:
+    if r:
+        return acquire_lock(key, ttl=lease, token=token)
+    with _local_guard:
+        if key in _local_held:
+            return False
+        _local_held.add(key)
+        return True
+
+@contextmanager
+def held_lock(key: str, lease: int = LOCK_LEASE_SECONDS, wait: float = 0):
+    """
+    with held_lock(f"order:{order_id}") as lock:
+        if lock is None: ...  # otro worker ya tiene la orden
+    wait: segundos que se reintenta si el lock está tomado (traspasos cortos, p. ej. la finalización
+    de un fan-out que llega mientras el job padre todavía no lo suelta).
+    Sin Redis, la exclusión es solo dentro de este proceso. Un error de Redis levanta LockError.
+    """
+    token = uuid.uuid4().hex
+    give_up_at = time.time() + wait
+    acquired = _try_acquire(key, token, lease)
+    while not acquired and time.time() < give_up_at:
+        time.sleep(min(0.5, max(0.0, give_up_at - time.time())))
+        acquired = _try_acquire(key, token, lease)
+    if not acquired:
+        yield None
+        return
+
+    lock = LockLease(key, token, lease)
+    lock.start()
+    try:
+        yield lock
+    finally:
+        lock.stop()
+        if r:
+            release_lock(key, token=token)
+        else:
+            with _local_guard:
+                _local_held.discard(key)
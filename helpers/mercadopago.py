@@ -2,6 +2,8 @@
 import os
 import requests
 
+from helpers.metrics import track_external
+
 MP_BASE = "https://api.mercadopago.com"
 
 def _mp_headers():
@@ -10,12 +12,14 @@ def _mp_headers():
         raise RuntimeError("MP_ACCESS_TOKEN no configurado")
     return {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
 
-def create_mercadopago_preference(order_id: str, amount: int, callback_url: str):
+@track_external("mercadopago", "create_preference")
+def create_mercadopago_preference(order_id: str, amount: int, callback_url: str, metadata: dict = None):
     """
     Crea una preferencia para Checkout Pro y devuelve el JSON resultante (incluye init_point).
     - order_id -> external_reference
     - amount -> valor en CLP
     - callback_url -> notification_url que MP usará para notificar pagos
+    - metadata -> datos propios que MP devuelve en el pago (p. ej. {"prioridad": "express"})
     """
     url = f"{MP_BASE}/checkout/preferences"
     headers = _mp_headers()
@@ -48,6 +52,7 @@ def create_mercadopago_preference(order_id: str, amount: int, callback_url: str)
         #     "excluded_payment_types": [{"id":"atm"}],
         #     "installments": 1
         # },
+        "metadata": metadata or {},
         "payer": {
             # se puede enviar info del pagador si la tienes (opcional)
             # "name": "Nombre",
@@ -59,6 +64,7 @@ def create_mercadopago_preference(order_id: str, amount: int, callback_url: str)
     r.raise_for_status()
     return r.json()
 
+@track_external("mercadopago", "verify_payment")
 def verify_mp_payment(payment_id: str):
     """
     Verifica el pago consultando /v1/payments/{payment_id}
@@ -0,0 +1,185 @@
+# helpers/metrics.py
+"""
+Métricas Prometheus para el pipeline de órdenes y las llamadas a proveedores externos.
+
+- Etapas de generate_and_deliver: histograma de duración y contador por resultado.
+- Entregables (DOCX/PDF): tamaño final por tipo, después de helpers.packaging.
+- Llamadas externas (OpenAI, AssemblyAI, GCS, Sheets, Drive, correo, Mercado Pago):
+  latencia, errores y reintentos por proveedor/operación.
+
+El web (app.py) expone todo en /metrics. Los workers RQ no reciben scrapes, así que empujan
+sus métricas al Pushgateway (PROMETHEUS_PUSHGATEWAY) al terminar cada orden.
+Si prometheus_client no está instalado, todas las funciones son no-op.
+stage_timer y external_call además abren un span (helpers.tracing).
+external_call también aplica el circuit breaker del proveedor (helpers.circuit).
+"""
+import os
+import time
+import socket
+import logging
+import functools
+from contextlib import contextmanager
+
+from helpers import circuit, tracing
+
+logger = logging.getLogger("metrics")
+logger.setLevel(logging.INFO)
+
+PUSHGATEWAY = os.getenv("PROMETHEUS_PUSHGATEWAY")
+# Label instance del grupo en el Pushgateway: estable entre reinicios (no el pid) para que un proceso
+# reiniciado reemplace su grupo en vez de dejar uno viejo congelado. worker.py agrega el índice del hijo.
+METRICS_INSTANCE = os.getenv("METRICS_INSTANCE") or socket.gethostname()
+
+try:
+    from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+    from prometheus_client import delete_from_gateway, pushadd_to_gateway
+except Exception:
+    Counter = Histogram = None
+    logger.warning("prometheus_client no instalado: métricas deshabilitadas.")
+
+# buckets amplios: desde llamadas HTTP cortas hasta transcripciones/órdenes de ~1 h
+_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+if Counter is not None:
+    STAGE_SECONDS = Histogram("redaxion_stage_seconds", "Duración de cada etapa de generate_and_deliver",
+                              ["stage"], buckets=_BUCKETS)
+    STAGE_TOTAL = Counter("redaxion_stage_total", "Etapas ejecutadas por resultado", ["stage", "outcome"])
+    ORDER_SECONDS = Histogram("redaxion_order_seconds", "Duración total de una orden", buckets=_BUCKETS)
+    ORDER_TOTAL = Counter("redaxion_orders_total", "Órdenes procesadas por resultado", ["outcome"])
+    EXTERNAL_SECONDS = Histogram("redaxion_external_call_seconds", "Latencia de llamadas a proveedores externos",
+                                 ["provider", "operation"], buckets=_BUCKETS)
+    EXTERNAL_TOTAL = Counter("redaxion_external_calls_total", "Llamadas a proveedores externos por resultado",
+                             ["provider", "operation", "outcome"])
+    ARTIFACT_BYTES = Histogram("redaxion_artifact_bytes", "Tamaño de cada entregable ya empaquetado", ["kind"],
+                               buckets=(16e3, 64e3, 256e3, 512e3, 1e6, 2e6, 5e6, 10e6, 25e6, 50e6))
+    EXTERNAL_RETRIES = Counter("redaxion_external_retries_total", "Reintentos de llamadas a proveedores externos",
+                               ["provider", "operation"])
+
+
+def observe_stage(stage: str, seconds: float, outcome: str = "ok"):
+    if Counter is None:
+        return
+    STAGE_SECONDS.labels(stage).observe(seconds)
+    STAGE_TOTAL.labels(stage, outcome).inc()
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    with stage_timer("transcription"): ...  -> registra duración y outcome ok/error.
+    """
+    start = time.time()
+    outcome = "ok"
+    try:
+        with tracing.span(f"stage.{stage}"):
+            yield
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        observe_stage(stage, time.time() - start, outcome)
+
+
+def observe_artifact(kind: str, size_bytes: int):
+    if Counter is None:
+        return
+    ARTIFACT_BYTES.labels(kind).observe(size_bytes)
+
+
+def observe_order(seconds: float, outcome: str):
+    if Counter is None:
+        return
+    ORDER_SECONDS.observe(seconds)
+    ORDER_TOTAL.labels(outcome).inc()
+
+
+def record_retry(provider: str, operation: str):
+    if Counter is None:
+        return
+    EXTERNAL_RETRIES.labels(provider, operation).inc()
+
+
+@contextmanager
+def external_call(provider: str, operation: str):
+    try:
+        probe = circuit.before_call(provider)
+    except circuit.CircuitOpen:
+        if Counter is not None:
+            EXTERNAL_TOTAL.labels(provider, operation, "circuit_open").inc()
+        raise
+    start = time.time()
+    outcome = "ok"
+    try:
+        with tracing.span(f"{provider}.{operation}", provider=provider, operation=operation):
+            yield
+    except BaseException as e:
+        outcome = "error"
+        circuit.record_failure(provider, e, probe)
+        raise
+    else:
+        circuit.record_success(provider, probe)
+    finally:
+        if Counter is not None:
+            EXTERNAL_SECONDS.labels(provider, operation).observe(time.time() - start)
+            EXTERNAL_TOTAL.labels(provider, operation, outcome).inc()
+
+
+def track_external(provider: str, operation: str):
+    """
+    Decorador para funciones de helpers que llaman a un proveedor externo.
+    """
+    def deco(f):
+        @functools.wraps(f)
+        def wrapper(*args, **kwargs):
+            with external_call(provider, operation):
+                return f(*args, **kwargs)
+        return wrapper
+    return deco
+
+
+def metrics_payload():
+    """
+    Devuelve (body, content_type) para el endpoint /metrics.
+    """
+    if Counter is None:
+        return b"# prometheus_client no instalado\n", "text/plain; charset=utf-8"
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+_instance_slot = "0"
+
+
+def set_instance_slot(slot):
+    """
+    Distingue los procesos de un mismo host (índice del hijo en worker.py): cada uno empuja su propio grupo.
+    """
+    global _instance_slot
+    _instance_slot = str(slot)
+
+
+def _grouping_key() -> dict:
+    return {"instance": f"{METRICS_INSTANCE}-{_instance_slot}"}
+
+
+def push_metrics(job: str = "redaxion_worker"):
+    """
+    Empuja las métricas del proceso al Pushgateway (workers RQ). No-op si no está configurado.
+    """
+    if Counter is None or not PUSHGATEWAY:
+        return
+    try:
+        pushadd_to_gateway(PUSHGATEWAY, job=job, registry=REGISTRY, grouping_key=_grouping_key(), timeout=5)
+    except Exception:
+        logger.exception("No se pudieron empujar métricas a %s (no crítico)", PUSHGATEWAY)
+
+
+def delete_metrics(job: str = "redaxion_worker"):
+    """
+    Borra el grupo de este proceso del Pushgateway (apagado ordenado del worker).
+    """
+    if Counter is None or not PUSHGATEWAY:
+        return
+    try:
+        delete_from_gateway(PUSHGATEWAY, job=job, grouping_key=_grouping_key(), timeout=5)
+    except Exception:
+        logger.exception("No se pudo borrar el grupo de métricas en %s (no crítico)", PUSHGATEWAY)
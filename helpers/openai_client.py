@@ -5,14 +5,19 @@ import backoff
 import openai
 import traceback
 
+from helpers import circuit, deadline
+from helpers.metrics import track_external, record_retry
+
 logger = logging.getLogger("openai_client")
 logger.setLevel(logging.INFO)
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+OPENAI_TIMEOUT = 600  # timeout por request del cliente v1 (se acorta al plazo de la orden)
 
 def _backoff_handler(details):
     logger.warning("Retrying OpenAI request: %s (tries=%s)", details.get("exception"), details.get("tries"))
+    record_retry("openai", "chat_completion")
 
 def _get_openai_version():
     ver = getattr(openai, "__version__", None)
@@ -62,7 +67,14 @@ def _is_badrequest_exc(e):
     except Exception:
         return False
 
-@backoff.on_exception(backoff.expo, (Exception,), max_tries=5, on_backoff=_backoff_handler)
+def _no_retry(e):
+    # sin tiempo para la orden o proveedor caído (circuito abierto): no seguir reintentando
+    return isinstance(e, (deadline.DeadlineExceeded, circuit.CircuitOpen))
+
+# backoff por fuera: cada intento pasa por el circuit breaker y cuenta como falla/éxito
+@backoff.on_exception(backoff.expo, (Exception,), max_tries=5, max_time=deadline.max_time,
+                      giveup=_no_retry, on_backoff=_backoff_handler)
+@track_external("openai", "chat_completion")
 def chat_completion(messages, model=None, temperature=None, max_tokens=None):
     """
     Robust wrapper for OpenAI chat completions:
@@ -76,6 +88,7 @@ def chat_completion(messages, model=None, temperature=None, max_tokens=None):
     model = model or OPENAI_MODEL
     if not OPENAI_API_KEY:
         raise RuntimeError("OPENAI_API_KEY no configurada en variables de entorno.")
+    request_timeout = deadline.timeout(OPENAI_TIMEOUT, "openai")
 
     openai_ver = _get_openai_version()
     logger.info("OpenAI chat_completion called (model=%s) messages=%d openai_version=%s", model, len(messages), openai_ver)
@@ -95,7 +108,7 @@ def chat_completion(messages, model=None, temperature=None, max_tokens=None):
                 OpenAIClient = getattr(openai, "OpenAI", None)
             if OpenAIClient is None:
                 raise ImportError("Clase OpenAI no encontrada en el paquete 'openai' instalado.")
-            client = OpenAIClient(api_key=OPENAI_API_KEY)
+            client = OpenAIClient(api_key=OPENAI_API_KEY, timeout=request_timeout)
             logger.debug("Calling OpenAI v1+ with keys: %s", list(kwargs.keys()))
             resp = client.chat.completions.create(**kwargs)
             text = _extract_text_from_response(resp)
@@ -170,6 +183,7 @@ def chat_completion(messages, model=None, temperature=None, max_tokens=None):
         resp = openai.ChatCompletion.create(
             model=model,
             messages=messages,
+            request_timeout=request_timeout,
             temperature=(temperature if temperature is not None else 0.0),
             max_tokens=(max_tokens if max_tokens is not None else 1500),
         )
@@ -0,0 +1,429 @@
+# helpers/packaging.py
+"""
+Empaquetado de los entregables optimizado para tamaño: corre sobre cada Artifact recién renderizado,
+antes de guardarlo en checkpoints y de que salga a Drive y al correo.
+
+DOCX:
+- media idéntica (mismo hash) queda una sola vez; los .rels que apuntaban a las copias se reescriben.
+- imágenes (Pillow): se recortan al srcRect con que se muestran y se reducen a PACK_IMAGE_DPI según su
+  tamaño en la página; se re-comprimen en su mismo formato y solo se reemplazan si quedan más chicas.
+- fuentes embebidas (fontTools): subset a un repertorio fijo (Latin-1 + símbolos comunes), cacheado por
+  fuente de la plantilla; solo si el documento usa caracteres fuera de él que la fuente tenga se hace un
+  subset propio. w:subsetted="1".
+- zip: XML con deflate nivel PACK_ZIP_LEVEL; png/jpg/gif ya vienen comprimidos y se guardan tal cual.
+PDF: formatter_pdf ya usa fuentes base (nada que embeber ni subsetear), imágenes JPEG de helpers.images
+deduplicadas y deflate nivel PDF_ZLIB_LEVEL; los convertidos con LibreOffice (fuentes ya subseteadas)
+solo se miden.
+
+Cada pasada cachea en memoria el resultado por hash de contenido: las imágenes y fuentes de la plantilla
+se optimizan una vez por proceso, no una vez por orden. Cada artifact reporta tamaño antes/después en el
+log y en la métrica redaxion_artifact_bytes.
+"""
+import io
+import os
+import re
+import html
+import zlib
+import hashlib
+import logging
+import zipfile
+import threading
+from typing import Dict, List, Optional
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    from fontTools import subset as ft_subset
+    from fontTools.ttLib import TTFont
+except ImportError:
+    ft_subset = None
+    TTFont = None
+
+from helpers import metrics
+from helpers.artifacts import Artifact
+
+logger = logging.getLogger("packaging")
+logger.setLevel(logging.INFO)
+
+PACK_ENABLED = os.getenv("PACK_ENABLED", "1") not in ("0", "false", "no")
+PACK_ZIP_LEVEL = int(os.getenv("PACK_ZIP_LEVEL", "9"))
+PACK_IMAGE_DPI = int(os.getenv("PACK_IMAGE_DPI", "200"))
+PACK_JPEG_QUALITY = int(os.getenv("PACK_JPEG_QUALITY", "85"))
+PACK_SUBSET_FONTS = os.getenv("PACK_SUBSET_FONTS", "1") not in ("0", "false", "no")
+
+_EMU_PER_INCH = 914400
+_STORED_EXT = (".png", ".jpg", ".jpeg", ".gif")
+# Latin-1 imprimible: el documento se puede seguir editando en español con la fuente embebida
+_BASE_CODEPOINTS = frozenset(list(range(0x20, 0x7F)) + list(range(0xA0, 0x100)) + [0x2022, 0x2013, 0x2014, 0x201C, 0x201D, 0x2018, 0x2019, 0x2026])
+
+_BLIP_RE = re.compile(
+    r'<a:blip\b[^>]*?r:embed="(?P<rid>[^"]+)"[^>]*?(?:/>|>.*?</a:blip>)\s*(?:<a:srcRect(?P<rect>[^>]*)/>)?', re.S)
+_EXT_RE = re.compile(r'<a:ext cx="(\d+)" cy="(\d+)"/>')
+_REL_RE = re.compile(r'<Relationship\b[^>]*?Id="([^"]+)"[^>]*?Target="([^"]+)"')
+_GROUP_RE = re.compile(r'<wpg:grpSpPr>.*?<a:ext cx="(\d+)" cy="(\d+)"/>.*?<a:chExt cx="(\d+)" cy="(\d+)"/>', re.S)
+_RECT_ATTR_RE = re.compile(r'\b([lrtb])="(-?\d+)"')
+_TEXT_RE = re.compile(r"<w:t(?:\s[^>]*)?>([^<]*)</w:t>")
+_FONT_EMBED_RE = re.compile(r"<w:embed(?:Regular|Bold|Italic|BoldItalic)\b[^>]*/>")
+
+_cache: Dict[tuple, object] = {}
+_cache_lock = threading.Lock()
+
+
+def _cached(key: tuple, fn):
+    with _cache_lock:
+        if key in _cache:
+            return _cache[key]
+    value = fn()
+    with _cache_lock:
+        if len(_cache) > 256:
+            _cache.clear()
+        _cache[key] = value
+    return value
+
+
+def _sha(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+# -----------------------
+# DOCX: media
+# -----------------------
+def _rels_name(part: str) -> str:
+    folder, base = part.rsplit("/", 1)
+    return f"{folder}/_rels/{base}.rels"
+
+
+def _media_target(part: str, target: str) -> Optional[str]:
+    """
+    Target de un .rels (relativo a la carpeta de la parte, o absoluto) -> nombre dentro del zip.
+    """
+    if target.startswith("/"):
+        return target[1:]
+    folder = part.rsplit("/", 1)[0]
+    path = os.path.normpath(f"{folder}/{target}").replace("\\", "/")
+    return path if path.startswith("word/media/") else None
+
+
+def _dedupe_media(parts: Dict[str, bytes]) -> int:
+    canonical, dupes = {}, {}
+    for name in sorted(n for n in parts if n.startswith("word/media/")):
+        digest = _sha(parts[name])
+        if digest in canonical:
+            dupes[name] = canonical[digest]
+        else:
+            canonical[digest] = name
+    if not dupes:
+        return 0
+    for rels in [n for n in parts if n.endswith(".rels")]:
+        xml = parts[rels].decode("utf-8")
+        changed = False
+        for dup, keep in dupes.items():
+            old, new = f'media/{dup.rsplit("/", 1)[1]}"', f'media/{keep.rsplit("/", 1)[1]}"'
+            if old in xml:
+                xml = xml.replace(old, new)
+                changed = True
+        if changed:
+            parts[rels] = xml.encode("utf-8")
+    for dup in dupes:
+        del parts[dup]
+    return len(dupes)
+
+
+def _rect(attrs: Optional[str]) -> tuple:
+    """
+    srcRect en fracciones (l, t, r, b); el XML las trae en milésimas de porcentaje.
+    """
+    values = {k: int(v) / 100000.0 for k, v in _RECT_ATTR_RE.findall(attrs or "")}
+    return tuple(max(0.0, values.get(k, 0.0)) for k in "ltrb")
+
+
+def _group_scale(xml: str, pos: int) -> float:
+    """
+    Dentro de un grupo (wpg:wgp) el a:ext de la imagen está en coordenadas del grupo: ext/chExt.
+    """
+    start = xml.rfind("<wpg:wgp>", 0, pos)
+    if start < 0 or xml.rfind("</wpg:wgp>", 0, pos) > start:
+        return 1.0
+    m = _GROUP_RE.search(xml, start, pos)
+    if not m or not int(m.group(3)) or not int(m.group(4)):
+        return 1.0
+    return max(int(m.group(1)) / int(m.group(3)), int(m.group(2)) / int(m.group(4)))
+
+
+def _image_usages(parts: Dict[str, bytes]):
+    """
+    media -> [(parte, rid, rect, cx, cy)] para cada imagen dibujada en document/header/footer.
+    Una media referenciada también fuera de un a:blip (VML, etc.) queda con rect None: no se recorta.
+    """
+    usages: Dict[str, list] = {}
+    other_refs = set()
+    for part in parts:
+        if not (part.startswith("word/") and part.endswith(".xml")) or "/_rels/" in part:
+            continue
+        rels = parts.get(_rels_name(part))
+        if not rels or b"r:embed=" not in parts[part]:
+            continue
+        targets = dict(_REL_RE.findall(rels.decode("utf-8")))
+        xml = parts[part].decode("utf-8")
+        blips: Dict[str, int] = {}
+        for m in _BLIP_RE.finditer(xml):
+            media = _media_target(part, targets.get(m.group("rid"), ""))
+            ext = _EXT_RE.search(xml, m.end())
+            blips[m.group("rid")] = blips.get(m.group("rid"), 0) + 1
+            if media and ext:
+                scale = _group_scale(xml, m.start())
+                usages.setdefault(media, []).append((part, m.group("rid"), _rect(m.group("rect")),
+                                                     int(ext.group(1)) * scale, int(ext.group(2)) * scale))
+        for rid, count in blips.items():
+            if xml.count(f'"{rid}"') > count:
+                other_refs.add(_media_target(part, targets.get(rid, "")))
+    for media in other_refs:
+        if media in usages:
+            usages[media] = [(part, rid, None, cx, cy) for part, rid, _, cx, cy in usages[media]]
+    return usages
+
+
+def _shrink_image(raw: bytes, crop: Optional[tuple], width_px: float, height_px: float) -> Optional[bytes]:
+    """
+    Bytes nuevos de la imagen, o None si conviene dejar la original.
+    """
+    with Image.open(io.BytesIO(raw)) as img:
+        fmt = img.format
+        img.load()
+        if fmt not in ("PNG", "JPEG"):
+            return None
+        if crop and any(crop):
+            l, t, r, b = crop
+            box = (round(img.width * l), round(img.height * t), round(img.width * (1 - r)), round(img.height * (1 - b)))
+            if box[2] - box[0] < 1 or box[3] - box[1] < 1:
+                return None
+            img = img.crop(box)
+        scale = min(1.0, max(width_px / img.width, height_px / img.height))
+        if scale < 0.95:
+            img = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))), Image.LANCZOS)
+        out = io.BytesIO()
+        if fmt == "PNG":
+            img.save(out, "PNG", optimize=True)
+        else:
+            img.convert("RGB").save(out, "JPEG", quality=PACK_JPEG_QUALITY, optimize=True, progressive=True)
+    data = out.getvalue()
+    # un recorte cambia la imagen: se usa aunque no achique (el srcRect ya se quitó del XML)
+    return data if (crop and any(crop)) or len(data) < len(raw) else None
+
+
+def _shrink_images(parts: Dict[str, bytes]) -> int:
+    if Image is None:
+        return 0
+    cropped: Dict[str, set] = {}  # parte -> rids cuyo srcRect se vacía
+    shrunk = 0
+    for media, uses in _image_usages(parts).items():
+        raw = parts.get(media)
+        if raw is None or not media.lower().endswith((".png", ".jpg", ".jpeg")):
+            continue
+        if any(u[2] is None for u in uses):
+            continue
+        rects = {u[2] for u in uses}
+        crop = rects.pop() if len(rects) == 1 else None
+        # píxeles necesarios en la parte visible; si no se recorta, la imagen entera escala con el srcRect
+        width_px = height_px = 0.0
+        for _, _, (l, t, r, b), cx, cy in uses:
+            vis_w, vis_h = (1.0, 1.0) if crop is not None else (max(0.05, 1 - l - r), max(0.05, 1 - t - b))
+            width_px = max(width_px, cx / _EMU_PER_INCH * PACK_IMAGE_DPI / vis_w)
+            height_px = max(height_px, cy / _EMU_PER_INCH * PACK_IMAGE_DPI / vis_h)
+        key = ("img", _sha(raw), crop, round(width_px), round(height_px))
+        try:
+            data = _cached(key, lambda: _shrink_image(raw, crop, width_px, height_px))
+        except Exception:
+            logger.exception("No se pudo optimizar %s; queda la original", media)
+            continue
+        if data is None:
+            continue
+        parts[media] = data
+        shrunk += 1
+        if crop and any(crop):
+            for part, rid, _, _, _ in uses:
+                cropped.setdefault(part, set()).add(rid)
+    for part, rids in cropped.items():
+        def clear_rect(m, rids=rids):
+            if m.group("rid") in rids and m.group("rect") is not None:
+                start, end = m.span("rect")
+                text = m.group(0)
+                return text[:start - m.start()] + text[end - m.start():]
+            return m.group(0)
+        parts[part] = _BLIP_RE.sub(clear_rect, parts[part].decode("utf-8")).encode("utf-8")
+    return shrunk
+
+
+# -----------------------
+# DOCX: fuentes embebidas
+# -----------------------
+def _font_key(attrs: str) -> Optional[bytes]:
+    """
+    Clave de ofuscación ODTTF (GUID de w:fontKey, bytes en orden inverso); None si no hay.
+    """
+    m = re.search(r'w:fontKey="\{([0-9A-Fa-f-]+)\}"', attrs)
+    if not m:
+        return None
+    key = bytes.fromhex(m.group(1).replace("-", ""))[::-1]
+    return key if any(key) else None
+
+
+def _xor_header(data: bytes, key: Optional[bytes]) -> bytes:
+    # ofuscar y des-ofuscar es la misma operación: XOR de los primeros 32 bytes con la clave
+    if not key:
+        return data
+    head = bytes(b ^ key[i % 16] for i, b in enumerate(data[:32]))
+    return head + data[32:]
+
+
+def _subset_font(raw: bytes, codepoints: frozenset) -> bytes:
+    font = TTFont(io.BytesIO(raw))
+    options = ft_subset.Options()
+    options.name_IDs = ["*"]
+    options.name_languages = ["*"]
+    options.layout_features = ["*"]
+    options.notdef_outline = True
+    options.glyph_names = False
+    subsetter = ft_subset.Subsetter(options)
+    subsetter.populate(unicodes=codepoints)
+    subsetter.subset(font)
+    out = io.BytesIO()
+    font.save(out)
+    return out.getvalue()
+
+
+def _extra_codepoints(parts: Dict[str, bytes]) -> frozenset:
+    """
+    Caracteres del documento fuera de _BASE_CODEPOINTS (vacío en casi todas las órdenes).
+    """
+    chars = set()
+    for name, data in parts.items():
+        if name.startswith("word/") and name.endswith(".xml") and b"<w:t" in data:
+            for text in _TEXT_RE.findall(data.decode("utf-8")):
+                chars.update(html.unescape(text))
+    return frozenset(ord(c) for c in chars) - _BASE_CODEPOINTS
+
+
+def _font_codepoints(raw: bytes) -> frozenset:
+    font = TTFont(io.BytesIO(raw), lazy=True)
+    return frozenset(font.getBestCmap() or ())
+
+
+def _subset_fonts(parts: Dict[str, bytes]) -> int:
+    table = parts.get("word/fontTable.xml")
+    rels = parts.get("word/_rels/fontTable.xml.rels")
+    if ft_subset is None or not PACK_SUBSET_FONTS or not table or not rels:
+        return 0
+    targets = dict(_REL_RE.findall(rels.decode("utf-8")))
+    xml = table.decode("utf-8")
+    extra = None
+    done = 0
+
+    def subset_embed(m):
+        nonlocal extra, done
+        tag = m.group(0)
+        rid = re.search(r'r:id="([^"]+)"', tag)
+        if not rid or 'w:subsetted="1"' in tag or rid.group(1) not in targets:
+            return tag
+        name = _media_target("word/fontTable.xml", targets[rid.group(1)]) or \
+            os.path.normpath("word/" + targets[rid.group(1)]).replace("\\", "/")
+        raw = parts.get(name)
+        if raw is None:
+            return tag
+        if extra is None:
+            extra = _extra_codepoints(parts)
+        key = _font_key(tag)
+        try:
+            sha = _sha(raw)
+            # el repertorio fijo se subsetea una vez por fuente; los caracteres extra solo cuentan si la
+            # fuente los tiene (si no, el subset saldría igual y no vale la pena repetirlo)
+            used = extra & _cached(("cmap", sha), lambda: _font_codepoints(_xor_header(raw, key))) if extra else extra
+            codepoints = _BASE_CODEPOINTS | used
+            cache_key = ("font", sha, hashlib.sha1(repr(sorted(used)).encode()).hexdigest() if used else "base")
+            data = _cached(cache_key, lambda: _xor_header(_subset_font(_xor_header(raw, key), codepoints), key))
+        except Exception:
+            logger.exception("No se pudo subsetear la fuente %s; queda completa", name)
+            return tag
+        if len(data) >= len(raw):
+            return tag
+        parts[name] = data
+        done += 1
+        if "w:subsetted=" in tag:
+            return re.sub(r'w:subsetted="[^"]*"', 'w:subsetted="1"', tag)
+        return tag.replace("/>", ' w:subsetted="1"/>')
+
+    parts["word/fontTable.xml"] = _FONT_EMBED_RE.sub(subset_embed, xml).encode("utf-8")
+    return done
+
+
+# -----------------------
+# DOCX: zip
+# -----------------------
+def _write_zip(parts: Dict[str, bytes], order: List[str]) -> bytes:
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w") as dst:
+        for name in order:
+            if name not in parts:
+                continue
+            data = parts[name]
+            info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+            if name.lower().endswith(_STORED_EXT) and len(zlib.compress(data, 1)) > len(data) * 0.97:
+                info.compress_type = zipfile.ZIP_STORED
+                dst.writestr(info, data)
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+                dst.writestr(info, data, compresslevel=PACK_ZIP_LEVEL)
+    return out.getvalue()
+
+
+def optimize_docx(data: bytes) -> bytes:
+    """
+    Bytes de un DOCX -> bytes del mismo DOCX optimizado (ver docstring del módulo).
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as src:
+        order = [info.filename for info in src.infolist()]
+        parts = {name: src.read(name) for name in order}
+    dupes = _dedupe_media(parts)
+    images = _shrink_images(parts)
+    fonts = _subset_fonts(parts)
+    logger.info("DOCX: %s media duplicadas, %s imágenes reducidas, %s fuentes subseteadas", dupes, images, fonts)
+    return _write_zip(parts, order)
+
+
+def pack(art: Optional[Artifact], kind: str) -> Optional[Artifact]:
+    """
+    Artifact optimizado (uno nuevo; el original no se toca). kind etiqueta la métrica: docx_tcp, pdf_quiz...
+    """
+    if art is None:
+        return None
+    data = art.data
+    if PACK_ENABLED and art.filename.lower().endswith(".docx"):
+        try:
+            optimized = optimize_docx(art.data)
+            if len(optimized) < len(data):
+                data = optimized
+        except Exception:
+            logger.exception("No se pudo optimizar %s; se entrega tal cual", art.filename)
+    metrics.observe_artifact(kind, len(data))
+    logger.info("Artifact %s: %s KB -> %s KB", art.filename, art.size // 1024, len(data) // 1024)
+    if data is art.data:
+        return art
+    return Artifact(art.filename, data, art.spool_dir)
+
+
+def warm() -> int:
+    """
+    Optimiza una vez la media y las fuentes de cada plantilla (preload del worker; los hijos heredan la cache).
+    """
+    from helpers.formatter_docx import BAR_COLORS, guardar_como_docx
+    done = 0
+    for color in BAR_COLORS:
+        for columnas in ("simple", "doble"):
+            buf = io.BytesIO()
+            guardar_como_docx("", buf, color=color, columnas=columnas)
+            optimize_docx(buf.getvalue())
+            done += 1
+    return done
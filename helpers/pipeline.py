@@ -0,0 +1,224 @@
+# helpers/pipeline.py
+"""
+Ejecutor de etapas en forma de DAG para la parte final de generate_and_deliver.
+
+Cada Stage declara sus dependencias; las etapas independientes corren en paralelo en un pool
+de threads, de modo que la cola del pipeline tarda lo que su camino crítico y no la suma.
+
+Políticas de falla (on_failure):
+- "continue": la etapa queda como fallida pero sus dependientes corren igual (su resultado es None).
+- "skip":     los dependientes (directos e indirectos) se marcan como "skipped".
+- "abort":    no se lanza ninguna etapa nueva y run_dag levanta PipelineAborted al terminar.
+"""
+import time
+import logging
+import traceback
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, Iterable, Optional
+
+from helpers import deadline, tracing
+
+logger = logging.getLogger("pipeline")
+logger.setLevel(logging.INFO)
+
+ON_FAILURE_POLICIES = ("continue", "skip", "abort")
+
+
+class PipelineAborted(RuntimeError):
+    def __init__(self, stage: str, error: Optional[BaseException], results: Dict[str, dict]):
+        super().__init__(f"Etapa '{stage}' falló con política abort: {error}")
+        self.stage = stage
+        self.error = error
+        self.results = results
+
+
+class Stage:
+    """
+    - name: identificador único de la etapa.
+    - fn: callable(results) -> valor; results es {nombre_dep: valor} de las dependencias.
+    - deps: nombres de etapas que deben terminar antes.
+    - timeout: segundos máximos (None = sin límite), acotado al plazo de la orden (helpers.deadline).
+      Un thread no se puede matar: al vencer, la etapa se marca "timeout" y sus dependientes
+      siguen según on_failure (el thread sigue vivo hasta que fn retorne; ver on_drained en run_dag).
+    - on_failure: "continue" | "skip" | "abort".
+    """
+
+    def __init__(self, name: str, fn: Callable[[Dict[str, object]], object], deps: Iterable[str] = (),
+                 timeout: Optional[float] = None, on_failure: str = "continue"):
+        if on_failure not in ON_FAILURE_POLICIES:
+            raise ValueError(f"on_failure inválido para {name}: {on_failure}")
+        self.name = name
+        self.fn = fn
+        self.deps = tuple(deps)
+        self.timeout = timeout
+        self.on_failure = on_failure
+
+    def __repr__(self):
+        return f"Stage({self.name!r}, deps={self.deps})"
+
+
+def _run_stage(st: Stage, dep_results: Dict[str, object]):
+    with tracing.span(f"stage.{st.name}", stage=st.name):
+        return st.fn(dep_results)
+
+
+def _validate(stages: Dict[str, Stage]):
+    for st in stages.values():
+        for d in st.deps:
+            if d not in stages:
+                raise ValueError(f"Etapa '{st.name}' depende de '{d}', que no existe")
+    # detección de ciclos (DFS)
+    visiting, done = set(), set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Ciclo de dependencias en el DAG en '{name}'")
+        visiting.add(name)
+        for d in stages[name].deps:
+            visit(d)
+        visiting.discard(name)
+        done.add(name)
+
+    for name in stages:
+        visit(name)
+
+
+def _when_drained(futures, fn: Callable[[], None], label: str):
+    def call():
+        try:
+            fn()
+        except Exception:
+            logger.exception("on_drained falló (DAG%s)", label)
+
+    if not futures:
+        call()
+        return
+    logger.warning("[DAG%s] %s etapa(s) vencida(s) siguen corriendo; on_drained queda para cuando terminen",
+                   label, len(futures))
+
+    def waiter():
+        wait(futures)
+        call()
+
+    threading.Thread(target=waiter, name=f"dag{label}-drain", daemon=True).start()
+
+
+def run_dag(stages: Iterable[Stage], max_workers: int = 4, label: str = "",
+            observer: Optional[Callable[[str, float, str], None]] = None,
+            on_drained: Optional[Callable[[], None]] = None) -> Dict[str, dict]:
+    """
+    Ejecuta las etapas respetando dependencias. Devuelve {nombre: {"status", "result", "error", "seconds"}}
+    con status en ok | failed | timeout | skipped.
+    observer(nombre, segundos, status) se llama al cerrar cada etapa (p. ej. helpers.metrics.observe_stage).
+    on_drained() se llama una vez cuando ya no queda ningún thread de etapa corriendo: antes de retornar
+    si no hubo timeouts, o desde un thread aparte cuando terminan las etapas vencidas (p. ej. borrar el
+    directorio de trabajo que esas etapas todavía pueden estar escribiendo).
+    """
+    stages = {st.name: st for st in stages}
+
+    results: Dict[str, dict] = {}
+    pending = dict(stages)
+    running = {}  # future -> (name, started_at)
+    timeouts = {}  # timeout efectivo de cada etapa lanzada
+    aborted_by = None
+    abandoned = []  # futures de etapas vencidas cuyo thread sigue corriendo
+
+    def _finish(name, status, result=None, error=None, seconds=0.0):
+        results[name] = {"status": status, "result": result, "error": error, "seconds": round(seconds, 3)}
+        if observer and status != "skipped":
+            try:
+                observer(name, seconds, status)
+            except Exception:
+                logger.exception("observer falló para la etapa %s", name)
+        if status == "ok":
+            logger.info("[DAG%s] %s ok (%.2fs)", label, name, seconds)
+        elif status == "skipped":
+            logger.info("[DAG%s] %s skipped (%s)", label, name, error)
+        else:
+            logger.warning("[DAG%s] %s %s (%.2fs): %s", label, name, status, seconds, error)
+
+    def _blocked_by(st: Stage) -> Optional[str]:
+        for d in st.deps:
+            res = results[d]
+            # una dependencia saltada no produjo nada: el skip se propaga a los dependientes indirectos
+            if res["status"] == "skipped" or (res["status"] != "ok" and stages[d].on_failure != "continue"):
+                return d
+        return None
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"dag{label}")
+    try:
+        _validate(stages)
+        while pending or running:
+            # lanzar todo lo que ya tiene sus dependencias resueltas
+            if aborted_by is None:
+                for name in list(pending):
+                    st = pending[name]
+                    if any(d not in results for d in st.deps):
+                        continue
+                    del pending[name]
+                    blocker = _blocked_by(st)
+                    if blocker:
+                        _finish(name, "skipped", error=f"dependencia '{blocker}' no terminó ok")
+                        continue
+                    try:
+                        timeouts[name] = deadline.timeout(st.timeout, name)
+                    except deadline.DeadlineExceeded as e:
+                        _finish(name, "timeout", error=e)
+                        if st.on_failure == "abort" and aborted_by is None:
+                            aborted_by = name
+                        continue
+                    dep_results = {d: results[d]["result"] for d in st.deps}
+                    # copy_context: el span de la etapa cuelga del trace de la orden aunque corra en otro thread
+                    ctx = contextvars.copy_context()
+                    running[pool.submit(ctx.run, _run_stage, st, dep_results)] = (name, time.time())
+            else:
+                for name in list(pending):
+                    del pending[name]
+                    _finish(name, "skipped", error=f"pipeline abortado por '{aborted_by}'")
+
+            if not running:
+                if pending:
+                    # solo puede pasar si quedan etapas bloqueadas ya resueltas como skipped
+                    continue
+                break
+
+            # esperar hasta que termine alguna etapa o venza el timeout más cercano
+            now = time.time()
+            deadlines = [started + timeouts[n] for n, started in running.values() if timeouts[n]]
+            wait_for = max(0.0, min(deadlines) - now) if deadlines else None
+            done, _ = wait(list(running), timeout=wait_for, return_when=FIRST_COMPLETED)
+
+            for fut in done:
+                name, started = running.pop(fut)
+                elapsed = time.time() - started
+                try:
+                    _finish(name, "ok", result=fut.result(), seconds=elapsed)
+                except Exception as e:
+                    logger.debug("Traceback etapa %s:\n%s", name, "".join(traceback.format_exception(e)))
+                    _finish(name, "failed", error=e, seconds=elapsed)
+                    if stages[name].on_failure == "abort" and aborted_by is None:
+                        aborted_by = name
+
+            now = time.time()
+            for fut, (name, started) in list(running.items()):
+                timeout = timeouts[name]
+                if timeout and now - started >= timeout:
+                    running.pop(fut)
+                    if not fut.cancel():
+                        abandoned.append(fut)
+                    _finish(name, "timeout", error=TimeoutError(f"{name} excedió {timeout}s"), seconds=now - started)
+                    if stages[name].on_failure == "abort" and aborted_by is None:
+                        aborted_by = name
+    finally:
+        # no esperamos threads colgados por timeout: el worker sigue con la orden
+        pool.shutdown(wait=False)
+        if on_drained:
+            _when_drained([f for f in list(abandoned) + list(running) if not f.done()], on_drained, label)
+
+    if aborted_by is not None:
+        raise PipelineAborted(aborted_by, results[aborted_by]["error"], results)
+    return results
@@ -93,6 +93,9 @@ if not _raw_model or len(_raw_model) < 3 or "cahgot" in _raw_model.lower():
 else:
     OPENAI_MODEL = _raw_model
 
+from helpers.circuit import CircuitOpen
+from helpers.deadline import DeadlineExceeded
+
 # Intentamos importar el wrapper centralizado que usa la API v1+ (crea helpers/openai_client.py)
 try:
     from helpers.openai_client import chat_completion
@@ -208,6 +211,10 @@ def procesar_txt_con_chatgpt_block(block_text: str, order_id: typing.Optional[st
         logger.info(f"[PROCESS_TXT] Bloque {block_index} procesado, longitud {len(processed)} chars")
         return processed
 
+    except (DeadlineExceeded, CircuitOpen):
+        # sin tiempo para la orden o OpenAI caído: que falle la etapa (la orden se difiere),
+        # no un bloque "con error" que igual se entrega
+        raise
     except Exception as e:
         logger.error(f"[PROCESS_TXT][ERROR] al procesar bloque {block_index}: {e}")
         logger.exception(e)
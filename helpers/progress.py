@@ -0,0 +1,193 @@
+# helpers/progress.py
+"""
+Progreso de cada orden para GET /orders/{id}/status, sin consultar Google Sheets.
+
+generate_and_deliver actualiza un registro por orden en cada etapa:
+- state: pending_payment | queued | processing | deferred | delivered | error | skipped
+- stage: etapa actual (payment, queued, lookup, transcription, blocks, quiz, delivery)
+- last_step: última etapa de entrega terminada con su resultado (p. ej. "pdf_tcp:ok")
+- blocks_done / blocks_total y timestamps para estimar el ETA
+
+Backends:
+- Redis (REDIS_URL): hash `progress:{order_id}` con TTL (lectura O(1) con HGETALL).
+- Sin Redis: tabla `progress` en SQLite (por defecto la misma base de la cola local), visible para el
+  web aunque los jobs corran en otro proceso (`python worker.py` en modo cola local).
+Los errores al escribir se registran y se ignoran: el progreso nunca rompe una orden.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from contextlib import closing
+from typing import Callable, Optional
+
+from helpers.redis_conn import get_redis
+
+logger = logging.getLogger("progress")
+logger.setLevel(logging.INFO)
+
+PROGRESS_TTL = int(os.getenv("PROGRESS_TTL_SECONDS", str(7 * 24 * 3600)))
+# estimación fija de los pasos 8-13 (DOCX, PDF, Drive, Sheets, correo) para el ETA
+DELIVERY_ESTIMATE_SECONDS = int(os.getenv("PROGRESS_DELIVERY_ESTIMATE_SECONDS", "120"))
+# sin Redis: base compartida por web y worker (LOCAL_QUEUE_PATH, ver helpers/local_queue.py)
+PROGRESS_DB_PATH = os.getenv("PROGRESS_DB_PATH") or os.getenv("LOCAL_QUEUE_PATH", "redaxion_jobs.sqlite3")
+
+_NUMERIC = ("blocks_done", "blocks_total", "enqueued_at", "started_at", "blocks_started_at",
+            "delivery_started_at", "updated_at", "finished_at", "duration")
+
+# campos que describen un intento: un reintento los borra al empezar (si no, el ETA y finished_at
+# mostrarían los del intento anterior)
+ATTEMPT_FIELDS = ("delivery_started_at", "finished_at", "last_step", "retry_at", "reason")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress (
+    order_id   TEXT PRIMARY KEY,
+    data       TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS progress_updated ON progress (updated_at);
+"""
+_db_ready = False
+_db_lock = threading.Lock()
+
+
+def _key(order_id: str) -> str:
+    return f"progress:{order_id}"
+
+
+def _connect():
+    global _db_ready
+    conn = sqlite3.connect(PROGRESS_DB_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    if not _db_ready:
+        with _db_lock:
+            conn.executescript(_SCHEMA)
+            _db_ready = True
+    return conn
+
+
+def _sqlite_modify(order_id: str, change: Callable[[dict], None]):
+    """
+    Lee-modifica-escribe el registro en una transacción (web y worker pueden escribir a la vez)
+    y de paso borra los registros vencidos (PROGRESS_TTL).
+    """
+    now = time.time()
+    with closing(_connect()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM progress WHERE order_id = ?", (str(order_id),)).fetchone()
+            rec = json.loads(row[0]) if row else {}
+            change(rec)
+            conn.execute(
+                "INSERT INTO progress (order_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(order_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (str(order_id), json.dumps(rec), now),
+            )
+            conn.execute("DELETE FROM progress WHERE updated_at < ?", (now - PROGRESS_TTL,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def update(order_id: str, unset=(), **fields):
+    """
+    Sobrescribe los campos dados (los None se omiten) y renueva updated_at.
+    unset: campos a borrar en la misma escritura (p. ej. ATTEMPT_FIELDS al empezar un reintento).
+    """
+    data = {k: v for k, v in fields.items() if v is not None}
+    data["updated_at"] = time.time()
+    conn = get_redis(decode_responses=True)
+    try:
+        if conn is not None:
+            pipe = conn.pipeline()
+            if unset:
+                pipe.hdel(_key(order_id), *unset)
+            pipe.hset(_key(order_id), mapping={k: str(v) for k, v in data.items()})
+            pipe.expire(_key(order_id), PROGRESS_TTL)
+            pipe.execute()
+            return
+
+        def change(rec):
+            for field in unset:
+                rec.pop(field, None)
+            rec.update(data)
+
+        _sqlite_modify(order_id, change)
+    except Exception:
+        logger.exception("No se pudo actualizar el progreso de la orden %s (no crítico)", order_id)
+
+
+def set_stage(order_id: str, stage: str, **fields):
+    update(order_id, stage=stage, **fields)
+
+
+def block_done(order_id: str):
+    """
+    Incremento atómico de blocks_done (bloques y quiz pueden terminar en threads distintos).
+    """
+    conn = get_redis(decode_responses=True)
+    try:
+        if conn is not None:
+            pipe = conn.pipeline()
+            pipe.hincrby(_key(order_id), "blocks_done", 1)
+            pipe.hset(_key(order_id), "updated_at", str(time.time()))
+            pipe.execute()
+            return
+
+        def change(rec):
+            rec["blocks_done"] = rec.get("blocks_done", 0) + 1
+            rec["updated_at"] = time.time()
+
+        _sqlite_modify(order_id, change)
+    except Exception:
+        logger.exception("No se pudo actualizar el progreso de la orden %s (no crítico)", order_id)
+
+
+def _eta(rec: dict, now: float) -> Optional[float]:
+    """
+    Segundos restantes estimados: ritmo medido de los bloques × bloques pendientes + entrega.
+    """
+    state = rec.get("state")
+    if state in ("delivered", "error", "skipped"):
+        return 0.0
+    if rec.get("delivery_started_at"):
+        return round(max(0.0, DELIVERY_ESTIMATE_SECONDS - (now - rec["delivery_started_at"])), 1)
+    done, total, started = rec.get("blocks_done", 0), rec.get("blocks_total"), rec.get("blocks_started_at")
+    if total and started and done:
+        per_block = (now - started) / done
+        return round(per_block * max(0, total - done) + DELIVERY_ESTIMATE_SECONDS, 1)
+    return None
+
+
+def get(order_id: str) -> Optional[dict]:
+    """
+    Registro de progreso con eta_seconds calculado al momento de leer, o None si no existe.
+    """
+    conn = get_redis(decode_responses=True)
+    try:
+        if conn is not None:
+            rec = conn.hgetall(_key(order_id))
+        else:
+            with closing(_connect()) as db:
+                row = db.execute("SELECT data FROM progress WHERE order_id = ?", (str(order_id),)).fetchone()
+            rec = json.loads(row[0]) if row else {}
+    except Exception:
+        logger.exception("No se pudo leer el progreso de la orden %s", order_id)
+        return None
+    if not rec:
+        return None
+    for field in _NUMERIC:
+        if field in rec and rec[field] not in ("", None):
+            try:
+                rec[field] = float(rec[field])
+            except (TypeError, ValueError):
+                pass
+    for field in ("blocks_done", "blocks_total"):
+        if isinstance(rec.get(field), float):
+            rec[field] = int(rec[field])
+    rec["order_id"] = str(order_id)
+    rec["eta_seconds"] = _eta(rec, time.time())
+    return rec
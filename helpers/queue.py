@@ -1,38 +1,366 @@
 # helpers/queue.py
 import os
-import threading
+import json
+import time
+from typing import Iterable, Optional
 
-def enqueue_generate_and_deliver(order_id: str):
+from helpers import progress, tracing
+from helpers.redis_conn import get_redis
+
+# Colas por prioridad; los workers escuchan en este orden: sub-jobs de órdenes ya en curso (fan-out),
+# express, standard y reintentos/backfill al final. reda-speculative (transcripción de órdenes aún no
+# pagadas, helpers/speculative.py) no está en QUEUES_IN_ORDER: la atienden workers propios.
+QUEUE_BY_PRIORITY = {
+    "blocks": "reda-blocks",
+    "express": "reda-express",
+    "standard": "reda",
+    "retry": "reda-retry",
+    "speculative": "reda-speculative",
+}
+QUEUES_IN_ORDER = [QUEUE_BY_PRIORITY[p] for p in ("blocks", "express", "standard", "retry")]
+JOB_TIMEOUT = 3600
+# barrera del fan-out por bloques: vence si un sub-job se pierde (worker muerto) para no bloquear reintentos
+FANOUT_TTL = 2 * JOB_TIMEOUT
+
+# Shortest-job-first para la cola standard: las órdenes esperan en un sorted set ordenado por
+# duración del audio; los workers pasan a "reda" la más corta cada vez que quedan libres.
+# Aging: cada segundo de espera descuenta SJF_AGING segundos de audio, así un audio largo
+# termina pasando adelante de los cortos que llegan después (no hay inanición).
+SJF_KEY = "reda:sjf"
+SJF_AGING = float(os.getenv("SJF_AGING", "4"))
+SJF_DEFAULT_DURATION = float(os.getenv("SJF_DEFAULT_DURATION", "1800"))  # audio sin duración conocida
+
+
+# Órdenes que fallan (excepción o timeout): MAX_ATTEMPTS intentos en total, con RETRY_BACKOFF × 2^(n-1)
+# segundos antes del intento n+1. La misma política en RQ (Retry; los reintentos quedan en el
+# ScheduledJobRegistry y feed_scheduled los devuelve a su cola) y en la cola local (helpers/local_queue.py).
+MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS") or os.getenv("LOCAL_QUEUE_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF = int(os.getenv("JOB_RETRY_BACKOFF", "60"))
+
+# Sin REDIS_URL los jobs van a la cola local SQLite, que consume `python worker.py` (modo run_local).
+# LOCAL_QUEUE_IN_WEB=1 además arranca el pool dentro del proceso web (despliegues de un solo proceso,
+# desarrollo); apagado por defecto para que cada proceso uvicorn/gunicorn no levante su propio pool.
+LOCAL_QUEUE_IN_WEB = os.getenv("LOCAL_QUEUE_IN_WEB", "0") == "1"
+
+# Órdenes diferidas por un circuit breaker abierto (helpers.circuit): sorted set por hora de reintento,
+# los workers las pasan a reda-retry cuando vencen
+DEFERRED_KEY = "reda:deferred"
+
+# Paso de los sorted sets (SJF_KEY, DEFERRED_KEY) a RQ en dos fases, sin perder ni duplicar órdenes entre
+# workers: un script Lua reclama los miembros (los saca del set y los anota en `{key}:claims` con la hora,
+# más su score original en `{key}:claims:score`) y el enqueue RQ y la liberación del reclamo van en la
+# misma transacción. Un reclamo sin liberar por más de FEED_CLAIM_TIMEOUT (worker muerto entre las dos
+# fases) vuelve al set con su score original en la próxima pasada de cualquier worker.
+FEED_CLAIM_TIMEOUT = float(os.getenv("FEED_CLAIM_TIMEOUT", "60"))
+
+# KEYS: set, claims, scores, lista de la cola RQ. ARGV: now, max_ready (-1 = sin tope), limit, max_score, stale_before.
+# Devuelve [miembro, score, miembro, score, ...] reclamados.
+_CLAIM_SCRIPT = """
+local stale = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[5])
+for _, member in ipairs(stale) do
+    local score = redis.call('HGET', KEYS[3], member)
+    redis.call('ZADD', KEYS[1], score or ARGV[1], member)
+    redis.call('ZREM', KEYS[2], member)
+    redis.call('HDEL', KEYS[3], member)
+end
+local n = tonumber(ARGV[3])
+if tonumber(ARGV[2]) >= 0 then
+    -- los reclamos en curso ya cuentan como jobs esperando en la cola
+    n = math.min(n, tonumber(ARGV[2]) - redis.call('LLEN', KEYS[4]) - redis.call('ZCARD', KEYS[2]))
+end
+if n <= 0 then return {} end
+local items = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[4], 'WITHSCORES', 'LIMIT', 0, n)
+for i = 1, #items, 2 do
+    redis.call('ZREM', KEYS[1], items[i])
+    redis.call('ZADD', KEYS[2], ARGV[1], items[i])
+    redis.call('HSET', KEYS[3], items[i], items[i + 1])
+end
+return items
+"""
+
+
+def sjf_score(duration: Optional[float], enqueued_at: float) -> float:
+    """
+    duración - aging × espera, sin el término "ahora" (común a todos): un score estático para ZADD.
+    """
+    return float(duration or SJF_DEFAULT_DURATION) + SJF_AGING * enqueued_at
+
+
+def retry_delay(attempt: int) -> int:
+    """
+    Segundos de espera tras el intento fallido número `attempt` (1 = el primero).
+    """
+    return RETRY_BACKOFF * (2 ** (attempt - 1))
+
+def _rq_retry():
     """
-    Si REDIS_URL existe, intenta encolar con RQ.
-    Si no, lanza en background thread importando main.generate_and_deliver.
+    Retry de RQ para generate_and_deliver (None si MAX_ATTEMPTS=1: sin reintentos).
     """
-    redis_url = os.getenv("REDIS_URL")
-    if redis_url:
-        try:
-            from redis import Redis
+    if MAX_ATTEMPTS <= 1:
+        return None
+    from rq import Retry
+    return Retry(max=MAX_ATTEMPTS - 1, interval=[retry_delay(n) for n in range(1, MAX_ATTEMPTS)])
+
+def _queue_name(priority: str) -> str:
+    return QUEUE_BY_PRIORITY.get(priority or "standard", QUEUE_BY_PRIORITY["standard"])
+
+def get_rq_queue(priority: str = "standard"):
+    """
+    Queue RQ de la prioridad pedida sobre el pool Redis compartido (None sin Redis).
+    """
+    conn = get_redis()
+    if conn is None:
+        return None
+    from rq import Queue
+    return Queue(_queue_name(priority), connection=conn)
+
+def enqueue_generate_and_deliver(order_id: str, priority: str = "standard", duration: Optional[float] = None):
+    """
+    Si REDIS_URL existe, intenta encolar con RQ en la cola de la prioridad pedida
+    ("express" | "standard" | "retry"). Las órdenes standard pasan antes por el sorted set
+    SJF (duration = segundos de audio, ver helpers/audio_meta.py).
+    Si no (o si RQ falla), encola en la cola local durable (SQLite) que consume un pool fijo
+    de threads (helpers/local_queue.py): concurrencia acotada y sin pérdida de jobs al reiniciar.
+    """
+    try:
+        q = get_rq_queue(priority)
+        if q is not None and q.name == QUEUE_BY_PRIORITY["standard"]:
+            member = json.dumps({"order_id": order_id, "trace_context": tracing.inject_context(),
+                                 "duration": duration}, sort_keys=True)
+            score = sjf_score(duration, time.time())
+            q.connection.zadd(SJF_KEY, {member: score})
+            progress.set_stage(order_id, "queued", state="queued", queue=q.name, enqueued_at=time.time(),
+                               duration=duration)
+            return {"sjf": True, "queue": q.name, "score": score}
+        if q is not None:
+            # trace_context: el worker continúa el trace del webhook
+            job = q.enqueue("main.generate_and_deliver", order_id, trace_context=tracing.inject_context(),
+                            job_timeout=JOB_TIMEOUT, retry=_rq_retry())
+            progress.set_stage(order_id, "queued", state="queued", queue=q.name, enqueued_at=time.time(),
+                               duration=duration)
+            return {"job_id": job.id, "queue": q.name}
+    except Exception as e:
+        print("RQ enqueue falló:", e)
+
+    # Fallback: cola local durable + pool fijo de workers
+    from helpers import local_queue
+    job_id = local_queue.get_queue().enqueue("main.generate_and_deliver", order_id, priority=priority,
+                                             duration=duration, trace_context=tracing.inject_context())
+    progress.set_stage(order_id, "queued", state="queued", queue="local", enqueued_at=time.time(), duration=duration)
+    # con REDIS_URL este es el fallback de un enqueue RQ fallido: el worker escucha RQ, no la cola local
+    if LOCAL_QUEUE_IN_WEB or os.getenv("REDIS_URL"):
+        local_queue.start_pool()
+    return {"local_job_id": job_id}
+
+def enqueue_many_generate_and_deliver(order_ids: Iterable[str], priority: str = "retry"):
+    """
+    Encola muchas órdenes de una vez (backfill de main.py): un solo round-trip a Redis
+    (Queue.enqueue_many en pipeline) o una sola transacción SQLite en la cola local.
+    Devuelve la lista de ids de job.
+    """
+    order_ids = [str(o) for o in order_ids if o]
+    if not order_ids:
+        return []
+    trace_context = tracing.inject_context()
+    try:
+        q = get_rq_queue(priority)
+        if q is not None:
             from rq import Queue
-            conn = Redis.from_url(redis_url)
-            q = Queue("reda", connection=conn)
-            job = q.enqueue("main.generate_and_deliver", order_id, enqueue_timeout=3600, timeout=3600)
-            return {"job_id": job.id}
-        except Exception as e:
-            print("RQ enqueue falló:", e)
-
-    # Fallback: background thread
-    def worker():
-        try:
-            import main
-            if hasattr(main, "generate_and_deliver"):
-                main.generate_and_deliver(order_id)
-            elif hasattr(main, "ejecutar_flujo_redaxion"):
-                # Si no existe función por orden, intenta ejecutar flujo completo (menos ideal)
-                main.ejecutar_flujo_redaxion()
-            else:
-                print("No se encontró función de procesamiento en main.py")
-        except Exception as e:
-            print("Error en worker:", e)
-
-    t = threading.Thread(target=worker, daemon=True)
-    t.start()
-    return {"background": True}
+            jobs = q.enqueue_many([
+                Queue.prepare_data("main.generate_and_deliver", args=(oid,), kwargs={"trace_context": trace_context},
+                                   timeout=JOB_TIMEOUT, retry=_rq_retry())
+                for oid in order_ids
+            ])
+            return [j.id for j in jobs]
+    except Exception as e:
+        print("RQ enqueue_many falló:", e)
+
+    from helpers import local_queue
+    return local_queue.get_queue().enqueue_many(
+        "main.generate_and_deliver", [((oid,), {"trace_context": trace_context}) for oid in order_ids], priority=priority
+    )
+
+def _claims_keys(key: str):
+    return f"{key}:claims", f"{key}:claims:score"
+
+def _claim(q, key: str, max_ready: int, limit: int, max_score="+inf"):
+    """
+    Reclama hasta `limit` miembros de `key` con score <= max_score (ver _CLAIM_SCRIPT). [(miembro, score)].
+    """
+    now = time.time()
+    claims, scores = _claims_keys(key)
+    items = q.connection.eval(_CLAIM_SCRIPT, 4, key, claims, scores, q.key,
+                              now, max_ready, limit, max_score, now - FEED_CLAIM_TIMEOUT)
+    return [(items[i], float(items[i + 1])) for i in range(0, len(items), 2)]
+
+def _enqueue_claimed(q, key: str, member, score: float, **kwargs):
+    """
+    Encola el miembro reclamado y libera el reclamo en una sola transacción; si falla, vuelve al set.
+    """
+    claims, scores = _claims_keys(key)
+    data = json.loads(member)
+    try:
+        with q.connection.pipeline() as pipe:
+            q.enqueue_call("main.generate_and_deliver", args=(data["order_id"],),
+                           kwargs={"trace_context": data.get("trace_context") or {}, **kwargs},
+                           timeout=JOB_TIMEOUT, retry=_rq_retry(), pipeline=pipe)
+            pipe.zrem(claims, member)
+            pipe.hdel(scores, member)
+            pipe.execute()
+    except Exception:
+        with q.connection.pipeline() as pipe:
+            pipe.zadd(key, {member: score})
+            pipe.zrem(claims, member)
+            pipe.hdel(scores, member)
+            pipe.execute()
+        raise
+
+def feed_sjf(max_ready: int = 1) -> int:
+    """
+    Pasa a la cola RQ standard la orden SJF con menor score si la cola tiene menos de
+    max_ready jobs esperando. La llaman los threads del worker antes de pedir trabajo, así
+    la decisión de qué orden corre se toma lo más tarde posible. Devuelve cuántas movió.
+    """
+    q = get_rq_queue("standard")
+    if q is None:
+        return 0
+    moved = 0
+    for member, score in _claim(q, SJF_KEY, max_ready, 1):
+        _enqueue_claimed(q, SJF_KEY, member, score)
+        moved += 1
+    return moved
+
+def defer_generate_and_deliver(order_id: str, delay: float, reason: str = ""):
+    """
+    Reencola la orden para dentro de `delay` segundos en la cola de reintentos sin ocupar un worker
+    mientras tanto (proveedor caído). Con Redis: sorted set DEFERRED_KEY; sin Redis: available_at
+    de la cola local.
+    """
+    retry_at = time.time() + max(0.0, delay)
+    trace_context = tracing.inject_context()
+    conn = get_redis()
+    if conn is not None:
+        member = json.dumps({"order_id": order_id, "trace_context": trace_context, "reason": reason}, sort_keys=True)
+        conn.zadd(DEFERRED_KEY, {member: retry_at})
+        result = {"deferred": True, "retry_at": retry_at}
+    else:
+        from helpers import local_queue
+        job_id = local_queue.get_queue().enqueue("main.generate_and_deliver", order_id, priority="retry", delay=delay,
+                                                 trace_context=trace_context)
+        result = {"local_job_id": job_id, "retry_at": retry_at}
+    progress.set_stage(order_id, "deferred", state="deferred", retry_at=retry_at, reason=reason)
+    return result
+
+def feed_deferred(limit: int = 10) -> int:
+    """
+    Pasa a reda-retry las órdenes diferidas cuyo reintento ya venció. La llaman los threads del worker.
+    """
+    q = get_rq_queue("retry")
+    if q is None:
+        return 0
+    moved = 0
+    for member, score in _claim(q, DEFERRED_KEY, -1, limit, max_score=time.time()):
+        # finalizaciones de fan-out diferidas (enqueue_finalize con delay) conservan fanout=False
+        extra = {"fanout": False} if json.loads(member).get("fanout") is False else {}
+        _enqueue_claimed(q, DEFERRED_KEY, member, score, **extra)
+        moved += 1
+    return moved
+
+def feed_scheduled(queue_names, limit: int = 10) -> int:
+    """
+    Devuelve a su cola los reintentos RQ cuyo intervalo venció. Hace el trabajo del scheduler de RQ,
+    que los threads de worker.py no corren; el ZREM decide qué thread mueve cada job.
+    """
+    conn = get_redis()
+    if conn is None:
+        return 0
+    from rq import Queue
+    from rq.job import Job
+    from rq.registry import ScheduledJobRegistry
+    moved = 0
+    for name in queue_names:
+        q = Queue(name, connection=conn)
+        registry = ScheduledJobRegistry(queue=q)
+        for job_id in registry.get_jobs_to_schedule(chunk_size=limit):
+            if not conn.zrem(registry.key, job_id):
+                continue
+            try:
+                job = Job.fetch(job_id, connection=conn)
+            except Exception:
+                continue  # expiró o se borró mientras esperaba
+            q.enqueue_job(job)
+            moved += 1
+    return moved
+
+def sjf_pending() -> int:
+    conn = get_redis()
+    return conn.zcard(SJF_KEY) if conn is not None else 0
+
+# -----------------------
+# Fan-out de bloques (main.process_block_job)
+# -----------------------
+def _barrier_key(order_id: str) -> str:
+    return f"fanout:{order_id}"
+
+def open_barrier(order_id: str, pending: int) -> bool:
+    """
+    Crea el contador de sub-jobs pendientes. False si ya hay un fan-out en curso para la orden.
+    """
+    conn = get_redis()
+    return bool(conn.set(_barrier_key(order_id), pending, nx=True, ex=FANOUT_TTL))
+
+def close_barrier(order_id: str):
+    conn = get_redis()
+    if conn is not None:
+        conn.delete(_barrier_key(order_id))
+
+def barrier_arrive(order_id: str) -> bool:
+    """
+    Un sub-job terminó (bien o mal). True solo para el último: ese encola la finalización.
+    """
+    conn = get_redis()
+    remaining = conn.decr(_barrier_key(order_id))
+    if remaining <= 0:
+        # < 0: la barrera había vencido (FANOUT_TTL); la orden se retoma por reintento/backfill
+        conn.delete(_barrier_key(order_id))
+    return remaining == 0
+
+def enqueue_block_jobs(order_id: str, block_indexes, total_blocks: int):
+    """
+    Un sub-job RQ por bloque en la cola reda-blocks, en un solo round-trip. Devuelve los ids.
+    """
+    from rq import Queue
+    q = get_rq_queue("blocks")
+    trace_context = tracing.inject_context()
+    jobs = q.enqueue_many([
+        Queue.prepare_data("main.process_block_job", args=(order_id, i, total_blocks),
+                           kwargs={"trace_context": trace_context}, timeout=JOB_TIMEOUT)
+        for i in block_indexes
+    ])
+    return [j.id for j in jobs]
+
+def enqueue_finalize(order_id: str, trace_context: Optional[dict] = None, delay: float = 0):
+    """
+    Encola la etapa final (unir bloques, render y entrega): generate_and_deliver sin fan-out,
+    que encuentra todos los bloques en los checkpoints.
+    delay: reintento diferido (sorted set DEFERRED_KEY) cuando el lock de la orden sigue tomado.
+    """
+    if delay:
+        member = json.dumps({"order_id": order_id, "trace_context": trace_context or {}, "fanout": False,
+                             "reason": "finalize_lock_busy"}, sort_keys=True)
+        get_redis().zadd(DEFERRED_KEY, {member: time.time() + delay})
+        return None
+    q = get_rq_queue("blocks")
+    job = q.enqueue("main.generate_and_deliver", order_id, trace_context=trace_context or {}, fanout=False,
+                    job_timeout=JOB_TIMEOUT, retry=_rq_retry())
+    return job.id
+
+def start_background_workers():
+    """
+    Sin REDIS_URL y con LOCAL_QUEUE_IN_WEB=1, arranca el pool de la cola local en este proceso
+    (startup del web) para retomar los jobs que quedaron pendientes antes de un reinicio.
+    """
+    if os.getenv("REDIS_URL") or not LOCAL_QUEUE_IN_WEB:
+        return
+    from helpers import local_queue
+    local_queue.start_pool()
@@ -0,0 +1,48 @@
+# helpers/redis_conn.py
+"""
+Pool de conexiones Redis compartido por cola (RQ), locks y checkpoints/cache.
+
+Un pool por proceso y por modo de decodificación: RQ y los artifacts binarios usan bytes
+(decode_responses=False); locks usa strings. redis-py recrea el pool tras un fork, así que
+los hijos de worker.py obtienen conexiones propias automáticamente.
+"""
+import os
+import logging
+import threading
+
+logger = logging.getLogger("redis_conn")
+logger.setLevel(logging.INFO)
+
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+# Sin timeout un Redis colgado bloquea al webhook y a los workers indefinidamente. Los workers RQ lo
+# suben por su cuenta para el BLPOP del dequeue (rq.Worker._set_connection).
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "10"))
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def get_redis(decode_responses: bool = False):
+    """
+    Devuelve un cliente Redis sobre el pool compartido, o None si no hay REDIS_URL
+    (o si falla la inicialización): los llamadores caen a su modo sin Redis.
+    """
+    if not REDIS_URL:
+        return None
+    try:
+        import redis
+        with _lock:
+            pool = _pools.get(decode_responses)
+            if pool is None:
+                pool = redis.ConnectionPool.from_url(
+                    REDIS_URL, decode_responses=decode_responses, max_connections=REDIS_MAX_CONNECTIONS,
+                    socket_timeout=REDIS_SOCKET_TIMEOUT, socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+                    socket_keepalive=True, health_check_interval=30,
+                )
+                _pools[decode_responses] = pool
+        return redis.Redis(connection_pool=pool)
+    except Exception:
+        logger.exception("No se pudo inicializar el pool Redis con REDIS_URL.")
+        return None
+
@@ -5,6 +5,9 @@ import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 from datetime import datetime
 
+from helpers import deadline
+from helpers.metrics import track_external
+
 def _get_client():
     creds_json = os.getenv("GOOGLE_SHEETS_CREDENTIALS_JSON")
     if not creds_json:
@@ -12,8 +15,12 @@ def _get_client():
     info = json.loads(creds_json)
     scope = ['https://spreadsheets.google.com/feeds','https://www.googleapis.com/auth/drive']
     creds = ServiceAccountCredentials.from_json_keyfile_dict(info, scope)
-    return gspread.authorize(creds)
+    client = gspread.authorize(creds)
+    # dentro de una orden, cada request a Sheets respeta el plazo restante
+    client.set_timeout(deadline.timeout(60, "sheets"))
+    return client
 
+@track_external("sheets", "append_row")
 def add_row_to_sheets(row: dict):
     """
     row: dict con keys como orden, fecha, nombre, email, audio_url, columnas, color, estado
@@ -30,9 +37,16 @@ def add_row_to_sheets(row: dict):
     headers = ws.row_values(1)
     # Si hoja vacía, crea encabezados basicos
     if not headers:
-        headers = ["orden","fecha","nombre","email","audio_url","columnas","color","estado","payment_id","comentarios"]
+        headers = ["orden","fecha","nombre","email","audio_url","columnas","color","prioridad","duracion_seg",
+                   "estado","payment_id","comentarios"]
         ws.insert_row(headers, index=1)
 
+    # Columnas nuevas (p. ej. prioridad, duracion_seg) en hojas creadas antes: se agregan al final
+    for key in row:
+        if key not in headers:
+            headers.append(key)
+            ws.update_cell(1, len(headers), key)
+
     # Prepare row in header order
     fecha = row.get("fecha") or datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
     values = []
@@ -44,6 +58,7 @@ def add_row_to_sheets(row: dict):
     ws.append_row(values)
     return True
 
+@track_external("sheets", "mark_paid")
 def mark_order_paid_in_sheets(order_id: str, payment_id: str):
     client = _get_client()
     sheet_id = os.getenv("SHEET_ID")
@@ -0,0 +1,152 @@
+# helpers/speculative.py
+"""
+Transcripción especulativa: empezar AssemblyAI (y opcionalmente los primeros bloques LLM)
+apenas se sube el audio en create_order, sin esperar la confirmación del pago.
+
+- Opt-in con SPECULATIVE_TRANSCRIPTION=1; requiere Redis como backend de checkpoints.
+- El job corre en su propia cola (reda-speculative) con workers dedicados (Procfile: speculative):
+  el polling a AssemblyAI de órdenes no pagadas nunca le quita workers a órdenes pagadas. Sin esos
+  workers los jobs esperan en la cola y la orden pagada transcribe por su cuenta.
+- Los resultados se guardan como checkpoints con TTL = lo que queda de SPECULATIVE_WINDOW_SECONDS:
+  si la orden no se paga dentro de la ventana, Redis los descarta solo.
+- Si la ventana vence con la transcripción en curso y sin pago, se cancela en AssemblyAI.
+- Al aprobarse el pago (mp_webhook) confirm() extiende los checkpoints al TTL normal;
+  generate_and_deliver los restaura y, si la transcripción sigue en curso, espera ese mismo
+  transcript_id en vez de crear otro.
+"""
+import os
+import json
+import time
+import logging
+from typing import Optional
+
+from helpers import checkpoints
+from helpers.redis_conn import get_redis
+
+logger = logging.getLogger("speculative")
+logger.setLevel(logging.INFO)
+
+SPECULATIVE_ENABLED = os.getenv("SPECULATIVE_TRANSCRIPTION", "0") == "1"
+SPECULATIVE_WINDOW = int(os.getenv("SPECULATIVE_WINDOW_SECONDS", "3600"))
+SPECULATIVE_BLOCKS = int(os.getenv("SPECULATIVE_BLOCKS", "0"))  # primeros bloques LLM a adelantar
+JOB_TIMEOUT = SPECULATIVE_WINDOW + 600
+
+
+def _key(order_id: str) -> str:
+    return f"speculative:{order_id}"
+
+
+def enabled() -> bool:
+    return SPECULATIVE_ENABLED and get_redis() is not None and checkpoints.backend() == "redis"
+
+
+def _state(order_id: str) -> Optional[dict]:
+    raw = get_redis(decode_responses=True).get(_key(order_id))
+    return json.loads(raw) if raw else None
+
+
+def _set_state(order_id: str, **fields):
+    state = _state(order_id) or {}
+    state.update(fields)
+    get_redis(decode_responses=True).set(_key(order_id), json.dumps(state), ex=JOB_TIMEOUT)
+
+
+def _ttl(order_id: str) -> Optional[int]:
+    """
+    TTL para los checkpoints especulativos: None (TTL normal) si ya se pagó, lo que queda de
+    la ventana si no, 0 si la ventana venció.
+    """
+    state = _state(order_id)
+    if not state or state.get("state") == "cancelled":
+        return 0
+    if state.get("state") == "paid":
+        return None
+    return max(0, int(state["started_at"] + SPECULATIVE_WINDOW - time.time()))
+
+
+def start(order_id: str, audio_url: str):
+    """
+    create_order: encola el trabajo especulativo. No-op si el modo no está activo.
+    """
+    if not enabled():
+        return None
+    try:
+        from helpers.queue import get_rq_queue
+        _set_state(order_id, state="running", started_at=time.time())
+        job = get_rq_queue("speculative").enqueue("helpers.speculative.run_speculative", order_id, audio_url,
+                                            job_timeout=JOB_TIMEOUT)
+        logger.info("Transcripción especulativa encolada para la orden %s (job %s)", order_id, job.id)
+        return job.id
+    except Exception:
+        logger.exception("No se pudo encolar la transcripción especulativa de %s (no crítico)", order_id)
+        return None
+
+
+def confirm(order_id: str):
+    """
+    mp_webhook (pago aprobado): lo ya adelantado pasa a ser checkpoint normal.
+    Pagada fuera de la ventana: se descarta lo especulativo (p. ej. un transcript_id cancelado).
+    """
+    if not enabled():
+        return
+    try:
+        if not _state(order_id):
+            return
+        if _ttl(order_id) == 0:
+            checkpoints.clear(order_id)
+            _set_state(order_id, state="cancelled")
+        else:
+            _set_state(order_id, state="paid", paid_at=time.time())
+            checkpoints.touch(order_id)
+    except Exception:
+        logger.exception("No se pudo confirmar la especulación de la orden %s", order_id)
+
+
+def run_speculative(order_id: str, audio_url: str):
+    """
+    Job RQ: transcribe y adelanta hasta SPECULATIVE_BLOCKS bloques mientras la ventana siga abierta.
+    """
+    from helpers.assemblyai import crear_transcripcion, esperar_transcripcion, cancelar_transcripcion
+
+    ttl = _ttl(order_id)
+    if ttl is None or ttl == 0:
+        # ya pagada: generate_and_deliver transcribe por su cuenta; vencida: nada que hacer
+        logger.info("Especulación de %s sin efecto (ya pagada, vencida o cancelada)", order_id)
+        return False
+
+    texto = checkpoints.load_text(order_id, "transcript")
+    if not texto:
+        tid = crear_transcripcion(audio_url)
+        checkpoints.save_text(order_id, "transcript_id", tid, ttl=ttl)
+        try:
+            result = esperar_transcripcion(tid, order_id=order_id, timeout=ttl)
+        except TimeoutError:
+            if _ttl(order_id) == 0:
+                logger.info("Orden %s no pagada dentro de la ventana: se cancela la transcripción %s", order_id, tid)
+                cancelar_transcripcion(tid)
+                _set_state(order_id, state="cancelled")
+            return False
+        texto = result.get("text") or ""
+        ttl = _ttl(order_id)
+        if ttl == 0:
+            return False
+        checkpoints.save_text(order_id, "transcript", texto, ttl=ttl)
+        logger.info("Transcripción especulativa lista para %s (%s chars)", order_id, len(texto))
+
+    if SPECULATIVE_BLOCKS <= 0:
+        return True
+
+    import main
+    blocks = main.split_text_into_blocks(texto, words_per_block=main.WORDS_PER_BLOCK)
+    for i, blk in enumerate(blocks[:SPECULATIVE_BLOCKS], start=1):
+        ttl = _ttl(order_id)
+        # pagada: el pipeline real sigue con los bloques (evita procesarlos dos veces); vencida: se descarta
+        if ttl is None or ttl == 0:
+            break
+        if checkpoints.load_text(order_id, f"block_{i}"):
+            continue
+        pb = main.call_chatgpt_for_block(blk, i, order_id, len(blocks))
+        ttl = _ttl(order_id)
+        if ttl != 0 and not main._is_error_block(pb):
+            checkpoints.save_text(order_id, f"block_{i}", pb, ttl=ttl)
+    return True
@@ -0,0 +1,129 @@
+# helpers/subir_archivo.py
+"""
+Subida de entregables a Google Drive (API v3, subida resumable por chunks).
+
+Cada archivo queda en la carpeta DRIVE_FOLDER_ID. Las credenciales son las de la cuenta de servicio
+(GOOGLE_DRIVE_CREDENTIALS_JSON, o GCS_CREDENTIALS_JSON si es la misma cuenta); la carpeta debe estar
+compartida con ella. Sin carpeta o sin credenciales available() es False y main no sube nada a Drive.
+
+La subida multipart de Drive acepta hasta 5 MB y los DOCX/PDF de órdenes largas pesan más: se abre una
+sesión resumable y los bytes van en chunks de DRIVE_CHUNK_SIZE. Si un chunk falla (red o 5xx) se consulta
+a Drive cuánto recibió y se sigue desde ahí, hasta DRIVE_CHUNK_RETRIES veces seguidas.
+"""
+import os
+import json
+import logging
+import mimetypes
+import threading
+
+from google.oauth2 import service_account
+from google.auth.transport.requests import AuthorizedSession
+
+from helpers import deadline
+
+logger = logging.getLogger("drive")
+logger.setLevel(logging.INFO)
+
+DRIVE_FOLDER_ID = os.getenv("DRIVE_FOLDER_ID")
+DRIVE_CREDENTIALS_JSON = os.getenv("GOOGLE_DRIVE_CREDENTIALS_JSON") or os.getenv("GCS_CREDENTIALS_JSON")
+UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+SCOPES = ["https://www.googleapis.com/auth/drive.file"]
+# Drive exige chunks múltiplos de 256 KiB (salvo el último)
+_CHUNK_UNIT = 256 * 1024
+DRIVE_CHUNK_SIZE = max(1, int(os.getenv("DRIVE_CHUNK_SIZE", str(8 * 1024 * 1024))) // _CHUNK_UNIT) * _CHUNK_UNIT
+DRIVE_CHUNK_RETRIES = int(os.getenv("DRIVE_CHUNK_RETRIES", "3"))
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def available() -> bool:
+    return bool(DRIVE_FOLDER_ID and DRIVE_CREDENTIALS_JSON)
+
+
+def _get_session() -> AuthorizedSession:
+    # una sesión por proceso: reutiliza el token y las conexiones entre subidas
+    global _session
+    with _session_lock:
+        if _session is None:
+            if not available():
+                raise RuntimeError("DRIVE_FOLDER_ID o credenciales de Drive no configuradas")
+            info = json.loads(DRIVE_CREDENTIALS_JSON)
+            creds = service_account.Credentials.from_service_account_info(info, scopes=SCOPES)
+            _session = AuthorizedSession(creds)
+        return _session
+
+
+def _received(resp) -> int:
+    """
+    Bytes confirmados por Drive en una respuesta 308 ("Range: bytes=0-N"; sin header, ninguno).
+    """
+    rng = resp.headers.get("Range")
+    return int(rng.rsplit("-", 1)[1]) + 1 if rng else 0
+
+
+def _start_session(session, nombre: str, order_id, size: int, content_type: str) -> str:
+    metadata = {"name": nombre, "parents": [DRIVE_FOLDER_ID]}
+    if order_id is not None:
+        metadata["appProperties"] = {"order_id": str(order_id)}
+    resp = session.post(
+        UPLOAD_URL,
+        params={"uploadType": "resumable", "supportsAllDrives": "true", "fields": "id"},
+        data=json.dumps(metadata),
+        headers={"Content-Type": "application/json; charset=UTF-8",
+                 "X-Upload-Content-Type": content_type, "X-Upload-Content-Length": str(size)},
+        timeout=deadline.timeout(60, "drive.upload"),
+    )
+    resp.raise_for_status()
+    return resp.headers["Location"]
+
+
+def _upload_status(session, url: str, size: int):
+    # PUT vacío con "bytes */total": Drive responde 308 con lo recibido, o 200/201 si ya está completo
+    return session.put(url, headers={"Content-Range": f"bytes */{size}"}, timeout=deadline.timeout(60, "drive.upload"))
+
+
+def subir_archivo_a_drive(source, nombre: str, order_id=None) -> str:
+    """
+    Sube source (bytes en memoria o ruta local) como `nombre` a DRIVE_FOLDER_ID y devuelve el id del archivo.
+    main la llama dentro de metrics.external_call("drive", "upload").
+    """
+    if isinstance(source, str):
+        with open(source, "rb") as fh:
+            source = fh.read()
+    data = memoryview(source)
+    size = len(data)
+    content_type = mimetypes.guess_type(nombre)[0] or "application/octet-stream"
+    session = _get_session()
+    url = _start_session(session, nombre, order_id, size, content_type)
+
+    offset, failures, resp = 0, 0, None
+    while True:
+        end = min(offset + DRIVE_CHUNK_SIZE, size)
+        try:
+            resp = session.put(
+                url, data=bytes(data[offset:end]),
+                headers={"Content-Range": f"bytes {offset}-{end - 1}/{size}" if size else f"bytes */{size}"},
+                timeout=deadline.timeout(120, "drive.upload"),
+            )
+            if resp.status_code >= 500:
+                resp.raise_for_status()
+        except Exception as e:
+            failures += 1
+            if failures > DRIVE_CHUNK_RETRIES:
+                raise
+            logger.warning("Drive: chunk %s-%s de %s falló (%s); se retoma", offset, end - 1, nombre, e)
+            resp = _upload_status(session, url, size)
+            if resp.status_code >= 500:
+                continue
+        else:
+            failures = 0
+        if resp.status_code == 308:
+            offset = _received(resp)
+            continue
+        resp.raise_for_status()
+        break
+
+    file_id = resp.json()["id"]
+    logger.info("Drive: %s subido (%s KB, id %s)", nombre, size // 1024, file_id)
+    return file_id
@@ -0,0 +1,139 @@
+# helpers/tracing.py
+"""
+Tracing distribuido (OpenTelemetry) desde la subida de la orden hasta la entrega en el worker.
+
+- Cada etapa y cada llamada externa abre un span (helpers.metrics.stage_timer / external_call
+  lo hacen automáticamente).
+- El contexto de trace viaja dentro del job RQ (kwarg trace_context, formato W3C traceparent),
+  de modo que el trace del worker continúa el del webhook de Mercado Pago.
+
+Exportación:
+- OTEL_EXPORTER_OTLP_ENDPOINT: collector local/remoto vía OTLP/HTTP.
+- REDAXION_TRACE_FILE: un span JSON por línea en ese archivo.
+- Sin ninguno (o sin opentelemetry instalado): spans no-op.
+"""
+import os
+import json
+import logging
+from contextlib import contextmanager
+from typing import Optional
+
+logger = logging.getLogger("tracing")
+logger.setLevel(logging.INFO)
+
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "redaxion")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT")
+TRACE_FILE = os.getenv("REDAXION_TRACE_FILE")
+
+try:
+    from opentelemetry import trace, context as otel_context
+    from opentelemetry.propagate import inject, extract
+    from opentelemetry.trace import Status, StatusCode
+except Exception:
+    trace = None
+    logger.warning("opentelemetry no instalado: tracing deshabilitado.")
+
+_tracer = None
+
+
+def _setup_provider():
+    """
+    Configura el TracerProvider una vez por proceso (web o worker).
+    """
+    if not (OTLP_ENDPOINT or TRACE_FILE):
+        return
+    try:
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+        provider = TracerProvider(resource=Resource.create({"service.name": SERVICE_NAME}))
+        if OTLP_ENDPOINT:
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+            endpoint = OTLP_ENDPOINT.rstrip("/")
+            if not endpoint.endswith("/v1/traces"):
+                endpoint += "/v1/traces"
+            provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=endpoint)))
+        if TRACE_FILE:
+            out = open(TRACE_FILE, "a", encoding="utf-8")
+            exporter = ConsoleSpanExporter(out=out, formatter=lambda s: json.dumps(json.loads(s.to_json())) + "\n")
+            provider.add_span_processor(BatchSpanProcessor(exporter))
+        trace.set_tracer_provider(provider)
+        logger.info("Tracing activo (otlp=%s file=%s)", OTLP_ENDPOINT, TRACE_FILE)
+    except Exception:
+        logger.exception("No se pudo configurar el exportador de tracing; spans no-op.")
+
+
+def _get_tracer():
+    global _tracer
+    if trace is None:
+        return None
+    if _tracer is None:
+        _setup_provider()
+        _tracer = trace.get_tracer("redaxion")
+    return _tracer
+
+
+def _clean_attributes(attributes: dict) -> dict:
+    # OTel solo acepta str/bool/int/float (o secuencias de ellos)
+    return {k: (v if isinstance(v, (str, bool, int, float)) else str(v)) for k, v in attributes.items() if v is not None}
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    with span("openai.chat_completion", model="gpt-4o-mini"): ...
+    Marca el span con error (y registra la excepción) si el bloque levanta.
+    """
+    tracer = _get_tracer()
+    if tracer is None:
+        yield None
+        return
+    with tracer.start_as_current_span(name, attributes=_clean_attributes(attributes),
+                                      record_exception=False, set_status_on_exception=False) as sp:
+        try:
+            yield sp
+        except BaseException as e:
+            sp.record_exception(e)
+            sp.set_status(Status(StatusCode.ERROR, str(e)))
+            raise
+
+
+def inject_context() -> dict:
+    """
+    Serializa el contexto actual (traceparent) para viajar dentro de un job RQ.
+    """
+    carrier = {}
+    if trace is not None:
+        inject(carrier)
+    return carrier
+
+
+@contextmanager
+def continue_trace(carrier: Optional[dict], name: str, **attributes):
+    """
+    Abre un span hijo del contexto recibido en carrier (p. ej. en el worker RQ).
+    Sin carrier, inicia un trace nuevo.
+    """
+    if trace is None or not carrier:
+        with span(name, **attributes) as sp:
+            yield sp
+        return
+    token = otel_context.attach(extract(carrier))
+    try:
+        with span(name, **attributes) as sp:
+            yield sp
+    finally:
+        otel_context.detach(token)
+
+
+def current_trace_id() -> Optional[str]:
+    """
+    trace_id en hex del span activo, para correlacionar los print/logs con el trace.
+    """
+    if trace is None:
+        return None
+    ctx = trace.get_current_span().get_span_context()
+    if not ctx or not ctx.is_valid:
+        return None
+    return format(ctx.trace_id, "032x")
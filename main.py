@@ -14,11 +14,14 @@ Orquesta el flujo completo para una orden:
 """
 
 import os
+import time
 import tempfile
 import traceback
 import shutil
 import json
 import requests
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
 # Intentar importar tus helpers (estructura original). Si están en 'helpers.*' ajustamos.
@@ -60,6 +63,88 @@ except Exception:
         enviar_correo_con_adjuntos = None
         convertir_a_pdf = None
 
+from helpers import artifacts, checkpoints, circuit, deadline, images, locks, metrics, packaging, progress, tracing
+from helpers import queue as job_queue
+
+# El bloque de arriba es todo o nada y helpers.sheets no tiene las funciones de la planilla antigua, así que
+# los helpers que sí existen se importan uno por uno (igual que convertidor_pdf y formatter_pdf más abajo)
+try:
+    from helpers.assemblyai import transcribir_audio
+except Exception:
+    transcribir_audio = None
+
+try:
+    from helpers.process_txt import procesar_txt_con_chatgpt_block
+except Exception:
+    procesar_txt_con_chatgpt_block = None
+
+# Drive (helpers/subir_archivo.py): sin DRIVE_FOLDER_ID o sin credenciales no se sube nada
+try:
+    from helpers import subir_archivo
+    subir_archivo_a_drive = subir_archivo.subir_archivo_a_drive if subir_archivo.available() else None
+except Exception:
+    subir_archivo_a_drive = None
+
+try:
+    from helpers.enviar_correo import enviar_correo_con_adjuntos
+except Exception:
+    enviar_correo_con_adjuntos = None
+
+# Transcripción especulativa (helpers/speculative.py): retomar el transcript_id ya lanzado al subir el audio
+try:
+    from helpers.assemblyai import esperar_transcripcion
+except Exception:
+    esperar_transcripcion = None
+
+# TCP con la plantilla de la orden (helpers/formatter_docx.py, plantillas parseadas una vez por variante)
+try:
+    from helpers.formatter_docx import guardar_como_docx, incremental_tcp
+except Exception:
+    guardar_como_docx = None
+    incremental_tcp = None
+
+# DOCX -> PDF con el pool de helpers/convertidor_pdf.py (persistente con unoserver; con soffice, un proceso por
+# documento); sin backend no hay PDF
+try:
+    from helpers import convertidor_pdf
+    convertir_a_pdf = convertidor_pdf.convertir_a_pdf if convertidor_pdf.available() else None
+except Exception:
+    convertir_a_pdf = None
+
+# Markdown -> PDF directo (helpers/formatter_pdf.py). PDF_RENDERER: "native" (por defecto, sin esperar al
+# DOCX ni a LibreOffice) o "convert" (DOCX -> PDF con el pool de convertidor_pdf, fiel a la plantilla Word).
+# Un documento con caracteres fuera de WinAnsi (fuentes base del PDF nativo) se convierte desde el DOCX.
+try:
+    from helpers.formatter_pdf import guardar_como_pdf, unsupported_chars
+except Exception:
+    guardar_como_pdf = None
+    unsupported_chars = None
+PDF_RENDERER = os.getenv("PDF_RENDERER", "native")
+
+# Quiz real por bloque (helpers/generar_quiz.py); si no está disponible se usa el stub de preguntas.
+try:
+    from helpers.generar_quiz import generar_quiz_from_text, parse_quiz_text
+except Exception:
+    generar_quiz_from_text = None
+    parse_quiz_text = None
+
+QUIZ_MAX_WORKERS = int(os.getenv("QUIZ_MAX_WORKERS", "2"))
+
+from helpers.pipeline import Stage, run_dag
+
+# Etapas de entrega (pasos 8-13): paralelismo y timeouts por tipo de etapa (segundos)
+PIPELINE_MAX_WORKERS = int(os.getenv("PIPELINE_MAX_WORKERS", "4"))
+STAGE_TIMEOUTS = {"render": 600, "pdf": 300, "upload": 180, "sheets": 60, "email": 120}
+
+WORDS_PER_BLOCK = 3000
+# Fan-out: con Redis y checkpoints compartidos, una orden con al menos BLOCK_FANOUT_MIN_BLOCKS bloques
+# pendientes los reparte como sub-jobs RQ entre todos los workers (0 = desactivado)
+BLOCK_FANOUT_MIN_BLOCKS = int(os.getenv("BLOCK_FANOUT_MIN_BLOCKS", "6"))
+# La finalización puede llegar antes de que el job padre suelte el lock de la orden: espera ese traspaso
+# y, si el lock sigue tomado, se reencola diferida en vez de descartarse como duplicado
+FANOUT_FINALIZE_LOCK_WAIT = float(os.getenv("FANOUT_FINALIZE_LOCK_WAIT", "15"))
+FANOUT_FINALIZE_RETRY_SECONDS = float(os.getenv("FANOUT_FINALIZE_RETRY_SECONDS", "30"))
+
 # -----------------------
 # Fallback directo a Google Sheets (si los helpers no funcionan)
 # -----------------------
@@ -159,7 +244,8 @@ def call_chatgpt_for_block(block_text: str, block_index: int, order_id: str, tot
     try:
         print(f"[CHATGPT] Iniciando bloque {block_index}/{total_blocks} (order {order_id})")
         if procesar_txt_con_chatgpt_block:
-            result = procesar_txt_con_chatgpt_block(block_text, order_id=order_id, block_index=block_index, total_blocks=total_blocks)
+            with metrics.stage_timer("llm_block"):
+                result = procesar_txt_con_chatgpt_block(block_text, order_id=order_id, block_index=block_index, total_blocks=total_blocks)
         else:
             print("[CHATGPT][STUB] helper procesar_txt_con_chatgpt_block no disponible. Usando stub.")
             sample = block_text[:5000] if len(block_text) > 5000 else block_text
@@ -175,11 +261,20 @@ def call_chatgpt_for_block(block_text: str, block_index: int, order_id: str, tot
             print(f"[CHATGPT][WARN] No se pudo guardar block_{block_index}.md: {e}")
 
         return result
+    except (deadline.DeadlineExceeded, circuit.CircuitOpen):
+        raise
     except Exception as e:
         print(f"[CHATGPT][ERROR] al procesar bloque {block_index}: {e}")
         traceback.print_exc()
         return f"## ERROR BLOQUE {block_index}\n\n{block_text[:8000]}\n\n"
 
+def _is_error_block(processed: str) -> bool:
+    """
+    Los fallbacks de error (main o process_txt) empiezan con '## ERROR'; no se guardan en checkpoint
+    para que un reintento vuelva a intentar ese bloque.
+    """
+    return not processed or processed.lstrip().startswith("## ERROR")
+
 def merge_processed_blocks(blocks_processed):
     return "\n\n".join(blocks_processed)
 
@@ -206,12 +301,35 @@ def extract_titles_subtitles(tcp_text: str):
 
 def search_image_for_topic(title: str, subtitle: str = ""):
     """
-    Placeholder: Buscar la mejor imagen para un tema.
-    Reemplaza esto con integración real (Unsplash, Bing Image Search, Google Custom Search, etc.).
+    Buscar la mejor imagen para un tema con la fuente configurada en helpers/images.py (IMAGE_SOURCE).
+    Sin fuente configurada devuelve None y el TCP sale sin imágenes.
     """
-    query = f"{title} {subtitle}".strip()
-    print(f"[IMG_SEARCH][STUB] buscar imagen para: {query}")
-    return f"https://via.placeholder.com/1200x800.png?text={query.replace(' ', '+')}"
+    return images.search(title, subtitle)
+
+def generate_quiz_for_block(processed_block: str, block_index: int, order_id: str):
+    """
+    Genera el RedaQuiz (7 preguntas) de un bloque ya procesado y lo devuelve estructurado
+    (lista de dicts question/options/answer/justification). Se ejecuta en paralelo al resto de bloques.
+    """
+    try:
+        raw = checkpoints.load_text(order_id, f"quiz_{block_index}")
+        if raw:
+            print(f"[QUIZ] Quiz bloque {block_index} restaurado desde checkpoint.")
+        else:
+            print(f"[QUIZ] Generando quiz para bloque {block_index} (order {order_id})")
+            with metrics.stage_timer("llm_quiz"):
+                raw = generar_quiz_from_text(processed_block, order_id=order_id, block_index=block_index)
+            if raw and not raw.startswith("ERROR:"):
+                checkpoints.save_text(order_id, f"quiz_{block_index}", raw)
+        questions = parse_quiz_text(raw)
+        print(f"[QUIZ] Bloque {block_index}: {len(questions)} preguntas parseadas.")
+        return questions
+    except (deadline.DeadlineExceeded, circuit.CircuitOpen):
+        raise
+    except Exception as e:
+        print(f"[QUIZ][ERROR] al generar quiz del bloque {block_index}: {e}")
+        traceback.print_exc()
+        return []
 
 def generate_questions_for_titles(titles_list, per_title=7):
     """
@@ -241,6 +359,7 @@ def generate_questions_for_titles(titles_list, per_title=7):
 def apply_docx_template_and_insert_images(tcp_text, images_map, out_path, color="azul", columnas="simple"):
     """
     Usa tu helper `guardar_como_docx` si existe; sino genera DOCX simple.
+    out_path: ruta o buffer binario (BytesIO) donde escribir el DOCX.
     """
     try:
         if guardar_como_docx:
@@ -264,7 +383,7 @@ def apply_docx_template_and_insert_images(tcp_text, images_map, out_path, color=
 
 def apply_quiz_template_and_save(questions_by_page, out_quiz_path, color="azul", columnas="simple"):
     """
-    Convierte questions_by_page a un docx con formato.
+    Convierte questions_by_page a un docx con formato (out_quiz_path: ruta o BytesIO).
     """
     try:
         if guardar_quiz_como_docx:
@@ -287,21 +406,122 @@ def apply_quiz_template_and_save(questions_by_page, out_quiz_path, color="azul",
         traceback.print_exc()
         return None
 
+def quiz_markdown(questions_by_page) -> str:
+    """
+    El quiz como markdown (mismo contenido que el DOCX del quiz) para el render PDF directo.
+    """
+    parts = []
+    for page, qs in questions_by_page.items():
+        parts.append(f"## Preguntas - Página {page}")
+        for idx, q in enumerate(qs, start=1):
+            parts.append(f"{idx}. {q['question']}")
+            parts.extend(f"   {opt}" for opt in q['options'])
+    return "\n\n".join(parts)
+
+# -----------------------
+# Fan-out de bloques entre workers
+# -----------------------
+def _should_fan_out(pending_blocks: int) -> bool:
+    return bool(BLOCK_FANOUT_MIN_BLOCKS and pending_blocks >= BLOCK_FANOUT_MIN_BLOCKS
+                and os.getenv("REDIS_URL") and checkpoints.backend() != "bypass")
+
+def _fan_out_blocks(order_id, pending, total_blocks) -> bool:
+    """
+    Encola un sub-job por bloque pendiente detrás de una barrera (contador en Redis).
+    True si la orden quedó en manos de los sub-jobs; False para procesar los bloques aquí.
+    """
+    if not job_queue.open_barrier(order_id, len(pending)):
+        print(f"[FANOUT] Orden {order_id} ya tiene un fan-out en curso; este job termina.")
+        return True
+    try:
+        job_ids = job_queue.enqueue_block_jobs(order_id, pending, total_blocks)
+    except Exception as e:
+        print(f"[FANOUT][WARN] No se pudieron encolar los sub-jobs de {order_id}: {e}. Procesando en este worker.")
+        job_queue.close_barrier(order_id)
+        return False
+    print(f"[FANOUT] Orden {order_id}: {len(job_ids)} bloques encolados como sub-jobs (de {total_blocks}).")
+    return True
+
+def process_block_job(order_id, block_index, total_blocks, trace_context=None):
+    """
+    Sub-job RQ: procesa un bloque (TCP + su quiz) y lo deja en checkpoints. El último sub-job
+    en llegar a la barrera encola la finalización (generate_and_deliver con fanout=False).
+    """
+    with tracing.continue_trace(trace_context, "process_block", order_id=order_id, block_index=block_index), \
+            deadline.scope():
+        ok = False
+        try:
+            pb = checkpoints.load_text(order_id, f"block_{block_index}")
+            if not pb:
+                texto = checkpoints.load_text(order_id, "transcript")
+                if not texto:
+                    print(f"[FANOUT][ERROR] Sin transcripción en checkpoint para {order_id}; bloque {block_index} omitido.")
+                    return False
+                blk = split_text_into_blocks(texto, words_per_block=WORDS_PER_BLOCK)[block_index - 1]
+                pb = call_chatgpt_for_block(blk, block_index, order_id, total_blocks)
+                if not _is_error_block(pb):
+                    checkpoints.save_text(order_id, f"block_{block_index}", pb)
+            ok = not _is_error_block(pb)
+            if ok and generar_quiz_from_text:
+                generate_quiz_for_block(pb, block_index, order_id)
+            progress.block_done(order_id)
+            return ok
+        except circuit.CircuitOpen as err:
+            # el bloque queda pendiente: la finalización lo reintenta (y difiere la orden si el circuito sigue abierto)
+            print(f"[FANOUT][CIRCUIT] Bloque {block_index} de {order_id} pendiente: {err}")
+            return False
+        finally:
+            # los bloques con error se reintentan en la finalización
+            if job_queue.barrier_arrive(order_id):
+                print(f"[FANOUT] Último bloque de {order_id} listo: encolando finalización.")
+                job_queue.enqueue_finalize(order_id, tracing.inject_context())
+            metrics.push_metrics()
+
 # -----------------------
 # Orquestador principal
 # -----------------------
 def generate_and_deliver(order_id, *args, **kwargs):
     """
     Orquesta todo el pipeline para una orden específica.
+    trace_context (kwarg, opcional): contexto de trace serializado por helpers.queue al encolar.
+    fanout (kwarg, opcional): False en la finalización de un fan-out (procesa aquí los bloques que falten).
+    Los errores (incluido el plazo agotado) se propagan para que la cola marque el job como fallido y lo
+    reintente; un proveedor caído (CircuitOpen) en cambio difiere la orden y retorna None.
     """
+    trace_context = kwargs.pop("trace_context", None)
+    with tracing.continue_trace(trace_context, "generate_and_deliver", order_id=order_id):
+        # Un solo worker por orden: webhooks duplicados o re-ejecuciones manuales salen de inmediato
+        finalize = kwargs.get("fanout", True) is False
+        with locks.held_lock(f"order:{order_id}", wait=FANOUT_FINALIZE_LOCK_WAIT if finalize else 0) as lock:
+            if lock is None and finalize:
+                print(f"[FANOUT] Lock de {order_id} aún tomado; finalización reencolada en {FANOUT_FINALIZE_RETRY_SECONDS:.0f}s.")
+                job_queue.enqueue_finalize(order_id, tracing.inject_context(), delay=FANOUT_FINALIZE_RETRY_SECONDS)
+                metrics.observe_stage("order_lock", 0, "finalize_deferred")
+                return None
+            if lock is None:
+                print(f"[LOCK] Orden {order_id} ya se está procesando en otro worker; job duplicado termina.")
+                metrics.observe_stage("order_lock", 0, "duplicate")
+                return None
+            # Plazo único de la orden (menor que el timeout del job RQ): todas las etapas y helpers lo respetan
+            with deadline.scope():
+                return _generate_and_deliver(order_id, *args, lock=lock, **kwargs)
+
+def _generate_and_deliver(order_id, *args, lock, **kwargs):
+    fanout = kwargs.pop("fanout", True)
     tmp_dir = None
+    tmp_dir_to_dag = False
+    order_started = time.time()
+    outcome = "skipped"
     try:
-        print(f"\n🚀 [MAIN] generate_and_deliver -> order_id={order_id} - inicio {datetime.utcnow().isoformat()}")
+        print(f"\n🚀 [MAIN] generate_and_deliver -> order_id={order_id} - inicio {datetime.utcnow().isoformat()} trace_id={tracing.current_trace_id()}")
         if kwargs:
             print(f"[MAIN] kwargs recibidos: {kwargs}")
+        progress.set_stage(order_id, "lookup", state="processing", started_at=order_started, blocks_done=0,
+                           unset=progress.ATTEMPT_FIELDS)
 
         # 1) Obtener datos de la orden desde sheets (fila / detalles)
         detalles = None
+        lookup_started = time.time()
 
         # 1.a Intentar helper directo por orden
         if get_pedido_por_fila:
@@ -331,6 +551,7 @@ def generate_and_deliver(order_id, *args, **kwargs):
                 print("[MAIN] get_details_from_sheet_direct excepción:", e)
                 detalles = None
 
+        metrics.observe_stage("lookup", time.time() - lookup_started, "ok" if detalles else "not_found")
         if not detalles:
             print(f"[MAIN][WARN] No se encontró metadata de la orden {order_id} en Sheets. Abortando.")
             return
@@ -371,11 +592,15 @@ def generate_and_deliver(order_id, *args, **kwargs):
         # 3) Obtener texto: si la URL termina en .txt -> descargar el texto; si no, usar AssemblyAI
         try:
             print("[MAIN] Obteniendo texto de la fuente (AssemblyAI o .txt directo)...")
-            texto = None
+            progress.set_stage(order_id, "transcription")
+            deadline.check("transcription")
+            texto = checkpoints.load_text(order_id, "transcript")
+            if texto:
+                print(f"[MAIN] Transcripción restaurada desde checkpoint, longitud {len(texto)} chars.")
 
             # heurística: si la URL apunta a un .txt públicamente accesible, lo descargamos y lo usamos
             try:
-                if isinstance(audio_url_public, str) and audio_url_public.lower().endswith('.txt'):
+                if not texto and isinstance(audio_url_public, str) and audio_url_public.lower().endswith('.txt'):
                     print(f"[MAIN] audio_url apunta a .txt -> descargar {audio_url_public}")
                     r = requests.get(audio_url_public, timeout=30)
                     r.raise_for_status()
@@ -384,33 +609,50 @@ def generate_and_deliver(order_id, *args, **kwargs):
             except Exception as e_txt:
                 print(f"[MAIN][WARN] No se pudo descargar .txt desde la URL: {e_txt}")
 
+            # Transcripción especulativa aún en curso (lanzada en create_order): esperar ese mismo transcript
+            transcript_id = checkpoints.load_text(order_id, "transcript_id") if not texto and esperar_transcripcion else None
+            if transcript_id:
+                try:
+                    print(f"[MAIN] Retomando transcripción especulativa {transcript_id}...")
+                    with metrics.stage_timer("transcription"):
+                        texto = esperar_transcripcion(transcript_id, order_id=order_id).get("text") or ""
+                    checkpoints.save_text(order_id, "transcript", texto)
+                except Exception as e_spec:
+                    print(f"[MAIN][WARN] No se pudo retomar la transcripción especulativa: {e_spec}")
+                    texto = None
+
             # Si no obtuvimos texto desde .txt, intentamos AssemblyAI (si está disponible)
             if not texto:
                 if transcribir_audio:
                     print("[MAIN] Llamando a transcribir_audio (AssemblyAI) para el audio URL...")
-                    texto = transcribir_audio(audio_url_public)
+                    with metrics.stage_timer("transcription"):
+                        texto = transcribir_audio(audio_url_public)
+                    # helpers.assemblyai devuelve un dict {"transcript_id", "text", "raw"}
+                    if isinstance(texto, dict):
+                        texto = texto.get("text") or ""
                     print(f"[MAIN] Transcripción recibida desde AssemblyAI, longitud {len(texto)} chars.")
+                    checkpoints.save_text(order_id, "transcript", texto)
                 else:
                     print("[MAIN][STUB] transcribir_audio helper no disponible. Usando texto stub temporal.")
                     texto = "Transcripción de prueba. " * 1000
 
+        except (deadline.DeadlineExceeded, circuit.CircuitOpen):
+            raise
         except Exception as e:
             print("[MAIN][ERROR] Falló al obtener la transcripción:", e)
-            traceback.print_exc()
-            if actualizar_estado_y_links:
-                actualizar_estado_y_links(order_id, estado=f"Error: transcripcion {e}")
-            return
+            # el handler general marca Sheets con el error y deja que la cola reintente el job
+            raise RuntimeError(f"transcripcion {e}") from e
 
-        # Crear tmp_dir para archivos temporales
+        # Los entregables viven en memoria (helpers/artifacts.py) y así van a Drive y al correo; tmp_dir solo
+        # recibe lo que LibreOffice necesita como archivo (DOCX a convertir y su PDF)
         tmp_dir = tempfile.mkdtemp(prefix=f"redax_{order_id}_")
-        path_txt = os.path.join(tmp_dir, f"{order_id}.txt")
         try:
-            with open(path_txt, "w", encoding="utf-8") as f:
-                f.write(texto)
-            print(f"[MAIN] Guardado .txt temporal en {path_txt}")
-            if subir_archivo_a_drive:
+            txt = artifacts.Artifact(f"{order_id}.txt", texto.encode("utf-8"), tmp_dir)
+            if subir_archivo_a_drive and not checkpoints.is_done(order_id, "upload_txt"):
                 try:
-                    subir_archivo_a_drive(path_txt, f"{order_id}.txt", order_id)
+                    with metrics.external_call("drive", "upload"):
+                        subir_archivo_a_drive(txt.data, txt.filename, order_id)
+                    checkpoints.mark_done(order_id, "upload_txt")
                     print("[MAIN] .txt subido a Drive.")
                 except Exception as e:
                     print(f"[MAIN][WARN] No se pudo subir .txt a Drive: {e}")
@@ -418,176 +660,369 @@ def generate_and_deliver(order_id, *args, **kwargs):
             print("[MAIN][ERROR] No se pudo guardar/subir .txt:", e)
             traceback.print_exc()
 
-        # 4) Dividir en bloques y procesar cada bloque
-        blocks = split_text_into_blocks(texto, words_per_block=3000)
+        # 4) Dividir en bloques y procesar cada bloque (los bloques ya procesados se restauran del checkpoint).
+        #    El quiz de cada bloque se lanza apenas su TCP está listo, en paralelo con los bloques restantes.
+        blocks = split_text_into_blocks(texto, words_per_block=WORDS_PER_BLOCK)
         total_blocks = len(blocks)
-        print(f"[MAIN] Texto dividido en {total_blocks} bloques de ~3000 palabras.")
+        print(f"[MAIN] Texto dividido en {total_blocks} bloques de ~{WORDS_PER_BLOCK} palabras.")
+
+        # 4.a) Órdenes largas: repartir los bloques pendientes entre todos los workers y terminar aquí;
+        #      el último sub-job encola la finalización, que retoma desde el paso 4 con todo en checkpoints.
+        if fanout:
+            saved = set(checkpoints.manifest(order_id))
+            pending = [i for i in range(1, total_blocks + 1) if f"text:block_{i}" not in saved]
+            if _should_fan_out(len(pending)):
+                if "text:transcript" not in saved:
+                    checkpoints.save_text(order_id, "transcript", texto)
+                progress.set_stage(order_id, "blocks", blocks_total=total_blocks, blocks_started_at=time.time(),
+                                   blocks_done=total_blocks - len(pending))
+                if _fan_out_blocks(order_id, pending, total_blocks):
+                    outcome = "fanned_out"
+                    return None
+        progress.set_stage(order_id, "blocks", blocks_total=total_blocks, blocks_started_at=time.time())
 
         processed_blocks = []
-        for i, blk in enumerate(blocks, start=1):
-            pb = call_chatgpt_for_block(blk, i, order_id, total_blocks)
-            processed_blocks.append(pb)
+        quiz_futures = {}
+        quiz_pool = ThreadPoolExecutor(max_workers=QUIZ_MAX_WORKERS) if generar_quiz_from_text else None
+        # TCP renderizado bloque a bloque en un thread aparte, mientras el LLM procesa el siguiente;
+        # el paso 8 solo cose los fragmentos (helpers/formatter_docx.IncrementalTcp). Con DOCX_BACKEND=auto
+        # solo si el TCP llega al umbral del backend stream (estimado por las palabras de la transcripción).
+        tcp_doc = incremental_tcp(color, columnas, words=len(texto.split())) if incremental_tcp else None
+        render_pool = ThreadPoolExecutor(max_workers=1) if tcp_doc else None
+        render_futures = []
+        try:
+            for i, blk in enumerate(blocks, start=1):
+                pb = checkpoints.load_text(order_id, f"block_{i}")
+                if pb:
+                    print(f"[MAIN] Bloque {i}/{total_blocks} restaurado desde checkpoint.")
+                else:
+                    deadline.check(f"block_{i}")
+                    pb = call_chatgpt_for_block(blk, i, order_id, total_blocks)
+                    if not _is_error_block(pb):
+                        checkpoints.save_text(order_id, f"block_{i}", pb)
+                processed_blocks.append(pb)
+                progress.block_done(order_id)
+                if render_pool:
+                    ctx = contextvars.copy_context()
+                    render_futures.append(render_pool.submit(ctx.run, tcp_doc.add_block, i, pb))
+                if quiz_pool and not _is_error_block(pb):
+                    ctx = contextvars.copy_context()
+                    quiz_futures[i] = quiz_pool.submit(ctx.run, generate_quiz_for_block, pb, i, order_id)
 
-        tcp_text = merge_processed_blocks(processed_blocks)
-        print(f"[MAIN] TCP (texto procesado) ensamblado, tamaño {len(tcp_text)} caracteres.")
+            tcp_text = merge_processed_blocks(processed_blocks)
+            print(f"[MAIN] TCP (texto procesado) ensamblado, tamaño {len(tcp_text)} caracteres.")
+
+            # El quiz normalmente ya terminó (o está en su último bloque) al cerrar el TCP
+            progress.set_stage(order_id, "quiz")
+            quiz_by_block = {i: f.result() for i, f in quiz_futures.items()}
+
+            for f in render_futures:
+                try:
+                    f.result()
+                except Exception as e:
+                    print(f"[DOCX][WARN] Falló el render incremental ({e}); se renderiza el TCP completo.")
+                    tcp_doc = None
+                    break
+        finally:
+            if quiz_pool:
+                quiz_pool.shutdown(wait=False)
+            if render_pool:
+                render_pool.shutdown(wait=False)
 
         # 5) Extraer títulos/subtítulos
         titles = extract_titles_subtitles(tcp_text)
         print(f"[MAIN] Extraídos {len(titles)} títulos/subtítulos heurísticos.")
 
-        # 6) Buscar imágenes (STUB)
+        # 6) Buscar imágenes (helpers/images.py)
         images_map = {}
         for title, subtitle, page in titles:
             img_url = search_image_for_topic(title, subtitle)
-            images_map[page] = img_url
-        print(f"[MAIN] Imágenes buscadas para {len(images_map)} páginas (map listo).")
+            if img_url:
+                images_map[page] = img_url
+        # descarga en paralelo + reducción a resolución de impresión (cache por contenido entre órdenes)
+        images_map = images.prepare_images(images_map)
+        print(f"[MAIN] Imágenes listas para {len(images_map)} páginas (map listo).")
 
-        # 7) Generar preguntas por título/página (7 por página)
-        questions_by_page = generate_questions_for_titles(titles, per_title=7)
+        # 7) Preguntas por página (bloque): RedaQuiz real generado en el paso 4; stub si no hubo ninguno
+        questions_by_page = {page: qs for page, qs in quiz_by_block.items() if qs}
+        if not questions_by_page:
+            print("[MAIN][WARN] Sin quiz generado por bloque; usando preguntas stub por título.")
+            questions_by_page = generate_questions_for_titles(titles, per_title=7)
         total_questions = sum(len(v) for v in questions_by_page.values())
         print(f"[MAIN] Generadas preguntas: {total_questions} ítems.")
 
-        # 8) Guardar TCP en DOCX usando plantilla y aplicar imágenes por página
+        # 8-13) Entrega como DAG de etapas (helpers/pipeline.py): DOCX, PDF, subidas a Drive, Sheets y correo.
+        #       Las etapas independientes (TCP vs quiz, subidas, correo) corren en paralelo.
         nombre_tcp = f"RedaXion - Nº{order_id}.docx"
-        path_docx = os.path.join(tmp_dir, nombre_tcp)
-        docx_path_result = apply_docx_template_and_insert_images(tcp_text, images_map, path_docx, color=color, columnas=columnas)
-        if docx_path_result:
-            print(f"[MAIN] DOCX TCP generado en {docx_path_result}")
-            if subir_archivo_a_drive:
+        nombre_quiz = f"RedaQuiz - Nº{order_id}.docx"
+
+        def _restore(name: str, filename: str):
+            data = checkpoints.load_artifact_data(order_id, name)
+            return artifacts.Artifact(filename, data, tmp_dir) if data else None
+
+        def _render_docx(filename: str, render_fn, error: str):
+            def run(buf):
+                if not render_fn(buf):
+                    raise RuntimeError(error)
+            return artifacts.render(filename, run, tmp_dir)
+
+        def stage_docx_tcp(_deps):
+            art = _restore("docx_tcp", nombre_tcp)
+            if not art and tcp_doc and tcp_doc.complete(total_blocks):
                 try:
-                    subir_archivo_a_drive(docx_path_result, nombre_tcp, order_id)
-                    print("[MAIN] DOCX TCP subido a Drive.")
+                    art = artifacts.render(nombre_tcp, lambda buf: tcp_doc.save(buf, images_map=images_map), tmp_dir)
                 except Exception as e:
-                    print(f"[MAIN][WARN] No se pudo subir DOCX a Drive: {e}")
-        else:
-            print("[MAIN][ERROR] No se pudo generar DOCX TCP.")
+                    print(f"[DOCX][WARN] No se pudo guardar el TCP incremental ({e}); render completo.")
+                    art = None
+                if art:
+                    art = packaging.pack(art, "docx_tcp")
+                    checkpoints.save_artifact_data(order_id, "docx_tcp", art.data)
+            if not art:
+                art = packaging.pack(_render_docx(nombre_tcp, lambda buf: apply_docx_template_and_insert_images(
+                    tcp_text, images_map, buf, color=color, columnas=columnas), "No se pudo generar DOCX TCP."),
+                    "docx_tcp")
+                checkpoints.save_artifact_data(order_id, "docx_tcp", art.data)
+            print(f"[MAIN] DOCX TCP generado: {art}")
+            return art
 
-        # 9) Convertir DOCX TCP a PDF
-        pdf_tcp = None
-        try:
-            if convertir_a_pdf and docx_path_result:
-                pdf_tcp = convertir_a_pdf(docx_path_result)
-                if pdf_tcp:
-                    nombre_tcp_pdf = nombre_tcp.replace(".docx", ".pdf")
-                    try:
-                        subir_archivo_a_drive(pdf_tcp, nombre_tcp_pdf, order_id)
-                        print(f"[MAIN] PDF TCP generado y subido: {nombre_tcp_pdf}")
-                    except Exception as e:
-                        print(f"[MAIN][WARN] No se pudo subir PDF TCP a Drive: {e}")
-        except Exception as e:
-            print("[MAIN][ERROR] convertir_a_pdf fallo:", e)
-            traceback.print_exc()
+        def stage_docx_quiz(_deps):
+            art = _restore("docx_quiz", nombre_quiz)
+            if not art:
+                art = packaging.pack(_render_docx(nombre_quiz, lambda buf: apply_quiz_template_and_save(
+                    questions_by_page, buf, color=color, columnas=columnas), "No se produjo Quiz DOCX."), "docx_quiz")
+                checkpoints.save_artifact_data(order_id, "docx_quiz", art.data)
+            print(f"[MAIN] Quiz DOCX generado: {art}")
+            return art
 
-        # 10) Generar QUIZ DOCX (format)
-        nombre_quiz = f"RedaQuiz - Nº{order_id}.docx"
-        path_quiz = os.path.join(tmp_dir, nombre_quiz)
-        quiz_docx = apply_quiz_template_and_save(questions_by_page, path_quiz, color=color, columnas=columnas)
-        if quiz_docx:
-            print(f"[MAIN] Quiz DOCX generado en {quiz_docx}")
-            if subir_archivo_a_drive:
+        def _native_pdf(markdown: str, label: str) -> bool:
+            if PDF_RENDERER != "native" or guardar_como_pdf is None:
+                return False
+            missing = unsupported_chars(markdown)
+            if not missing:
+                return True
+            if convertir_a_pdf:
+                print(f"[PDF] {label}: caracteres fuera de WinAnsi ({''.join(missing[:20])}); se convierte desde el DOCX.")
+                return False
+            print(f"[PDF][WARN] {label}: sin conversor DOCX->PDF; {''.join(missing[:20])} saldrán como '?'.")
+            return True
+
+        quiz_md = quiz_markdown(questions_by_page)
+        native_tcp, native_quiz = _native_pdf(tcp_text, "TCP"), _native_pdf(quiz_md, "Quiz")
+
+        def _pdf_stage(artifact: str, docx_stage: str, nombre_docx: str, markdown: str, native: bool):
+            def run(deps):
+                nombre_pdf = os.path.splitext(nombre_docx)[0] + ".pdf"
+                pdf = _restore(artifact, nombre_pdf)
+                if not pdf and native:
+                    pdf = artifacts.render(nombre_pdf, lambda buf: guardar_como_pdf(
+                        markdown, buf, color=color, columnas=columnas,
+                        images_map=images_map if artifact == "pdf_tcp" else None), tmp_dir)
+                    pdf = packaging.pack(pdf, artifact)
+                    checkpoints.save_artifact_data(order_id, artifact, pdf.data)
+                elif not pdf and convertir_a_pdf and deps.get(docx_stage):
+                    # LibreOffice necesita archivos: el DOCX se escribe una vez y el PDF se lee una vez
+                    path = convertir_a_pdf(deps[docx_stage].path(), os.path.join(tmp_dir, nombre_pdf))
+                    pdf = packaging.pack(artifacts.from_path(path, nombre_pdf, tmp_dir), artifact)
+                    checkpoints.save_artifact_data(order_id, artifact, pdf.data)
+                if pdf:
+                    print(f"[MAIN] PDF generado: {pdf}")
+                return pdf
+            return run
+
+        # proveedores caídos durante la entrega: Sheets no marca "Entregado" si la orden se va a diferir
+        circuit_open = []
+
+        def _circuit_guard(fn):
+            def run(deps):
                 try:
-                    subir_archivo_a_drive(quiz_docx, nombre_quiz, order_id)
-                    print("[MAIN] Quiz DOCX subido a Drive.")
-                except Exception as e:
-                    print(f"[MAIN][WARN] No se pudo subir Quiz DOCX a Drive: {e}")
-        else:
-            print("[MAIN][WARN] No se produjo Quiz DOCX.")
+                    return fn(deps)
+                except circuit.CircuitOpen as err:
+                    circuit_open.append(err)
+                    raise
+            return run
 
-        # 11) Convertir QUIZ a PDF
-        pdf_quiz = None
-        try:
-            if convertir_a_pdf and quiz_docx:
-                pdf_quiz = convertir_a_pdf(quiz_docx)
-                if pdf_quiz:
-                    nombre_quiz_pdf = nombre_quiz.replace(".docx", ".pdf")
-                    try:
-                        subir_archivo_a_drive(pdf_quiz, nombre_quiz_pdf, order_id)
-                        print(f"[MAIN] PDF Quiz generado y subido: {nombre_quiz_pdf}")
-                    except Exception as e:
-                        print(f"[MAIN][WARN] No se pudo subir PDF Quiz a Drive: {e}")
-        except Exception as e:
-            print("[MAIN][ERROR] convertir_a_pdf (quiz) fallo:", e)
-            traceback.print_exc()
+        def _upload_stage(step: str, src_stage: str, nombre: str):
+            @_circuit_guard
+            def run(deps):
+                art = deps[src_stage]
+                if not art or not subir_archivo_a_drive or checkpoints.is_done(order_id, step):
+                    return None
+                with metrics.external_call("drive", "upload"):
+                    subir_archivo_a_drive(art.data, nombre, order_id)
+                checkpoints.mark_done(order_id, step)
+                print(f"[MAIN] {nombre} subido a Drive.")
+                return nombre
+            return run
 
-        # 12) Actualizar Sheets: marcar como entregado y publicar links (si tienes helper)
-        try:
+        def stage_sheets(deps):
+            lock.check("sheets")
+            if circuit_open:
+                # la orden se difiere y el reintento completa lo pendiente; "Entregado" lo cortaría en el lookup
+                raise circuit_open[0]
+            # Actualizar Sheets: marcar como entregado y publicar links (si tienes helper)
             if actualizar_estado_y_links:
                 links = {
                     "txt": f"{order_id}.txt",
                     "docx_tcp": nombre_tcp,
-                    "pdf_tcp": nombre_tcp.replace(".docx", ".pdf") if pdf_tcp else None,
+                    "pdf_tcp": nombre_tcp.replace(".docx", ".pdf") if deps["pdf_tcp"] else None,
                     "docx_quiz": nombre_quiz,
-                    "pdf_quiz": nombre_quiz.replace(".docx", ".pdf") if pdf_quiz else None,
+                    "pdf_quiz": nombre_quiz.replace(".docx", ".pdf") if deps["pdf_quiz"] else None,
                 }
                 actualizar_estado_y_links(order_id, estado="Entregado", links=links)
                 print("[MAIN] Sheets actualizado con estado Entregado y links.")
-            else:
-                if marcar_como_procesado and fila:
-                    marcar_como_procesado(fila)
-                    print("[MAIN] marcar_como_procesado ejecutado.")
-        except Exception:
-            print("[MAIN][WARN] Falló al actualizar Sheets con links/estado.")
-            traceback.print_exc()
+            elif marcar_como_procesado and fila:
+                marcar_como_procesado(fila)
+                print("[MAIN] marcar_como_procesado ejecutado.")
 
-        # 13) Enviar correo al cliente con adjuntos (docx + pdf)
-        try:
-            archivos_adjuntos = []
-            if docx_path_result:
-                archivos_adjuntos.append(docx_path_result)
-            if pdf_tcp:
-                archivos_adjuntos.append(pdf_tcp)
-            if quiz_docx:
-                archivos_adjuntos.append(quiz_docx)
-            if pdf_quiz:
-                archivos_adjuntos.append(pdf_quiz)
-
-            if enviar_correo_con_adjuntos and correo_cliente:
-                asunto = f"Tu pedido RedaXion Nº{order_id} está listo ✅"
-                cuerpo = (
-                    f"Hola 👋\n\nAdjuntamos tu Transcripción Académica Profesional (TCP) y el RedaQuiz.\n"
-                    "Gracias por usar RedaXion — ¡éxitos en el estudio! 🧠\n\n"
-                    "— Equipo RedaXion"
-                )
-                try:
-                    enviar_correo_con_adjuntos(correo_cliente, asunto, cuerpo, archivos_adjuntos)
-                    print(f"[MAIN] Correo enviado a {correo_cliente}")
-                except Exception as e:
-                    print(f"[MAIN][WARN] No se pudo enviar correo: {e}")
-            else:
+        @_circuit_guard
+        def stage_email(deps):
+            # Enviar correo al cliente con adjuntos (docx + pdf)
+            archivos_adjuntos = [(deps[k].filename, deps[k].data) for k in ("docx_tcp", "pdf_tcp", "docx_quiz", "pdf_quiz")
+                                 if deps[k]]
+            if checkpoints.is_done(order_id, "email"):
+                print("[MAIN] Correo ya enviado en un intento anterior (checkpoint); no se reenvía.")
+                return False
+            if not (enviar_correo_con_adjuntos and correo_cliente):
                 print("[MAIN] enviar_correo_con_adjuntos helper no disponible o correo_cliente vacío; correo no enviado.")
-        except Exception:
-            print("[MAIN][ERROR] Error enviando correo con adjuntos.")
-            traceback.print_exc()
+                return False
+            # si el lease venció, otro worker puede estar entregando la misma orden: no duplicar el correo
+            lock.check("email")
+            asunto = f"Tu pedido RedaXion Nº{order_id} está listo ✅"
+            cuerpo = (
+                f"Hola 👋\n\nAdjuntamos tu Transcripción Académica Profesional (TCP) y el RedaQuiz.\n"
+                "Gracias por usar RedaXion — ¡éxitos en el estudio! 🧠\n\n"
+                "— Equipo RedaXion"
+            )
+            # los adjuntos grandes viajan como enlace firmado de GCS (EMAIL_LINK_THRESHOLD_BYTES)
+            enviar_correo_con_adjuntos(correo_cliente, asunto, cuerpo, archivos_adjuntos, link_folder=str(order_id))
+            checkpoints.mark_done(order_id, "email")
+            print(f"[MAIN] Correo enviado a {correo_cliente}")
+            return True
+
+        delivery_stages = [
+            # Sin DOCX TCP no hay entrega: abortar marca la orden con error y permite reintentar
+            Stage("docx_tcp", stage_docx_tcp, timeout=STAGE_TIMEOUTS["render"], on_failure="abort"),
+            Stage("docx_quiz", stage_docx_quiz, timeout=STAGE_TIMEOUTS["render"]),
+            # el PDF nativo sale del markdown y no espera al DOCX; el convertido sí
+            Stage("pdf_tcp", _pdf_stage("pdf_tcp", "docx_tcp", nombre_tcp, tcp_text, native_tcp),
+                  deps=() if native_tcp else ("docx_tcp",), timeout=STAGE_TIMEOUTS["pdf"]),
+            Stage("pdf_quiz", _pdf_stage("pdf_quiz", "docx_quiz", nombre_quiz, quiz_md, native_quiz),
+                  deps=() if native_quiz else ("docx_quiz",), timeout=STAGE_TIMEOUTS["pdf"]),
+            Stage("upload_docx_tcp", _upload_stage("upload_docx_tcp", "docx_tcp", nombre_tcp),
+                  deps=("docx_tcp",), timeout=STAGE_TIMEOUTS["upload"]),
+            Stage("upload_pdf_tcp", _upload_stage("upload_pdf_tcp", "pdf_tcp", nombre_tcp.replace(".docx", ".pdf")),
+                  deps=("pdf_tcp",), timeout=STAGE_TIMEOUTS["upload"]),
+            Stage("upload_docx_quiz", _upload_stage("upload_docx_quiz", "docx_quiz", nombre_quiz),
+                  deps=("docx_quiz",), timeout=STAGE_TIMEOUTS["upload"]),
+            Stage("upload_pdf_quiz", _upload_stage("upload_pdf_quiz", "pdf_quiz", nombre_quiz.replace(".docx", ".pdf")),
+                  deps=("pdf_quiz",), timeout=STAGE_TIMEOUTS["upload"]),
+            # Sheets al final: "Entregado" solo si subidas y correo no quedaron pendientes por un circuito abierto
+            Stage("sheets", stage_sheets, timeout=STAGE_TIMEOUTS["sheets"],
+                  deps=("pdf_tcp", "pdf_quiz", "upload_docx_tcp", "upload_pdf_tcp", "upload_docx_quiz", "upload_pdf_quiz",
+                        "email")),
+            Stage("email", stage_email, deps=("docx_tcp", "pdf_tcp", "docx_quiz", "pdf_quiz"), timeout=STAGE_TIMEOUTS["email"]),
+        ]
+        def observe_delivery(stage, seconds, stage_outcome):
+            metrics.observe_stage(stage, seconds, stage_outcome)
+            progress.update(order_id, last_step=f"{stage}:{stage_outcome}")
+
+        progress.set_stage(order_id, "delivery", delivery_started_at=time.time())
+        deadline.check("delivery")
+        lock.check("delivery")
+        # una etapa vencida por timeout puede seguir escribiendo en tmp_dir: lo borra el DAG cuando termine
+        tmp_dir_to_dag = True
+        dag = run_dag(delivery_stages, max_workers=PIPELINE_MAX_WORKERS, label=f":{order_id}",
+                      observer=observe_delivery, on_drained=lambda: _remove_tmp_dir(tmp_dir))
+        resumen = ", ".join(f"{name}={r['status']}({r['seconds']}s)" for name, r in dag.items())
+        print(f"[MAIN] Entrega completada: {resumen}")
+        for r in dag.values():
+            if isinstance(r["error"], locks.LockLost):
+                raise r["error"]
+        # una etapa que falló por proveedor caído se reintenta diferida (las demás quedan en checkpoints)
+        for r in dag.values():
+            if isinstance(r["error"], circuit.CircuitOpen):
+                raise r["error"]
+        # entregado: transcripción, bloques y documentos ya no sirven; quedan las marcas step:* para que
+        # un reintento o webhook repetido no reenvíe el correo ni repita subidas
+        if checkpoints.is_done(order_id, "email"):
+            checkpoints.clear(order_id, prefixes=("text:", "artifact:"))
 
         print(f"✅ [MAIN] Finalizado flujo para orden {order_id} ({datetime.utcnow().isoformat()})")
+        outcome = "delivered"
         return True
 
+    except deadline.DeadlineExceeded as err:
+        # falla rápida con estado claro; los checkpoints permiten que un reintento siga desde aquí
+        print(f"[MAIN][ERROR] Orden {order_id}: {err}")
+        outcome = "deadline_exceeded"
+        try:
+            if actualizar_estado_y_links:
+                actualizar_estado_y_links(order_id, estado=f"Error: plazo agotado en {err.stage}")
+        except Exception:
+            pass
+        # el job falla: la cola lo reintenta con backoff (Retry en RQ, local_queue sin Redis) desde los checkpoints
+        raise
+
+    except locks.LockLost as err:
+        # la orden pasó a otro worker: no tocar Sheets ni el progreso, que ahora son suyos
+        print(f"[LOCK][ERROR] Orden {order_id}: {err}. Este job se detiene sin entregar.")
+        outcome = "lock_lost"
+        return None
+
+    except circuit.CircuitOpen as err:
+        # proveedor caído: no tiene sentido reintentar ahora; la orden vuelve a la cola cuando el circuito
+        # pueda probarse de nuevo y retoma desde los checkpoints. Sheets no se marca con error.
+        print(f"[CIRCUIT] Orden {order_id} diferida {err.retry_after:.0f}s: {err}")
+        outcome = "deferred"
+        try:
+            job_queue.defer_generate_and_deliver(order_id, delay=err.retry_after, reason=err.provider)
+        except Exception as e:
+            print(f"[CIRCUIT][ERROR] No se pudo diferir la orden {order_id}: {e}")
+            outcome = "error"
+        return None
+
     except Exception as err:
         print(f"[MAIN][ERROR] Excepción en generate_and_deliver para {order_id}: {err}")
         traceback.print_exc()
+        outcome = "error"
         try:
             if actualizar_estado_y_links:
                 actualizar_estado_y_links(order_id, estado=f"Error: {err}")
         except Exception:
             pass
-        return False
+        raise
 
     finally:
-        # limpiar tmp_dir si existe
-        try:
-            if tmp_dir and os.path.isdir(tmp_dir):
-                shutil.rmtree(tmp_dir)
-                print(f"[MAIN] tmp_dir {tmp_dir} eliminado.")
-        except Exception as e:
-            print(f"[MAIN][WARN] No se pudo eliminar tmp_dir {tmp_dir}: {e}")
-            traceback.print_exc()
+        metrics.observe_order(time.time() - order_started, outcome)
+        # deferred: defer_generate_and_deliver ya dejó state=deferred con retry_at
+        if outcome not in ("fanned_out", "deferred", "lock_lost"):
+            progress.update(order_id, state=outcome, finished_at=time.time())
+        metrics.push_metrics()
+        # limpiar tmp_dir si existe (salvo que ya haya quedado a cargo del DAG de entrega)
+        if not tmp_dir_to_dag:
+            _remove_tmp_dir(tmp_dir)
+
+def _remove_tmp_dir(tmp_dir):
+    try:
+        if tmp_dir and os.path.isdir(tmp_dir):
+            shutil.rmtree(tmp_dir)
+            print(f"[MAIN] tmp_dir {tmp_dir} eliminado.")
+    except Exception as e:
+        print(f"[MAIN][WARN] No se pudo eliminar tmp_dir {tmp_dir}: {e}")
+        traceback.print_exc()
 
 
 # Mantener compatibilidad (si el worker importa main.generate_and_deliver)
 if __name__ == "__main__":
     try:
         print("🚀 Ejecutando flujo RedaXion en modo standalone (procesar pendientes)")
-        if get_todos_los_pendientes:
+        if get_todos_los_pendientes and os.getenv("REDIS_URL"):
+            # Con Redis: backfill encolado de una vez en la cola de baja prioridad (los workers lo procesan)
+            from helpers.queue import enqueue_many_generate_and_deliver
+            pendientes = get_todos_los_pendientes()
+            job_ids = enqueue_many_generate_and_deliver([p.get("orden") for p in pendientes], priority="retry")
+            print(f"Encoladas {len(job_ids)} órdenes pendientes en la cola de reintentos/backfill.")
+        elif get_todos_los_pendientes:
             pendientes = get_todos_los_pendientes()
             for p in pendientes:
                 try:
@@ -1,7 +1,7 @@
 # test_imports.py
 import sys
 sys.path.append('.')
-from helpers import process_txt, assemblyai, enviar_correo, gcs, queue, sheets, generar_quiz, locks, utils
+from helpers import process_txt, assemblyai, enviar_correo, gcs, queue, sheets, generar_quiz, locks, utils, checkpoints, pipeline, audio_meta, progress, circuit, images, convertidor_pdf, formatter_pdf, artifacts, packaging
 print("IMPORTS OK")
 print("process_txt:", hasattr(process_txt, 'procesar_txt_con_chatgpt_block'))
 print("assemblyai:", hasattr(assemblyai, 'transcribir_audio'))
@@ -9,3 +9,13 @@ print("mail:", hasattr(enviar_correo, 'enviar_correo_con_adjuntos'))
 print("generar_quiz:", hasattr(generar_quiz, 'generar_quiz_from_text'))
 print("locks:", hasattr(locks, 'acquire_lock'))
 print("utils:", hasattr(utils, 'retry'))
+print("checkpoints:", hasattr(checkpoints, 'load_text'))
+print("pipeline:", hasattr(pipeline, 'run_dag'))
+print("audio_meta:", hasattr(audio_meta, 'probe_duration'))
+print("progress:", hasattr(progress, 'get'))
+print("circuit:", hasattr(circuit, 'before_call'))
+print("images:", hasattr(images, 'prepare_images'))
+print("convertidor_pdf:", hasattr(convertidor_pdf, 'convertir_a_pdf'))
+print("formatter_pdf:", hasattr(formatter_pdf, 'guardar_como_pdf'))
+print("artifacts:", hasattr(artifacts, 'Artifact'))
+print("packaging:", hasattr(packaging, 'pack'))
@@ -0,0 +1,10 @@
+# tests/conftest.py
+import os
+import sys
+
+# los tests importan main y helpers.* desde la raíz del repo, igual que worker.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# sin servicios externos: colas, locks, checkpoints y progreso en su modo local
+for var in ("REDIS_URL", "GCS_BUCKET", "GCS_CREDENTIALS_JSON", "PROMETHEUS_PUSHGATEWAY", "SENDGRID_API_KEY"):
+    os.environ.pop(var, None)
@@ -0,0 +1,35 @@
+# tests/test_artifacts.py
+import os
+
+from helpers import artifacts
+
+
+def test_path_writes_once_and_reuses_the_file(tmp_path):
+    art = artifacts.Artifact("tcp.docx", b"docx bytes", str(tmp_path))
+    path = art.path()
+    assert path == str(tmp_path / "tcp.docx")
+    with open(path, "rb") as fh:
+        assert fh.read() == b"docx bytes"
+
+    mtime = os.stat(path).st_mtime_ns
+    assert art.path() == path
+    assert os.stat(path).st_mtime_ns == mtime
+
+
+def test_path_is_rewritten_if_the_file_was_removed(tmp_path):
+    art = artifacts.Artifact("quiz.pdf", b"%PDF-1.4", str(tmp_path))
+    os.remove(art.path())
+    assert open(art.path(), "rb").read() == b"%PDF-1.4"
+
+
+def test_render_and_from_path(tmp_path):
+    art = artifacts.render("a.txt", lambda buf: buf.write(b"hola"), str(tmp_path))
+    assert (art.filename, art.data, art.size) == ("a.txt", b"hola", 4)
+    assert not os.path.exists(tmp_path / "a.txt")
+
+    src = tmp_path / "b.pdf"
+    src.write_bytes(b"%PDF")
+    loaded = artifacts.from_path(str(src))
+    assert loaded.data == b"%PDF"
+    # ya existe en disco: path() no lo vuelve a escribir
+    assert loaded.path() == str(src)
@@ -0,0 +1,161 @@
+# tests/test_audio_meta.py
+import struct
+
+import pytest
+
+from helpers.audio_meta import probe_duration
+
+
+@pytest.fixture
+def audio(tmp_path):
+    def write(data: bytes, name: str = "audio.bin") -> str:
+        path = tmp_path / name
+        path.write_bytes(data)
+        return str(path)
+    return write
+
+
+# -----------------------
+# WAV
+# -----------------------
+def _wav(data_size: int, byte_rate: int = 16000, declared=None, extra_chunk: bool = False) -> bytes:
+    fmt = struct.pack("<HHIIHH", 1, 1, byte_rate // 2, byte_rate, 2, 16)
+    chunks = b"fmt " + struct.pack("<I", len(fmt)) + fmt
+    if extra_chunk:
+        chunks += b"LIST" + struct.pack("<I", 5) + b"abcde" + b"\x00"  # tamaño impar: byte de relleno
+    chunks += b"data" + struct.pack("<I", data_size if declared is None else declared) + b"\x00" * data_size
+    return b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks
+
+
+def test_wav(audio):
+    assert probe_duration(audio(_wav(16000 * 3))) == 3.0
+    assert probe_duration(audio(_wav(8000, extra_chunk=True))) == 0.5
+
+
+def test_wav_streaming_sizes_use_the_file_size(audio):
+    assert probe_duration(audio(_wav(32000, declared=0))) == 2.0
+    assert probe_duration(audio(_wav(32000, declared=0xFFFFFFFF))) == 2.0
+
+
+# -----------------------
+# MP3
+# -----------------------
+MPEG1_128K_STEREO = b"\xff\xfb\x90\x64"   # MPEG-1 Layer III, 128 kbps, 44.1 kHz, joint stereo
+MPEG2_64K_MONO = b"\xff\xf3\x80\xc4"      # MPEG-2 Layer III, 64 kbps, 22.05 kHz, mono
+
+
+def _id3(size: int) -> bytes:
+    synchsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + synchsafe + b"\x00" * size
+
+
+def test_cbr_mp3(audio):
+    frames = MPEG1_128K_STEREO + b"\x00" * (160000 - 4)  # 160000 bytes × 8 / 128 kbps = 10 s
+    assert probe_duration(audio(frames)) == 10.0
+    # tag ID3v2 al inicio y ID3v1 al final no cuentan como audio
+    assert probe_duration(audio(_id3(300) + frames + b"TAG" + b"\x00" * 125)) == 10.0
+
+
+def test_xing_mp3(audio):
+    side_info = b"\x00" * 32
+    xing = b"Xing" + struct.pack(">II", 1, 1000)  # flags: frames presente
+    data = MPEG1_128K_STEREO + side_info + xing + b"\x00" * 2000
+    assert probe_duration(audio(data)) == round(1000 * 1152 / 44100, 1)
+    info = MPEG2_64K_MONO + b"\x00" * 9 + b"Info" + struct.pack(">II", 1, 3828) + b"\x00" * 2000
+    assert probe_duration(audio(info)) == round(3828 * 576 / 22050, 1)
+
+
+def test_vbri_mp3(audio):
+    vbri = b"VBRI" + b"\x00" * 10 + struct.pack(">I", 500)
+    data = MPEG1_128K_STEREO + b"\x00" * 32 + vbri + b"\x00" * 2000
+    assert probe_duration(audio(data)) == round(500 * 1152 / 44100, 1)
+
+
+def test_mp3_sync_after_garbage(audio):
+    data = b"\x00\xff\x00" * 10 + MPEG1_128K_STEREO + b"\x00" * (16000 - 4)
+    assert probe_duration(audio(data)) == round((16000) * 8 / 128000, 1)
+
+
+# -----------------------
+# MP4 / M4A
+# -----------------------
+def _box(kind: bytes, body: bytes) -> bytes:
+    return struct.pack(">I", 8 + len(body)) + kind + body
+
+
+def _mvhd(version: int, timescale: int, duration: int) -> bytes:
+    if version == 1:
+        return _box(b"mvhd", bytes([1, 0, 0, 0]) + struct.pack(">QQIQ", 0, 0, timescale, duration) + b"\x00" * 80)
+    return _box(b"mvhd", bytes(4) + struct.pack(">IIII", 0, 0, timescale, duration) + b"\x00" * 80)
+
+
+def test_mp4_mvhd_v0_with_moov_at_the_end(audio):
+    data = _box(b"ftyp", b"M4A \x00\x00\x00\x00") + _box(b"mdat", b"\x00" * 5000) + \
+        _box(b"moov", _box(b"trak", b"\x00" * 16) + _mvhd(0, 1000, 125500))
+    assert probe_duration(audio(data)) == 125.5
+
+
+def test_mp4_mvhd_v1_and_64bit_box(audio):
+    mdat = struct.pack(">I", 1) + b"mdat" + struct.pack(">Q", 16 + 3000) + b"\x00" * 3000
+    data = _box(b"ftyp", b"isom\x00\x00\x00\x00") + mdat + _box(b"moov", _mvhd(1, 48000, 48000 * 3600))
+    assert probe_duration(audio(data)) == 3600.0
+
+
+# -----------------------
+# FLAC
+# -----------------------
+def _flac(sample_rate: int, total_samples: int, first_block_type: int = 0) -> bytes:
+    packed = (sample_rate << 44) | (1 << 41) | (15 << 36) | total_samples  # estéreo, 16 bits
+    info = b"\x00" * 10 + packed.to_bytes(8, "big") + b"\x00" * 16
+    return b"fLaC" + bytes([0x80 | first_block_type]) + (34).to_bytes(3, "big") + info
+
+
+def test_flac(audio):
+    assert probe_duration(audio(_flac(44100, 44100 * 90))) == 90.0
+
+
+# -----------------------
+# OGG
+# -----------------------
+def _ogg_page(granule: int, payload: bytes) -> bytes:
+    return b"OggS\x00\x00" + struct.pack("<q", granule) + b"\x00" * 12 + bytes([1, len(payload)]) + payload
+
+
+def test_ogg_vorbis(audio):
+    ident = b"\x01vorbis" + struct.pack("<IBI", 0, 2, 44100) + b"\x00" * 13
+    data = _ogg_page(0, ident) + _ogg_page(44100 * 10, b"\x00" * 200) + _ogg_page(44100 * 61, b"\x00" * 100)
+    assert probe_duration(audio(data)) == 61.0
+
+
+def test_ogg_opus_discounts_pre_skip(audio):
+    head = b"OpusHead" + struct.pack("<BBHI", 1, 2, 312, 48000) + b"\x00\x00\x00"
+    data = _ogg_page(0, head) + _ogg_page(48000 * 30 + 312, b"\x00" * 50)
+    assert probe_duration(audio(data)) == 30.0
+
+
+# -----------------------
+# Truncados / corruptos
+# -----------------------
+@pytest.mark.parametrize("data", [
+    b"",
+    b"hola, esto no es audio" * 100,
+    _wav(16000)[:30],                                        # corta dentro del chunk fmt
+    b"RIFF\x00\x00\x00\x00WAVE" + b"data" + struct.pack("<I", 100) + b"\x00" * 100,  # data sin fmt
+    _box(b"ftyp", b"M4A \x00\x00\x00\x00") + _box(b"mdat", b"\x00" * 100),           # sin moov
+    _box(b"ftyp", b"M4A \x00\x00\x00\x00") + _box(b"moov", _mvhd(0, 1000, 5000))[:20],  # mvhd truncado
+    _box(b"ftyp", b"M4A \x00\x00\x00\x00") + _box(b"moov", _mvhd(0, 0, 5000)),       # timescale 0
+    _box(b"ftyp", b"M4A \x00\x00\x00\x00") + struct.pack(">I", 4) + b"free",           # box con tamaño inválido
+    _flac(44100, 1000)[:20],                                                          # STREAMINFO truncado
+    _flac(44100, 1000, first_block_type=4),                                           # primer bloque no es STREAMINFO
+    _flac(44100, 0),                                                                  # sin total de muestras
+    _ogg_page(0, b"sin cabecera de codec") + _ogg_page(1000, b"\x00"),
+    _ogg_page(0, b"\x01vorbis" + struct.pack("<IBI", 0, 2, 44100)) + _ogg_page(-1, b""),  # granule inválido
+    MPEG1_128K_STEREO[:3],                                                            # cabecera MP3 incompleta
+    b"\xff\xfb\xf0\x64" + b"\x00" * 1000,                                             # bitrate "bad" (15)
+])
+def test_unrecognized_or_corrupt_inputs_return_none(audio, data):
+    assert probe_duration(audio(data)) is None
+
+
+def test_missing_file_returns_none(tmp_path):
+    assert probe_duration(str(tmp_path / "no-existe.mp3")) is None
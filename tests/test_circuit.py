@@ -0,0 +1,108 @@
+# tests/test_circuit.py
+import threading
+
+import fakeredis
+import pytest
+
+from helpers import circuit
+
+
+class ProviderDown(Exception):
+    pass
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request, monkeypatch):
+    monkeypatch.setattr(circuit, "FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(circuit, "RESET_SECONDS", 60)
+    monkeypatch.setattr(circuit, "_memory", {})
+    conn = fakeredis.FakeStrictRedis(decode_responses=True) if request.param == "redis" else None
+    monkeypatch.setattr(circuit, "get_redis", lambda decode_responses=False: conn)
+    return request.param
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(circuit.time, "time", lambda: now[0])
+    return now
+
+
+def _fail(n, probe=None):
+    for _ in range(n):
+        circuit.record_failure("drive", ProviderDown("503"), probe)
+
+
+def test_closed_open_half_open_closed(backend, clock):
+    assert circuit.before_call("drive") is None
+    _fail(2)
+    assert circuit.state("drive") == "closed"
+    _fail(1)
+    assert circuit.state("drive") == "open"
+
+    with pytest.raises(circuit.CircuitOpen) as err:
+        circuit.before_call("drive")
+    assert err.value.retry_after == pytest.approx(60)
+
+    clock[0] += 61
+    probe = circuit.before_call("drive")
+    assert probe and circuit.state("drive") == "half_open"
+    # una sola llamada de prueba a la vez
+    with pytest.raises(circuit.CircuitOpen):
+        circuit.before_call("drive")
+
+    circuit.record_success("drive", probe)
+    assert circuit.state("drive") == "closed"
+    assert circuit.before_call("drive") is None
+    # el contador volvió a cero: hacen falta otra vez 3 fallas
+    _fail(2)
+    assert circuit.state("drive") == "closed"
+
+
+def test_failed_probe_reopens(backend, clock):
+    _fail(3)
+    clock[0] += 61
+    probe = circuit.before_call("drive")
+    _fail(1, probe)
+    assert circuit.state("drive") == "open"
+    with pytest.raises(circuit.CircuitOpen):
+        circuit.before_call("drive")
+    clock[0] += 61
+    assert circuit.before_call("drive")
+
+
+def test_stale_results_do_not_touch_the_probe(backend, clock):
+    _fail(3)
+    clock[0] += 61
+    probe = circuit.before_call("drive")
+
+    # llamadas que empezaron con el circuito cerrado terminan durante la prueba
+    _fail(1)
+    circuit.record_success("drive")
+    assert circuit.state("drive") == "half_open"
+    with pytest.raises(circuit.CircuitOpen):
+        circuit.before_call("drive")
+
+    circuit.record_success("drive", probe)
+    assert circuit.state("drive") == "closed"
+
+
+def test_request_errors_release_the_probe_without_a_verdict(backend, clock):
+    _fail(3)
+    clock[0] += 61
+    probe = circuit.before_call("drive")
+    err = ProviderDown("400")
+    err.status_code = 400
+    circuit.record_failure("drive", err, probe)
+    assert circuit.state("drive") == "half_open"
+    assert circuit.before_call("drive")
+
+
+def test_concurrent_failures_are_all_counted(backend, monkeypatch):
+    monkeypatch.setattr(circuit, "FAILURE_THRESHOLD", 1000)
+    threads = [threading.Thread(target=_fail, args=(25,)) for _ in range(8)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert circuit._load("drive")["failures"] == 200
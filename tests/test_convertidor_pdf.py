@@ -0,0 +1,120 @@
+# tests/test_convertidor_pdf.py
+import os
+import threading
+import time
+
+import pytest
+
+from helpers import convertidor_pdf
+from helpers.convertidor_pdf import ConverterPool, FakeBackend, PdfBackend, SofficeBackend
+
+
+@pytest.fixture
+def fake_pool(monkeypatch):
+    def build(size=2, delay=0.0):
+        monkeypatch.setattr(FakeBackend, "delay", delay)
+        convertidor_pdf.set_backend("fake", size=size)
+        return convertidor_pdf.get_pool()
+    yield build
+    convertidor_pdf.set_backend(None)
+
+
+def _docx(tmp_path, name):
+    path = tmp_path / f"{name}.docx"
+    path.write_bytes(b"docx")
+    return str(path)
+
+
+def test_backend_must_implement_convert():
+    class Incomplete(PdfBackend):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete(0)
+
+
+def test_parallel_conversion_uses_all_slots(fake_pool, tmp_path):
+    fake_pool(size=2, delay=0.4)
+    docs = [_docx(tmp_path, "tcp"), _docx(tmp_path, "quiz")]
+    results, errors = [], []
+
+    def run(docx):
+        try:
+            results.append(convertidor_pdf.convertir_a_pdf(docx, timeout=5))
+        except Exception as e:  # pragma: no cover - se reporta abajo
+            errors.append(e)
+
+    started = time.time()
+    threads = [threading.Thread(target=run, args=(d,)) for d in docs]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    elapsed = time.time() - started
+
+    assert not errors
+    assert sorted(results) == sorted(os.path.splitext(d)[0] + ".pdf" for d in docs)
+    for pdf in results:
+        with open(pdf, "rb") as fh:
+            assert fh.read(5) == b"%PDF-"
+    # dos slots: las dos conversiones se solapan en vez de sumar 0.8s
+    assert elapsed < 0.75
+
+
+def test_conversion_timeout(fake_pool, tmp_path):
+    fake_pool(size=1, delay=2)
+    with pytest.raises(TimeoutError):
+        convertidor_pdf.convertir_a_pdf(_docx(tmp_path, "lento"), timeout=0.2)
+
+
+def test_waiting_for_a_busy_slot_times_out(fake_pool, tmp_path):
+    pool = fake_pool(size=1, delay=0.6)
+    busy = threading.Thread(target=pool.convert, args=(_docx(tmp_path, "a"), str(tmp_path / "a.pdf"), 5))
+    busy.start()
+    time.sleep(0.1)
+    with pytest.raises(TimeoutError, match="Sin conversor PDF libre"):
+        pool.convert(_docx(tmp_path, "b"), str(tmp_path / "b.pdf"), timeout=0.2)
+    busy.join()
+
+
+def test_failed_slot_is_restarted_on_next_use(tmp_path):
+    class Flaky(FakeBackend):
+        fail_next = True
+
+        def __init__(self, slot):
+            super().__init__(slot)
+            self.starts = self.stops = 0
+
+        def start(self):
+            self.starts += 1
+
+        def stop(self):
+            self.stops += 1
+
+        def convert(self, docx_path, pdf_path, timeout):
+            if Flaky.fail_next:
+                Flaky.fail_next = False
+                raise RuntimeError("LibreOffice se cayó")
+            super().convert(docx_path, pdf_path, timeout)
+
+    pool = ConverterPool(Flaky, size=1)
+    backend = pool._all[0]
+    with pytest.raises(RuntimeError):
+        pool.convert(_docx(tmp_path, "x"), str(tmp_path / "x.pdf"), timeout=5)
+    assert (backend.starts, backend.stops) == (1, 1)
+
+    pool.convert(_docx(tmp_path, "y"), str(tmp_path / "y.pdf"), timeout=5)
+    assert backend.starts == 2
+    assert os.path.exists(tmp_path / "y.pdf")
+
+    # un slot sano no se reinicia
+    pool.convert(_docx(tmp_path, "z"), str(tmp_path / "z.pdf"), timeout=5)
+    assert backend.starts == 2
+
+
+def test_shutdown_removes_slot_profiles():
+    pool = ConverterPool(SofficeBackend, size=2)
+    profiles = [b.profile for b in pool._all]
+    assert all(os.path.isdir(p) for p in profiles)
+    pool.shutdown()
+    assert not any(os.path.exists(p) for p in profiles)
@@ -0,0 +1,77 @@
+# tests/test_deadline.py
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+
+from helpers import deadline
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(deadline, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def test_outside_a_scope_defaults_are_kept():
+    assert deadline.current() is None
+    assert deadline.remaining() is None
+    assert deadline.max_time() is None
+    assert deadline.timeout(30) == 30
+    assert deadline.timeout(None) is None
+    deadline.check("lookup")
+
+
+def test_timeout_is_clamped_to_the_remaining_budget(clock):
+    with deadline.scope(100):
+        assert deadline.timeout(30) == 30
+        assert deadline.timeout(None) == 100
+        clock[0] += 80
+        assert deadline.timeout(30) == 20
+        assert deadline.max_time() == 20
+        clock[0] += 19.5
+        # menos de MIN_CALL_SECONDS: no vale la pena empezar la llamada
+        with pytest.raises(deadline.DeadlineExceeded) as exc:
+            deadline.timeout(30, "drive.upload")
+        assert exc.value.stage == "drive.upload"
+        assert exc.value.budget == 100
+        with pytest.raises(deadline.DeadlineExceeded):
+            deadline.check("email")
+        clock[0] += 1
+        assert deadline.remaining() == 0.0
+        assert deadline.current().expired()
+    assert deadline.current() is None
+    assert deadline.timeout(30) == 30
+
+
+def test_deadline_exceeded_is_a_timeout_error(clock):
+    with deadline.scope(0):
+        with pytest.raises(TimeoutError):
+            deadline.check("lookup")
+
+
+def test_nested_scope_never_extends_the_outer_one(clock):
+    with deadline.scope(100) as outer:
+        clock[0] += 70
+        with deadline.scope(600) as inner:
+            assert inner.budget == 30
+            assert deadline.remaining() == 30
+        with deadline.scope(10) as inner:
+            assert deadline.remaining() == 10
+        assert deadline.current() is outer
+        assert deadline.remaining() == 30
+
+
+def test_scope_reaches_threads_through_copy_context(clock):
+    seen = {}
+    with deadline.scope(100):
+        ctx = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            seen["copied"] = pool.submit(ctx.run, deadline.remaining).result()
+        plain = threading.Thread(target=lambda: seen.update(plain=deadline.remaining()))
+        plain.start()
+        plain.join()
+    assert seen == {"copied": 100, "plain": None}
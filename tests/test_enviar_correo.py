@@ -0,0 +1,63 @@
+# tests/test_enviar_correo.py
+import pytest
+
+from helpers import artifacts, enviar_correo
+
+
+class FakeSMTP:
+    sent = []
+
+    def __init__(self, host, port, timeout=None):
+        self.host, self.port = host, port
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def ehlo(self):
+        pass
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, msg):
+        FakeSMTP.sent.append(msg)
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    FakeSMTP.sent = []
+    monkeypatch.setattr(enviar_correo.smtplib, "SMTP", FakeSMTP)
+    for name, value in (("SMTP_HOST", "smtp.test"), ("SMTP_PORT", 587), ("SMTP_USER", "u"), ("SMTP_PASS", "p")):
+        monkeypatch.setattr(enviar_correo, name, value)
+    return FakeSMTP.sent
+
+
+def _attachments(msg):
+    return {part.get_filename(): part.get_payload(decode=True) for part in msg.iter_attachments()}
+
+
+def test_smtp_attaches_paths_and_in_memory_tuples(smtp, tmp_path):
+    txt = tmp_path / "ord1.txt"
+    txt.write_bytes(b"transcripcion")
+    pdf = artifacts.Artifact("RedaXion - N1.pdf", b"%PDF-1.4 tcp", str(tmp_path))
+
+    assert enviar_correo.enviar_correo_con_adjuntos(
+        "a@b.c", "Tu TCP", "<p>hola</p>", [str(txt), (pdf.filename, pdf.view())])
+
+    assert len(smtp) == 1
+    files = _attachments(smtp[0])
+    assert files == {"ord1.txt": b"transcripcion", "RedaXion - N1.pdf": b"%PDF-1.4 tcp"}
+
+
+def test_smtp_attaches_materialized_artifact_path(smtp, tmp_path):
+    docx = artifacts.Artifact("RedaQuiz - N1.docx", b"PK docx", str(tmp_path))
+
+    enviar_correo._send_via_smtp("a@b.c", "Quiz", "<p>quiz</p>", [docx.path()])
+
+    assert _attachments(smtp[0]) == {"RedaQuiz - N1.docx": b"PK docx"}
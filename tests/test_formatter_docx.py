@@ -0,0 +1,21 @@
+# tests/test_formatter_docx.py
+import pytest
+
+from helpers import formatter_docx
+
+
+@pytest.mark.parametrize("backend, words, incremental", [
+    ("auto", 500, False),
+    ("auto", 20000, True),
+    ("auto", None, True),
+    ("python-docx", 50000, False),
+    ("python-docx", None, False),
+    ("stream", 10, True),
+])
+def test_incremental_tcp_follows_backend_choice(monkeypatch, backend, words, incremental):
+    monkeypatch.setattr(formatter_docx, "DOCX_BACKEND", backend)
+    monkeypatch.setattr(formatter_docx, "DOCX_STREAM_MIN_WORDS", 20000)
+    tcp = formatter_docx.incremental_tcp("verde", "simple", words=words)
+    assert isinstance(tcp, formatter_docx.IncrementalTcp) is incremental
+    if words is not None:
+        assert (formatter_docx._pick_backend("w " * words, None) == "stream") is incremental
@@ -0,0 +1,12 @@
+# tests/test_gcs.py
+from helpers.gcs import _content_disposition
+
+
+def test_disposition_has_ascii_fallback_and_utf8_filename():
+    assert _content_disposition("RedaXion - Nº12.pdf") == (
+        "attachment; filename=\"RedaXion - No12.pdf\"; filename*=UTF-8''RedaXion%20-%20N%C2%BA12.pdf")
+
+
+def test_disposition_escapes_quotes_and_non_latin_names():
+    assert _content_disposition('a"b.docx') == "attachment; filename=\"a_b.docx\"; filename*=UTF-8''a%22b.docx"
+    assert _content_disposition("中文.pdf") == "attachment; filename=\"download.pdf\"; filename*=UTF-8''%E4%B8%AD%E6%96%87.pdf"
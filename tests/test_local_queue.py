@@ -0,0 +1,127 @@
+# tests/test_local_queue.py
+import threading
+from contextlib import closing
+from types import SimpleNamespace
+
+import pytest
+
+from helpers import local_queue
+from helpers.queue import retry_delay
+
+CALLS = []
+
+
+def _record(*args, **kwargs):
+    CALLS.append((args, kwargs))
+
+
+def _boom(order_id):
+    raise RuntimeError(f"orden {order_id} falló")
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(local_queue, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+@pytest.fixture
+def lq(tmp_path):
+    CALLS.clear()
+    return local_queue.LocalQueue(str(tmp_path / "jobs.sqlite3"))
+
+
+def _job(lq, job_id):
+    with closing(lq._connect()) as conn:
+        return dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def test_each_job_is_claimed_by_a_single_worker(lq):
+    ids = lq.enqueue_many(__name__ + "._record", [((i,), {}) for i in range(30)])
+    claimed, lock = [], threading.Lock()
+
+    def worker(owner):
+        while (job := lq.lease(owner)) is not None:
+            with lock:
+                claimed.append(job["id"])
+
+    threads = [threading.Thread(target=worker, args=(f"w{i}",)) for i in range(6)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert sorted(claimed) == ids
+    assert lq.stats() == {"leased": 30}
+
+
+def test_expired_lease_is_reclaimed_and_the_old_owner_loses_it(lq, clock):
+    job_id = lq.enqueue(__name__ + "._record", 1)
+    first = lq.lease("w1", visibility_timeout=60)
+    assert first["id"] == job_id and first["attempts"] == 1
+    assert lq.lease("w2") is None
+
+    clock[0] += 30
+    assert lq.extend_lease(job_id, "w1", visibility_timeout=60)
+    clock[0] += 59
+    assert lq.lease("w2") is None
+    clock[0] += 1  # w1 murió sin renovar: el lease vence
+    second = lq.lease("w2")
+    assert second["id"] == job_id and second["attempts"] == 2
+
+    assert not lq.extend_lease(job_id, "w1")
+    lq.complete(job_id, "w1")
+    assert _job(lq, job_id)["status"] == "leased"
+    lq.complete(job_id, "w2")
+    assert _job(lq, job_id)["status"] == "done"
+
+
+def test_raised_exception_backs_off_then_fails(lq, clock):
+    job_id = lq.enqueue(__name__ + "._boom", 7, max_attempts=2)
+    pool = local_queue.LocalWorkerPool(lq, size=1)
+
+    pool._run(lq.lease("w1"), "w1")
+    row = _job(lq, job_id)
+    assert row["status"] == "queued"
+    assert row["available_at"] == clock[0] + retry_delay(1)
+    assert "orden 7 falló" in row["last_error"]
+    assert row["lease_owner"] is None
+
+    clock[0] += retry_delay(1) - 1
+    assert lq.lease("w1") is None
+    clock[0] += 1
+    job = lq.lease("w1")
+    assert job["attempts"] == 2
+    pool._run(job, "w1")
+    row = _job(lq, job_id)
+    assert row["status"] == "failed"
+    assert row["finished_at"] == clock[0]
+    assert lq.lease("w1") is None
+
+
+def test_successful_job_runs_with_its_arguments(lq):
+    job_id = lq.enqueue(__name__ + "._record", "42", priority="express", canal="web")
+    local_queue.LocalWorkerPool(lq, size=1)._run(lq.lease("w1"), "w1")
+    assert CALLS == [(("42",), {"canal": "web"})]
+    assert _job(lq, job_id)["status"] == "done"
+
+
+def test_delay_hides_the_job_until_available_at(lq, clock):
+    later = lq.enqueue(__name__ + "._record", 1, delay=600)
+    assert lq.lease("w1") is None
+    now = lq.enqueue(__name__ + "._record", 2)
+    assert lq.lease("w1")["id"] == now
+    lq.complete(now, "w1")
+    clock[0] += 599
+    assert lq.lease("w1") is None
+    clock[0] += 1
+    assert lq.lease("w1")["id"] == later
+
+
+def test_priority_and_shortest_job_first(lq):
+    long_job = lq.enqueue(__name__ + "._record", 1, duration=3600)
+    retry = lq.enqueue(__name__ + "._record", 2, priority="retry")
+    short_job = lq.enqueue(__name__ + "._record", 3, duration=60)
+    express = lq.enqueue(__name__ + "._record", 4, priority="express", duration=7200)
+    order = [lq.lease("w1")["id"] for _ in range(4)]
+    assert order == [express, short_job, long_job, retry]
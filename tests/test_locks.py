@@ -0,0 +1,112 @@
+# tests/test_locks.py
+import threading
+import time
+
+import fakeredis
+import pytest
+
+from helpers import locks
+
+
+@pytest.fixture
+def redis_locks(monkeypatch):
+    conn = fakeredis.FakeStrictRedis(decode_responses=True)
+    monkeypatch.setattr(locks, "r", conn)
+    monkeypatch.setattr(locks, "_release_script", conn.register_script(locks._RELEASE_LUA))
+    monkeypatch.setattr(locks, "_renew_script", conn.register_script(locks._RENEW_LUA))
+    return conn
+
+
+@pytest.fixture
+def bypass(monkeypatch):
+    monkeypatch.setattr(locks, "r", None)
+    monkeypatch.setattr(locks, "_local_held", set())
+
+
+def test_release_only_deletes_our_own_token(redis_locks):
+    assert locks.acquire_lock("order:1", ttl=60, token="a")
+    assert not locks.acquire_lock("order:1", ttl=60, token="b")
+
+    locks.release_lock("order:1", token="b")
+    assert redis_locks.get("lock:order:1") == "a"
+    locks.release_lock("order:1", token="a")
+    assert redis_locks.get("lock:order:1") is None
+
+
+def test_renew_only_extends_our_own_lease(redis_locks):
+    locks.acquire_lock("order:1", ttl=5, token="a")
+    assert locks.renew_lock("order:1", "a", ttl=120)
+    assert redis_locks.ttl("lock:order:1") > 100
+    assert locks.renew_lock("order:1", "b", ttl=500) is False
+    assert redis_locks.ttl("lock:order:1") <= 120
+
+    redis_locks.delete("lock:order:1")  # venció
+    assert locks.renew_lock("order:1", "a") is False
+
+
+def test_redis_errors(redis_locks, monkeypatch):
+    def down(*args, **kwargs):
+        raise ConnectionError("redis caído")
+
+    monkeypatch.setattr(redis_locks, "set", down)
+    with pytest.raises(locks.LockError):
+        locks.acquire_lock("order:1", token="a")
+    monkeypatch.setattr(locks, "_renew_script", down)
+    assert locks.renew_lock("order:1", "a") is None
+
+
+def test_held_lock_is_exclusive_and_released(redis_locks):
+    with locks.held_lock("order:1") as lock:
+        assert lock is not None
+        assert redis_locks.get("lock:order:1") == lock.token
+        with locks.held_lock("order:1") as other:
+            assert other is None
+        with locks.held_lock("order:2") as other:
+            assert other is not None
+    assert redis_locks.get("lock:order:1") is None
+
+
+def test_held_lock_waits_for_a_short_handoff(redis_locks):
+    release = threading.Event()
+
+    def holder():
+        with locks.held_lock("order:1"):
+            release.wait(5)
+
+    th = threading.Thread(target=holder)
+    th.start()
+    time.sleep(0.1)
+    threading.Timer(0.3, release.set).start()
+    with locks.held_lock("order:1", wait=3) as lock:
+        assert lock is not None
+    th.join()
+
+
+def test_lease_lost_when_another_worker_takes_the_lock(redis_locks):
+    with locks.held_lock("order:1", lease=1) as lock:
+        lock.check("inicio")
+        # el lease venció y otro worker tomó la orden
+        redis_locks.set("lock:order:1", "otro-worker", ex=60)
+        assert lock.lost.wait(2)
+        with pytest.raises(locks.LockLost, match="antes de email"):
+            lock.check("email")
+    # al salir no se borra el lock del otro worker
+    assert redis_locks.get("lock:order:1") == "otro-worker"
+
+
+def test_transient_renew_errors_are_tolerated_until_the_lease_elapses(redis_locks, monkeypatch):
+    monkeypatch.setattr(locks, "renew_lock", lambda key, token, ttl=None: None)
+    with locks.held_lock("order:1", lease=1) as lock:
+        assert not lock.lost.wait(0.8)
+        assert lock.lost.wait(1.5)
+
+
+def test_bypass_mode_excludes_within_the_process(bypass):
+    assert locks.acquire_lock("order:1")  # sin Redis no bloquea
+    with locks.held_lock("order:1") as lock:
+        assert lock is not None
+        lock.check()
+        with locks.held_lock("order:1") as other:
+            assert other is None
+    with locks.held_lock("order:1") as again:
+        assert again is not None
@@ -0,0 +1,56 @@
+# tests/test_main_email.py
+import pytest
+
+import main
+from helpers import enviar_correo, gcs, progress
+
+
+@pytest.fixture
+def order(monkeypatch, tmp_path):
+    """
+    Orden completa con helpers externos reemplazados: transcripción, ChatGPT, quiz, Drive y Sheets.
+    """
+    monkeypatch.setattr(progress, "PROGRESS_DB_PATH", str(tmp_path / "progress.sqlite3"))
+    monkeypatch.setattr(main, "get_details_from_sheet_direct", lambda oid: {
+        "orden": oid, "email": "cliente@test.cl", "audio_url": "https://x/a.mp3", "color": "verde", "columnas": "simple"})
+    monkeypatch.setattr(main, "transcribir_audio", lambda url, **kw: {"text": "palabra " * 500})
+    monkeypatch.setattr(main, "procesar_txt_con_chatgpt_block",
+                        lambda text, **kw: "## Sección\n\nTexto **importante** del bloque.\n")
+    monkeypatch.setattr(main, "generar_quiz_from_text", lambda text, **kw: "1) ¿P?\nA) a\nB) b\nC) c\nD) d\nE) e")
+    monkeypatch.setattr(main, "subir_archivo_a_drive", None)
+    monkeypatch.setattr(main, "convertir_a_pdf", None)
+    monkeypatch.setattr(main, "enviar_correo_con_adjuntos", enviar_correo.enviar_correo_con_adjuntos)
+    return "ord-mail"
+
+
+def test_large_artifacts_are_emailed_as_signed_links(order, monkeypatch):
+    uploads, sent = [], {}
+
+    def upload_for_download(source, blob_name, filename, expiration, content_type):
+        uploads.append((blob_name, filename, bytes(source)))
+        return f"https://storage.test/{blob_name}?sig=1"
+
+    def send(to_emails, subject, html_body, attachments=None, from_email=None):
+        sent.update(to=to_emails, body=html_body, attachments=[enviar_correo._attachment_name(a) for a in attachments])
+        return True
+
+    monkeypatch.setenv("GCS_BUCKET", "entregas-test")
+    # el DOCX del TCP (plantilla con imágenes y fuentes) pesa cientos de KB: por sobre el umbral; el resto no
+    monkeypatch.setattr(enviar_correo, "EMAIL_LINK_THRESHOLD_BYTES", 100 * 1024)
+    monkeypatch.setattr(gcs, "upload_for_download", upload_for_download)
+    monkeypatch.setattr(enviar_correo, "_send_via_smtp", send)
+    monkeypatch.setattr(enviar_correo, "SMTP_HOST", "smtp.test")
+    monkeypatch.setattr(enviar_correo, "SMTP_PORT", 587)
+    monkeypatch.setattr(enviar_correo, "SMTP_USER", "u")
+    monkeypatch.setattr(enviar_correo, "SMTP_PASS", "p")
+
+    assert main.generate_and_deliver(order)
+
+    assert [(blob, filename) for blob, filename, _ in uploads] == [
+        (f"entregas/{order}/RedaXion - Nº{order}.docx", f"RedaXion - Nº{order}.docx")]
+    assert uploads[0][2][:2] == b"PK" and len(uploads[0][2]) > 100 * 1024
+
+    assert sent["to"] == "cliente@test.cl"
+    assert sorted(sent["attachments"]) == [
+        f"RedaQuiz - Nº{order}.docx", f"RedaQuiz - Nº{order}.pdf", f"RedaXion - Nº{order}.pdf"]
+    assert f"https://storage.test/entregas/{order}/RedaXion - Nº{order}.docx?sig=1" in sent["body"]
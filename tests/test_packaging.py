@@ -0,0 +1,49 @@
+# tests/test_packaging.py
+import io
+
+import pytest
+
+from helpers import packaging
+from helpers.formatter_docx import guardar_como_docx
+
+pytestmark = pytest.mark.skipif(packaging.ft_subset is None, reason="fontTools no instalado")
+
+
+def _docx(text):
+    buf = io.BytesIO()
+    guardar_como_docx(text, buf, color="verde", columnas="simple")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def subset_calls(monkeypatch):
+    calls = []
+    real = packaging._subset_font
+
+    def counting(raw, codepoints):
+        calls.append(codepoints)
+        return real(raw, codepoints)
+
+    monkeypatch.setattr(packaging, "_cache", {})
+    monkeypatch.setattr(packaging, "_subset_font", counting)
+    return calls
+
+
+def test_fonts_are_subset_once_for_the_base_repertoire(subset_calls):
+    packaging.optimize_docx(_docx("# Capítulo\n¿Qué es el ñandú? “Árbol” – fin…"))
+    first = len(subset_calls)
+    assert first and all(cps == packaging._BASE_CODEPOINTS for cps in subset_calls)
+
+    # otra orden en español: mismas fuentes de la plantilla, nada que re-subsetear
+    packaging.optimize_docx(_docx("Otro texto, con acentos: canción, pingüino, ¡listo!"))
+    assert len(subset_calls) == first
+
+
+def test_characters_outside_the_repertoire_get_their_own_subset(subset_calls):
+    packaging.optimize_docx(_docx("Texto base"))
+    first = len(subset_calls)
+
+    packaging.optimize_docx(_docx("Ángulos α y β con α ≤ β"))
+    extra = subset_calls[first:]
+    assert extra
+    assert all(cps > packaging._BASE_CODEPOINTS for cps in extra)
@@ -0,0 +1,129 @@
+# tests/test_pipeline.py
+import threading
+import time
+
+import pytest
+
+from helpers import deadline
+from helpers.pipeline import PipelineAborted, Stage, run_dag
+
+
+def _recorder():
+    order, lock = [], threading.Lock()
+
+    def stage(name, value=None, sleep=0.0, error=None):
+        def fn(deps):
+            if sleep:
+                time.sleep(sleep)
+            with lock:
+                order.append(name)
+            if error:
+                raise error
+            return value if value is not None else (name, dict(deps))
+        return fn
+
+    return order, stage
+
+
+def test_dependencies_run_first_and_receive_results():
+    order, stage = _recorder()
+    results = run_dag([
+        Stage("email", stage("email"), deps=("drive", "pdf")),
+        Stage("pdf", stage("pdf", value="tcp.pdf", sleep=0.05), deps=("docx",)),
+        Stage("docx", stage("docx", value="tcp.docx")),
+        Stage("drive", stage("drive", value="drive-id"), deps=("docx",)),
+    ])
+    assert order[0] == "docx" and order[-1] == "email"
+    assert {name: res["status"] for name, res in results.items()} == dict.fromkeys(order, "ok")
+    assert results["pdf"]["result"] == "tcp.pdf"
+    assert results["email"]["result"] == ("email", {"drive": "drive-id", "pdf": "tcp.pdf"})
+
+
+def test_independent_stages_run_in_parallel():
+    _, stage = _recorder()
+    started = time.monotonic()
+    run_dag([Stage(f"s{i}", stage(f"s{i}", sleep=0.2)) for i in range(4)], max_workers=4)
+    assert time.monotonic() - started < 0.6
+
+
+def test_failure_policies():
+    order, stage = _recorder()
+    results = run_dag([
+        Stage("drive", stage("drive", error=RuntimeError("drive caído")), on_failure="continue"),
+        Stage("pdf", stage("pdf", error=RuntimeError("soffice")), on_failure="skip"),
+        Stage("sheet", stage("sheet"), deps=("drive",)),
+        Stage("attach", stage("attach"), deps=("pdf",)),
+        Stage("email", stage("email"), deps=("attach",)),
+    ])
+    assert results["drive"]["status"] == "failed"
+    assert str(results["drive"]["error"]) == "drive caído"
+    assert results["sheet"]["status"] == "ok"
+    assert results["sheet"]["result"] == ("sheet", {"drive": None})
+    assert results["attach"]["status"] == "skipped"
+    assert results["email"]["status"] == "skipped"
+    assert "attach" not in order and "email" not in order
+
+
+def test_abort_stops_launching_new_stages():
+    order, stage = _recorder()
+    with pytest.raises(PipelineAborted) as exc:
+        run_dag([
+            Stage("docx", stage("docx", error=ValueError("plantilla")), on_failure="abort"),
+            Stage("pdf", stage("pdf"), deps=("docx",)),
+        ])
+    assert exc.value.stage == "docx"
+    assert isinstance(exc.value.error, ValueError)
+    assert exc.value.results["pdf"]["status"] == "skipped"
+    assert order == ["docx"]
+
+
+def test_timed_out_stage_does_not_block_the_dag_and_drains_later():
+    release = threading.Event()
+    drained = threading.Event()
+    _, stage = _recorder()
+    observed = []
+
+    def hung(deps):
+        release.wait(5)
+
+    started = time.monotonic()
+    results = run_dag([
+        Stage("drive", hung, timeout=0.2, on_failure="continue"),
+        Stage("sheet", stage("sheet"), deps=("drive",)),
+    ], observer=lambda name, seconds, status: observed.append((name, status)), on_drained=drained.set)
+    assert time.monotonic() - started < 1.0
+    assert results["drive"]["status"] == "timeout"
+    assert isinstance(results["drive"]["error"], TimeoutError)
+    assert results["sheet"]["status"] == "ok"
+    assert observed == [("drive", "timeout"), ("sheet", "ok")]
+    # el thread vencido sigue vivo: on_drained espera a que termine
+    assert not drained.is_set()
+    release.set()
+    assert drained.wait(2)
+
+
+def test_on_drained_runs_before_returning_without_timeouts():
+    drained = []
+    run_dag([Stage("docx", lambda deps: None)], on_drained=lambda: drained.append(True))
+    assert drained == [True]
+
+
+def test_stage_timeout_is_clamped_by_the_order_deadline():
+    with deadline.scope(0):
+        results = run_dag([
+            Stage("email", lambda deps: "enviado", timeout=60),
+            Stage("sheet", lambda deps: "ok", deps=("email",)),
+        ])
+    # sin plazo restante ninguna etapa llega a lanzarse
+    for name in ("email", "sheet"):
+        assert results[name]["status"] == "timeout"
+        assert isinstance(results[name]["error"], deadline.DeadlineExceeded)
+
+
+def test_invalid_graphs_are_rejected():
+    with pytest.raises(ValueError, match="no existe"):
+        run_dag([Stage("pdf", lambda deps: None, deps=("docx",))])
+    with pytest.raises(ValueError, match="Ciclo"):
+        run_dag([Stage("a", lambda deps: None, deps=("b",)), Stage("b", lambda deps: None, deps=("a",))])
+    with pytest.raises(ValueError, match="on_failure"):
+        Stage("a", lambda deps: None, on_failure="retry")
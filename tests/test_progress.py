@@ -0,0 +1,85 @@
+# tests/test_progress.py
+import threading
+
+import fakeredis
+import pytest
+
+from helpers import progress
+
+
+@pytest.fixture(params=["redis", "sqlite"])
+def backend(request, monkeypatch, tmp_path):
+    conn = fakeredis.FakeStrictRedis(decode_responses=True) if request.param == "redis" else None
+    monkeypatch.setattr(progress, "get_redis", lambda decode_responses=False: conn)
+    monkeypatch.setattr(progress, "PROGRESS_DB_PATH", str(tmp_path / "progress.sqlite3"))
+    monkeypatch.setattr(progress, "_db_ready", False)
+    return request.param
+
+
+def _first_attempt(order_id):
+    progress.set_stage(order_id, "lookup", state="processing", started_at=100.0, blocks_done=0,
+                       unset=progress.ATTEMPT_FIELDS)
+    progress.set_stage(order_id, "blocks", blocks_total=4, blocks_started_at=110.0)
+    progress.block_done(order_id)
+    progress.update(order_id, last_step="pdf_tcp:ok")
+    progress.set_stage(order_id, "delivery", delivery_started_at=150.0)
+    progress.update(order_id, state="error", finished_at=160.0, reason="drive caído", retry_at=220.0)
+
+
+def test_stages_and_counters(backend):
+    assert progress.get("1") is None
+    _first_attempt("1")
+    rec = progress.get("1")
+    assert rec["order_id"] == "1"
+    assert rec["stage"] == "delivery"
+    assert rec["state"] == "error"
+    assert rec["blocks_done"] == 1 and rec["blocks_total"] == 4
+    assert rec["last_step"] == "pdf_tcp:ok"
+    assert rec["finished_at"] == 160.0
+    assert rec["eta_seconds"] == 0.0
+
+
+def test_retry_resets_the_previous_attempt(backend):
+    _first_attempt("1")
+    # el reintento empieza igual que el primer intento (main.generate_and_deliver)
+    progress.set_stage("1", "lookup", state="processing", started_at=300.0, blocks_done=0,
+                       unset=progress.ATTEMPT_FIELDS)
+    rec = progress.get("1")
+    for field in progress.ATTEMPT_FIELDS:
+        assert field not in rec
+    assert rec["state"] == "processing" and rec["stage"] == "lookup"
+    assert rec["started_at"] == 300.0
+    assert rec["blocks_done"] == 0
+    # sin delivery_started_at ni bloques hechos todavía no hay ETA
+    assert rec["eta_seconds"] is None
+
+
+def test_eta_from_block_rate(backend, monkeypatch):
+    monkeypatch.setattr(progress.time, "time", lambda: 130.0)
+    progress.set_stage("1", "blocks", state="processing", blocks_done=0, blocks_total=4, blocks_started_at=110.0)
+    progress.block_done("1")
+    progress.block_done("1")
+    # 2 bloques en 20 s → 10 s por bloque × 2 pendientes + entrega
+    assert progress.get("1")["eta_seconds"] == 20.0 + progress.DELIVERY_ESTIMATE_SECONDS
+
+
+def test_concurrent_block_done_is_not_lost(backend):
+    progress.set_stage("1", "blocks", blocks_done=0, blocks_total=40)
+    threads = [threading.Thread(target=lambda: [progress.block_done("1") for _ in range(5)]) for _ in range(8)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert progress.get("1")["blocks_done"] == 40
+
+
+def test_write_errors_are_swallowed(monkeypatch):
+    conn = fakeredis.FakeStrictRedis(decode_responses=True)
+
+    def down():
+        raise ConnectionError("redis caído")
+
+    monkeypatch.setattr(conn, "pipeline", down)
+    monkeypatch.setattr(progress, "get_redis", lambda decode_responses=False: conn)
+    progress.update("1", state="processing")
+    progress.block_done("1")
@@ -0,0 +1,185 @@
+# tests/test_queue.py
+import json
+import threading
+import time
+from contextlib import closing
+
+import fakeredis
+import pytest
+from rq import SimpleWorker
+from rq.registry import ScheduledJobRegistry
+from rq.timeouts import TimerDeathPenalty
+
+import main
+from helpers import local_queue, progress
+from helpers import queue as job_queue
+
+
+class ThreadWorker(SimpleWorker):
+    # igual que worker.py: sin SIGALRM
+    death_penalty_class = TimerDeathPenalty
+
+
+def _boom(order_id, **kwargs):
+    raise RuntimeError(f"falló {order_id}")
+
+
+@pytest.fixture
+def redis_conn(monkeypatch, tmp_path):
+    conn = fakeredis.FakeStrictRedis()
+    monkeypatch.setattr(job_queue, "get_redis", lambda decode_responses=False: conn)
+    monkeypatch.setattr(progress, "PROGRESS_DB_PATH", str(tmp_path / "progress.sqlite3"))
+    monkeypatch.setattr(main, "generate_and_deliver", _boom)
+    return conn
+
+
+def test_retry_schedule_matches_local_backoff():
+    retry = job_queue._rq_retry()
+    assert retry.max == job_queue.MAX_ATTEMPTS - 1
+    assert retry.intervals == [job_queue.retry_delay(n) for n in range(1, job_queue.MAX_ATTEMPTS)]
+    assert retry.intervals[:2] == [job_queue.RETRY_BACKOFF, 2 * job_queue.RETRY_BACKOFF]
+
+
+def test_failed_rq_job_is_rescheduled_and_fed_back(redis_conn):
+    info = job_queue.enqueue_generate_and_deliver("ord-rq", priority="express")
+    q = job_queue.get_rq_queue("express")
+    ThreadWorker([q], connection=redis_conn).work(burst=True)
+
+    job = q.fetch_job(info["job_id"])
+    registry = ScheduledJobRegistry(queue=q)
+    assert job.get_status() == "scheduled"
+    assert job.retries_left == job_queue.MAX_ATTEMPTS - 2
+    assert registry.get_job_ids() == [job.id]
+    wait = registry.get_scheduled_time(job.id).timestamp() - time.time()
+    assert job_queue.RETRY_BACKOFF - 5 < wait <= job_queue.RETRY_BACKOFF + 1
+
+    # antes de tiempo no se mueve; vencido, feed_scheduled lo devuelve a la cola
+    assert job_queue.feed_scheduled([q.name]) == 0
+    redis_conn.zadd(registry.key, {job.id: 0})
+    assert job_queue.feed_scheduled([q.name]) == 1
+    assert q.job_ids == [job.id]
+    assert job_queue.feed_scheduled([q.name]) == 0
+
+
+def test_failed_rq_job_exhausts_retries(redis_conn):
+    info = job_queue.enqueue_generate_and_deliver("ord-rq", priority="express")
+    q = job_queue.get_rq_queue("express")
+    registry = ScheduledJobRegistry(queue=q)
+    for _ in range(job_queue.MAX_ATTEMPTS):
+        ThreadWorker([q], connection=redis_conn).work(burst=True)
+        if registry.get_job_ids():
+            redis_conn.zadd(registry.key, {info["job_id"]: 0})
+            job_queue.feed_scheduled([q.name])
+    assert q.fetch_job(info["job_id"]).get_status() == "failed"
+    assert q.count == 0
+
+
+def test_failed_local_job_is_requeued_with_backoff(tmp_path):
+    lq = local_queue.LocalQueue(str(tmp_path / "jobs.sqlite3"))
+    job_id = lq.enqueue("json.loads", "{")
+    pool = local_queue.LocalWorkerPool(lq, size=1)
+
+    pool._run(lq.lease("w1"), "w1")
+
+    assert lq.stats() == {"queued": 1}
+    assert lq.lease("w1") is None  # todavía en backoff
+    with closing(lq._connect()) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    assert row["attempts"] == 1 and "JSONDecodeError" in row["last_error"]
+    assert row["available_at"] - time.time() == pytest.approx(job_queue.retry_delay(1), abs=5)
+
+
+@pytest.fixture
+def sjf(redis_conn):
+    def add(order_id, duration, enqueued_at):
+        member = json.dumps({"order_id": order_id, "trace_context": {}, "duration": duration}, sort_keys=True)
+        redis_conn.zadd(job_queue.SJF_KEY, {member: job_queue.sjf_score(duration, enqueued_at)})
+    return add
+
+
+def _fed_orders(q):
+    return [job.args[0] for job in q.jobs]
+
+
+def test_sjf_feeds_shortest_first_with_aging(sjf, monkeypatch):
+    monkeypatch.setattr(job_queue, "SJF_AGING", 4)
+    t0 = 1_700_000_000
+    sjf("largo-viejo", 1800, t0)         # 1800 + 4·t0
+    sjf("corto-nuevo", 100, t0 + 500)    # 100 + 4·(t0+500) = 2100 + 4·t0: el largo esperó bastante
+    sjf("corto", 60, t0 + 100)           # 460 + 4·t0
+    sjf("sin-duracion", None, t0)        # SJF_DEFAULT_DURATION = 1800: empata con largo-viejo (desempata el miembro)
+
+    q = job_queue.get_rq_queue("standard")
+    while job_queue.feed_sjf(max_ready=10):
+        pass
+    assert _fed_orders(q) == ["corto", "largo-viejo", "sin-duracion", "corto-nuevo"]
+
+
+def test_standard_orders_wait_in_the_sjf_set(redis_conn):
+    info = job_queue.enqueue_generate_and_deliver("ord-std", priority="standard", duration=300)
+    assert info["sjf"] and job_queue.sjf_pending() == 1
+    assert job_queue.get_rq_queue("standard").count == 0
+
+
+def test_feed_respects_max_ready_including_claims_in_flight(sjf):
+    for i in range(3):
+        sjf(f"o{i}", 60 * (i + 1), 0)
+    q = job_queue.get_rq_queue("standard")
+    assert job_queue.feed_sjf(max_ready=1) == 1
+    assert job_queue.feed_sjf(max_ready=1) == 0
+    # un reclamo a medio camino (otro worker) también ocupa el cupo
+    assert job_queue._claim(q, job_queue.SJF_KEY, 2, 1)
+    assert job_queue.feed_sjf(max_ready=2) == 0
+    assert _fed_orders(q) == ["o0"]
+
+
+def test_claim_lost_between_phases_is_recovered_once(sjf, monkeypatch):
+    sjf("o1", 60, 0)
+    q = job_queue.get_rq_queue("standard")
+    # el worker reclamó la orden y murió antes de encolarla
+    [(member, score)] = job_queue._claim(q, job_queue.SJF_KEY, 1, 1)
+    assert job_queue.sjf_pending() == 0
+    assert job_queue.feed_sjf(max_ready=5) == 0
+
+    monkeypatch.setattr(job_queue, "FEED_CLAIM_TIMEOUT", -1)  # el reclamo ya venció
+    assert job_queue.feed_sjf(max_ready=5) == 1
+    assert job_queue.feed_sjf(max_ready=5) == 0
+    assert _fed_orders(q) == ["o1"]
+    assert not q.connection.exists(*job_queue._claims_keys(job_queue.SJF_KEY))
+
+
+def test_failed_enqueue_returns_the_order_with_its_score(sjf, monkeypatch):
+    from rq import Queue
+    sjf("o1", 60, 10)
+
+    def broken(self, *args, **kwargs):
+        raise ConnectionError("redis")
+
+    monkeypatch.setattr(Queue, "enqueue_call", broken)
+    with pytest.raises(ConnectionError):
+        job_queue.feed_sjf()
+    q = job_queue.get_rq_queue("standard")
+    assert q.connection.zrange(job_queue.SJF_KEY, 0, -1, withscores=True)[0][1] == job_queue.sjf_score(60, 10)
+    assert not q.connection.exists(*job_queue._claims_keys(job_queue.SJF_KEY))
+
+
+def test_concurrent_feeders_move_each_order_exactly_once(sjf, redis_conn):
+    for i in range(40):
+        sjf(f"o{i}", i, 0)
+    now = time.time()
+    for i in range(10):
+        member = json.dumps({"order_id": f"d{i}", "trace_context": {}, "reason": "x"}, sort_keys=True)
+        redis_conn.zadd(job_queue.DEFERRED_KEY, {member: now - 1 if i < 6 else now + 3600})
+
+    def feeder():
+        while job_queue.feed_sjf(max_ready=100) or job_queue.feed_deferred(limit=2):
+            pass
+
+    threads = [threading.Thread(target=feeder) for _ in range(6)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert sorted(_fed_orders(job_queue.get_rq_queue("standard"))) == sorted(f"o{i}" for i in range(40))
+    assert sorted(_fed_orders(job_queue.get_rq_queue("retry"))) == [f"d{i}" for i in range(6)]
+    assert redis_conn.zcard(job_queue.DEFERRED_KEY) == 4
@@ -0,0 +1,100 @@
+# tests/test_subir_archivo.py
+import json
+
+import pytest
+
+from helpers import subir_archivo
+
+SESSION_URL = "https://upload.test/session/1"
+
+
+class Response:
+    def __init__(self, status_code, headers=None, body=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise RuntimeError(f"HTTP {self.status_code}")
+
+
+class FakeDrive:
+    """
+    Sesión resumable de Drive: guarda lo recibido y responde 308 hasta completar el archivo.
+    """
+
+    def __init__(self, fail_puts=()):
+        self.requests = []
+        self.received = b""
+        self.fail_puts = set(fail_puts)
+
+    def post(self, url, params=None, data=None, headers=None, timeout=None):
+        self.requests.append(("POST", url, params, headers, json.loads(data)))
+        return Response(200, {"Location": SESSION_URL})
+
+    def put(self, url, data=None, headers=None, timeout=None):
+        assert url == SESSION_URL
+        rng = headers["Content-Range"]
+        self.requests.append(("PUT", rng, len(data or b"")))
+        total = int(rng.rsplit("/", 1)[1])
+        if data is not None:
+            if len(self.requests) in self.fail_puts:
+                return Response(503)
+            start = int(rng.split()[1].split("-")[0])
+            assert start == len(self.received), "chunk fuera de orden"
+            self.received += data
+        if len(self.received) == total:
+            return Response(200, body={"id": "drive-file-1"})
+        return Response(308, {"Range": f"bytes=0-{len(self.received) - 1}"} if self.received else {})
+
+
+@pytest.fixture
+def drive(monkeypatch):
+    def build(**kw):
+        fake = FakeDrive(**kw)
+        monkeypatch.setattr(subir_archivo, "DRIVE_FOLDER_ID", "folder-1")
+        monkeypatch.setattr(subir_archivo, "DRIVE_CHUNK_SIZE", 256 * 1024)
+        monkeypatch.setattr(subir_archivo, "_get_session", lambda: fake)
+        return fake
+    return build
+
+
+def test_resumable_upload_in_chunks(drive):
+    fake = drive()
+    data = bytes(range(256)) * 2400  # ~600 KB: tres chunks de 256 KiB
+
+    assert subir_archivo.subir_archivo_a_drive(data, "RedaXion - Nº7.docx", "7") == "drive-file-1"
+
+    method, url, params, headers, metadata = fake.requests[0]
+    assert (method, url, params["uploadType"]) == ("POST", subir_archivo.UPLOAD_URL, "resumable")
+    assert headers["X-Upload-Content-Length"] == str(len(data))
+    assert headers["X-Upload-Content-Type"].endswith("wordprocessingml.document")
+    assert metadata == {"name": "RedaXion - Nº7.docx", "parents": ["folder-1"], "appProperties": {"order_id": "7"}}
+    assert fake.requests[1:] == [
+        ("PUT", f"bytes 0-262143/{len(data)}", 262144),
+        ("PUT", f"bytes 262144-524287/{len(data)}", 262144),
+        ("PUT", f"bytes 524288-{len(data) - 1}/{len(data)}", len(data) - 524288),
+    ]
+    assert fake.received == data
+
+
+def test_failed_chunk_resumes_from_what_drive_received(drive):
+    fake = drive(fail_puts={3})  # el segundo chunk responde 503
+    data = b"x" * (600 * 1024)
+
+    assert subir_archivo.subir_archivo_a_drive(data, "quiz.pdf") == "drive-file-1"
+
+    puts = [r[1] for r in fake.requests if r[0] == "PUT"]
+    assert puts[1:4] == [f"bytes 262144-524287/{len(data)}", f"bytes */{len(data)}", f"bytes 262144-524287/{len(data)}"]
+    assert fake.received == data
+
+
+def test_gives_up_after_repeated_failures(drive, monkeypatch):
+    monkeypatch.setattr(subir_archivo, "DRIVE_CHUNK_RETRIES", 1)
+    drive(fail_puts=set(range(2, 20)))
+    with pytest.raises(RuntimeError, match="503"):
+        subir_archivo.subir_archivo_a_drive(b"x" * 1000, "a.txt")
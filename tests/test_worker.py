@@ -0,0 +1,19 @@
+# tests/test_worker.py
+import pytest
+
+import worker
+
+
+@pytest.mark.parametrize("queues, local", [
+    (["reda-speculative"], False),
+    (["reda-blocks", "reda-express", "reda", "reda-retry"], True),
+    (["reda-retry"], True),
+])
+def test_without_redis_only_order_queues_use_the_local_queue(monkeypatch, queues, local):
+    monkeypatch.setattr(worker, "REDIS_URL", None)
+    calls = []
+    monkeypatch.setattr(worker, "run_local", lambda size: calls.append(("local", size)) or 0)
+    monkeypatch.setattr(worker, "run_idle", lambda names: calls.append(("idle", names)) or 0)
+
+    assert worker.run(1, 4, queues) == 0
+    assert calls == ([("local", 4)] if local else [("idle", queues)])
@@ -0,0 +1,354 @@
+# worker.py - proceso worker dedicado de RedaXion (Procfile: worker)
+"""
+Worker de background con concurrencia configurable procesos × threads.
+
+- Pre-importa main y los helpers en el proceso maestro; los hijos se crean con fork y
+  comparten ese código ya cargado (arranque rápido, memoria copy-on-write).
+- Cada proceso hijo corre M threads; cada thread toma jobs RQ de las colas configuradas
+  y los ejecuta en el mismo thread (SimpleWorker + TimerDeathPenalty para el timeout del job).
+- Antes de pedir trabajo, cada thread libre pasa a la cola standard la orden más corta del
+  sorted set SJF (helpers.queue.feed_sjf) y a reda-retry las órdenes diferidas por un
+  circuit breaker cuyo reintento venció (helpers.queue.feed_deferred). También devuelve a su cola los
+  reintentos RQ (Retry con backoff) que ya cumplieron su espera (helpers.queue.feed_scheduled).
+- SIGTERM/SIGINT: apagado ordenado; cada thread termina el job en curso y sale. Pasado
+  WORKER_SHUTDOWN_GRACE segundos, los hijos que sigan vivos se matan.
+- Sin REDIS_URL: consume la cola local SQLite (helpers/local_queue.py) con un pool de
+  processes × threads workers en este proceso (la base debe estar en disco compartido con el web).
+  Si --queues no incluye ninguna cola de órdenes (solo reda-speculative, que requiere Redis), el
+  proceso queda en espera sin consumir nada.
+- Salud: el maestro escribe WORKER_HEALTH_FILE (JSON) con el estado de cada hijo;
+  `python worker.py --health` sale con 0 si el worker está sano, 1 si no.
+
+Uso:
+    python worker.py --processes 2 --threads 3 --queues reda-blocks,reda-express,reda,reda-retry
+    python worker.py --processes 1 --threads 4 --queues reda-speculative   # SPECULATIVE_TRANSCRIPTION=1
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import threading
+import traceback
+import multiprocessing
+
+REDIS_URL = os.getenv("REDIS_URL")
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "1"))
+WORKER_THREADS = int(os.getenv("WORKER_THREADS", "2"))
+WORKER_QUEUES = os.getenv("WORKER_QUEUES", "reda-blocks,reda-express,reda,reda-retry")
+WORKER_HEALTH_FILE = os.getenv("WORKER_HEALTH_FILE", "/tmp/redaxion_worker_health.json")
+WORKER_SHUTDOWN_GRACE = int(os.getenv("WORKER_SHUTDOWN_GRACE", "120"))
+HEALTH_INTERVAL = 10
+DEQUEUE_TIMEOUT = 5
+
+
+def preload():
+    """
+    Importa main y helpers antes del fork para que cada hijo arranque sin costo de import.
+    """
+    import main  # noqa: F401
+    from helpers import (  # noqa: F401
+        assemblyai, audio_meta, checkpoints, deadline, enviar_correo, formatter_docx, gcs, generar_quiz, locks,
+        local_queue, metrics, openai_client, pipeline, process_txt, progress, queue, redis_conn, sheets,
+        artifacts, circuit, convertidor_pdf, formatter_pdf, images, packaging, speculative, tracing,
+    )
+    # plantillas DOCX parseadas una vez en el maestro; los hijos las heredan con el fork
+    try:
+        templates = formatter_docx.warm_templates()
+    except Exception as e:
+        templates = 0
+        print(f"[WORKER][WARN] No se pudieron precargar las plantillas DOCX: {e}")
+    # media y fuentes de las plantillas ya optimizadas (helpers/packaging.py): la primera orden no las paga
+    try:
+        packaging.warm()
+    except Exception as e:
+        print(f"[WORKER][WARN] No se pudo precalentar el empaquetado: {e}")
+    print(f"[WORKER] main, helpers y {templates} plantillas DOCX pre-cargados (pid {os.getpid()})")
+
+
+class _Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.busy = 0
+        self.jobs_ok = 0
+        self.jobs_failed = 0
+
+    def snapshot(self):
+        with self.lock:
+            return {"busy": self.busy, "jobs_ok": self.jobs_ok, "jobs_failed": self.jobs_failed}
+
+
+def _rq_thread_loop(proc_idx: int, thread_idx: int, queue_names, stop: threading.Event, stats: _Stats):
+    """
+    Loop de un thread: toma un job a la vez de las colas RQ y lo ejecuta en este thread.
+    """
+    from rq import Queue, SimpleWorker
+    from rq.timeouts import TimerDeathPenalty
+    from helpers.redis_conn import get_redis
+    from helpers.queue import QUEUE_BY_PRIORITY, feed_deferred, feed_scheduled, feed_sjf
+
+    class ThreadWorker(SimpleWorker):
+        # UnixSignalDeathPenalty (SIGALRM) solo funciona en el main thread
+        death_penalty_class = TimerDeathPenalty
+
+    conn = get_redis()
+    queues = [Queue(name, connection=conn) for name in queue_names]
+    name = f"{socket.gethostname()}.{os.getpid()}.{thread_idx}"
+    worker = ThreadWorker(queues, connection=conn, name=name)
+    worker.register_birth()
+    print(f"[WORKER] thread {proc_idx}.{thread_idx} escuchando {','.join(queue_names)}")
+    feeds_standard = QUEUE_BY_PRIORITY["standard"] in queue_names
+    feeds_retry = QUEUE_BY_PRIORITY["retry"] in queue_names
+    try:
+        while not stop.is_set():
+            try:
+                if feeds_standard:
+                    feed_sjf()
+                if feeds_retry:
+                    feed_deferred()
+                feed_scheduled(queue_names)
+                result = worker.dequeue_job_and_maintain_ttl(timeout=DEQUEUE_TIMEOUT, max_idle_time=DEQUEUE_TIMEOUT)
+            except Exception as e:
+                print(f"[WORKER][WARN] dequeue falló en {name}: {e}")
+                stop.wait(DEQUEUE_TIMEOUT)
+                continue
+            if result is None:
+                continue
+            job, queue = result
+            with stats.lock:
+                stats.busy += 1
+            try:
+                worker.execute_job(job, queue)
+                ok = job.get_status(refresh=True) == "finished"
+            except Exception:
+                traceback.print_exc()
+                ok = False
+            finally:
+                with stats.lock:
+                    stats.busy -= 1
+                    if ok:
+                        stats.jobs_ok += 1
+                    else:
+                        stats.jobs_failed += 1
+    finally:
+        try:
+            worker.register_death()
+        except Exception:
+            pass
+        print(f"[WORKER] thread {proc_idx}.{thread_idx} detenido")
+
+
+def _child_health_path(idx: int) -> str:
+    return f"{WORKER_HEALTH_FILE}.{idx}"
+
+
+def _write_json(path: str, data: dict):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8") as fh:
+        json.dump(data, fh)
+    os.replace(tmp, path)
+
+
+def child_main(idx: int, threads: int, queue_names):
+    """
+    Proceso hijo: M threads de jobs + heartbeat de salud.
+    """
+    stop = threading.Event()
+
+    def _on_signal(signum, frame):
+        print(f"[WORKER] proceso {idx} recibió señal {signum}: apagado ordenado")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
+    # grupo propio y estable en el Pushgateway (host + índice del hijo, no el pid)
+    from helpers import convertidor_pdf, metrics
+    metrics.set_instance_slot(idx)
+
+    stats = _Stats()
+    pool = [
+        threading.Thread(target=_rq_thread_loop, args=(idx, t, queue_names, stop, stats),
+                         name=f"worker-{idx}-{t}", daemon=True)
+        for t in range(threads)
+    ]
+    for th in pool:
+        th.start()
+
+    while any(th.is_alive() for th in pool):
+        try:
+            _write_json(_child_health_path(idx), {
+                "idx": idx, "pid": os.getpid(), "threads": threads,
+                "threads_alive": sum(th.is_alive() for th in pool),
+                "stopping": stop.is_set(), "last_beat": time.time(), **stats.snapshot(),
+            })
+        except Exception:
+            traceback.print_exc()
+        for th in pool:
+            th.join(timeout=HEALTH_INTERVAL / max(1, len(pool)))
+    metrics.delete_metrics()
+    convertidor_pdf.shutdown()
+    print(f"[WORKER] proceso {idx} terminado")
+
+
+def _start_child(ctx, idx: int, threads: int, queue_names):
+    p = ctx.Process(target=child_main, args=(idx, threads, queue_names), name=f"redaxion-worker-{idx}")
+    p.start()
+    print(f"[WORKER] proceso {idx} iniciado (pid {p.pid}, {threads} threads)")
+    return p
+
+
+def _read_child_health(idx: int):
+    try:
+        with open(_child_health_path(idx), "r", encoding="utf-8") as fh:
+            return json.load(fh)
+    except Exception:
+        return None
+
+
+def run_local(size: int):
+    """
+    Modo sin Redis: pool fijo sobre la cola local SQLite hasta recibir SIGTERM/SIGINT.
+    """
+    from helpers import local_queue
+
+    preload()
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda s, f: stopping.set())
+    signal.signal(signal.SIGINT, lambda s, f: stopping.set())
+
+    started_at = time.time()
+    local_queue.start_pool(size=size)
+    print(f"[WORKER] modo cola local ({local_queue.LOCAL_QUEUE_PATH}) con {size} workers")
+    while not stopping.is_set():
+        try:
+            _write_json(WORKER_HEALTH_FILE, {
+                "pid": os.getpid(), "host": socket.gethostname(), "mode": "local",
+                "started_at": started_at, "updated_at": time.time(), "ok": True,
+                "jobs": local_queue.get_queue().stats(),
+            })
+        except Exception:
+            traceback.print_exc()
+        stopping.wait(HEALTH_INTERVAL)
+
+    print("[WORKER] deteniendo pool local (esperando jobs en curso)")
+    local_queue.stop_pool(timeout=WORKER_SHUTDOWN_GRACE)
+    try:
+        os.remove(WORKER_HEALTH_FILE)
+    except OSError:
+        pass
+    print("[WORKER] apagado completo")
+    return 0
+
+
+def _local_queue_serves(queue_names) -> bool:
+    """
+    La cola local reemplaza a las colas de órdenes (QUEUES_IN_ORDER); reda-speculative y otras solo existen en RQ.
+    """
+    from helpers.queue import QUEUES_IN_ORDER
+    return any(name in QUEUES_IN_ORDER for name in queue_names)
+
+
+def run_idle(queue_names):
+    """
+    Sin Redis y con --queues solo de colas RQ (p. ej. el proceso speculative): no hay nada que consumir.
+    Queda esperando SIGTERM en vez de salir, para que el supervisor no lo reinicie en loop.
+    """
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda s, f: stopping.set())
+    signal.signal(signal.SIGINT, lambda s, f: stopping.set())
+    print(f"[WORKER] sin REDIS_URL no hay jobs para {','.join(queue_names)}; en espera sin consumir la cola local")
+    stopping.wait()
+    return 0
+
+
+def run(processes: int, threads: int, queue_names):
+    if not REDIS_URL:
+        if not _local_queue_serves(queue_names):
+            return run_idle(queue_names)
+        return run_local(processes * threads)
+
+    preload()
+    ctx = multiprocessing.get_context("fork")
+    stopping = threading.Event()
+
+    def _on_signal(signum, frame):
+        print(f"[WORKER] maestro recibió señal {signum}: deteniendo hijos")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, _on_signal)
+    signal.signal(signal.SIGINT, _on_signal)
+
+    started_at = time.time()
+    children = {idx: _start_child(ctx, idx, threads, queue_names) for idx in range(processes)}
+
+    while not stopping.is_set():
+        for idx, p in list(children.items()):
+            if not p.is_alive():
+                print(f"[WORKER][WARN] proceso {idx} (pid {p.pid}) murió con código {p.exitcode}; reiniciando")
+                children[idx] = _start_child(ctx, idx, threads, queue_names)
+
+        report = []
+        for idx, p in children.items():
+            beat = _read_child_health(idx) or {}
+            report.append({"idx": idx, "pid": p.pid, "alive": p.is_alive(), **beat})
+        healthy = all(
+            r["alive"] and r.get("last_beat", 0) > time.time() - 3 * HEALTH_INTERVAL for r in report
+        )
+        try:
+            _write_json(WORKER_HEALTH_FILE, {
+                "pid": os.getpid(), "host": socket.gethostname(), "queues": list(queue_names),
+                "started_at": started_at, "updated_at": time.time(), "ok": healthy, "processes": report,
+            })
+        except Exception:
+            traceback.print_exc()
+        stopping.wait(HEALTH_INTERVAL)
+
+    # Apagado ordenado: SIGTERM a los hijos, esperar la gracia, luego matar
+    for p in children.values():
+        if p.is_alive():
+            p.terminate()
+    deadline = time.time() + WORKER_SHUTDOWN_GRACE
+    for p in children.values():
+        p.join(timeout=max(0, deadline - time.time()))
+    for idx, p in children.items():
+        if p.is_alive():
+            print(f"[WORKER][WARN] proceso {idx} no terminó en {WORKER_SHUTDOWN_GRACE}s; kill")
+            p.kill()
+            p.join()
+    try:
+        os.remove(WORKER_HEALTH_FILE)
+    except OSError:
+        pass
+    print("[WORKER] apagado completo")
+    return 0
+
+
+def check_health() -> int:
+    """
+    Lee WORKER_HEALTH_FILE y devuelve 0 si el worker está sano (para healthchecks/cron).
+    """
+    try:
+        with open(WORKER_HEALTH_FILE, "r", encoding="utf-8") as fh:
+            data = json.load(fh)
+    except Exception as e:
+        print(json.dumps({"ok": False, "error": f"sin archivo de salud: {e}"}))
+        return 1
+    fresh = data.get("updated_at", 0) > time.time() - 3 * HEALTH_INTERVAL
+    ok = bool(data.get("ok")) and fresh
+    print(json.dumps({**data, "ok": ok, "fresh": fresh}))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Worker RedaXion (procesos × threads)")
+    parser.add_argument("--processes", type=int, default=WORKER_PROCESSES, help="procesos hijos (fork)")
+    parser.add_argument("--threads", type=int, default=WORKER_THREADS, help="jobs concurrentes por proceso")
+    parser.add_argument("--queues", default=WORKER_QUEUES, help="colas RQ separadas por coma, en orden de prioridad")
+    parser.add_argument("--health", action="store_true", help="reporta la salud del worker en ejecución y sale")
+    args = parser.parse_args()
+
+    if args.health:
+        sys.exit(check_health())
+    sys.exit(run(max(1, args.processes), max(1, args.threads), [q.strip() for q in args.queues.split(",") if q.strip()]))